@@ -58,8 +58,13 @@ class AbstractParser(ABC):
         """
         pass
 
+    def get_history_capacity(self) -> int:
+        """
+        Return how many parsed records are kept for /data/<parsername>/history.
+        Override this for parsers that send faster or slower than usual.
+        """
+        return 1000
 
-    
     def can_parse(self, data: bytes) -> bool:
         """
         Determine if the parser can handle the given data.
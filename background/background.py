@@ -1,16 +1,74 @@
-from queue import Queue
+import logging
+import os
+from queue import Queue, Empty
 import threading
+import time
+from types import MappingProxyType
 
+from background.broadcaster import Broadcaster
+from background.historybuffer import HistoryBuffer
+from background.latency import LatencyStats
+from background.logrotation import RotatingLogWriter, SegmentCompressor
+from background.logsink import LogSink, ProcessedLogWriter, scan_processed_log
 from background.parsermanager import ParserManager
+from background.parsepool import ParsePool
+from background.telemetryfeed import TelemetryFeed
+from lib.rawlog import RawLogWriter, scan_raw_log
 import shared_data
+from shared_data import DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
 
 class Background:
     """
     Background processing tasks.
     """
-    def __init__(self, data_queue: Queue):
+    def __init__(self, data_queue: Queue, get_timeout: float = 0.5, log_queue_size: int = 8192,
+                 log_policy: str = "drop", log_flush_bytes: int = 1 << 18, log_flush_interval: float = 1.0,
+                 log_rotate_bytes: int = 64 << 20, log_rotate_seconds: float = 3600, log_compression: str = "gzip",
+                 parse_workers: int = 0):
+        """
+        get_timeout is how long the worker blocks on an empty queue before it waits again.
+        The log_* options are passed to each LogSink (see background/logsink.py).
+        Both logs are split into segments of log_rotate_bytes or log_rotate_seconds,
+        and finished segments are compressed with log_compression (see background/logrotation.py).
+        With parse_workers > 0, frames are parsed by that many worker processes (see background/parsepool.py)
+        instead of on the thread that calls process_batch().
+        """
         self.data_queue = data_queue
+        self.get_timeout = get_timeout
+        self.log_sink_options = {
+            "capacity": log_queue_size,
+            "policy": log_policy,
+            "flush_bytes": log_flush_bytes,
+            "flush_interval": log_flush_interval,
+        }
+        self.log_rotation_options = {
+            "max_bytes": log_rotate_bytes,
+            "max_seconds": log_rotate_seconds,
+        }
+        self.compressor = SegmentCompressor(log_compression)
+        self.log_sinks = {}
         self.parser_manager = ParserManager()
+        self.history = {parser.get_name(): HistoryBuffer(parser.get_keys() + ["port"], parser.get_history_capacity())
+                        for parser in self.parser_manager.parsers}
+        self.broadcaster = Broadcaster()
+        self.telemetry_feed = TelemetryFeed(self.get_parser_names())
+        self.parse_workers = parse_workers
+        self.parse_pool = None
+        self.processed_frame_count = 0
+        # Frames of each parser, and frames no parser accepted, counted when they are published
+        self.parsed_frame_counts = dict.fromkeys(self.get_parser_names(), 0)
+        self.unparsed_frame_count = 0
+        self._stop_requested = threading.Event()
+        self._shutdown_requested = threading.Event()
+        self._stopped = threading.Event()
+        # queue_wait: from the received time of the newest frame of a batch until the worker takes the batch
+        # parse:      parsing the frames of one batch on this thread (not recorded with parse workers)
+        # publish:    logging, history and snapshot update of one parsed batch
+        # process:    process_batch() of one batch (only handing it over, with parse workers)
+        # end_to_end: from the received time of the oldest frame of a batch until its data is published
+        self.latency = {stage: LatencyStats() for stage in ("queue_wait", "parse", "publish", "process", "end_to_end")}
 
     def get_parser_names(self) -> list[str]:
         """
@@ -24,41 +82,194 @@ class Background:
         """
         return self.parser_manager.get_parser_information(parsername)
 
+    def get_history(self, parsername: str, since: int = None, limit: int = None) -> dict[str, list] | None:
+        """
+        Returns the recent parsed data of a parser as {key: list of values}, oldest first,
+        or None if there is no such parser. See HistoryBuffer.query() for since and limit.
+        """
+        history = self.history.get(parsername)
+        if history is None:
+            return None
+        return history.query(since, limit)
+
+    def get_log_stats(self) -> dict:
+        """
+        Returns counters of the log sinks, e.g. queue depth, bytes written and flush latency.
+        """
+        return {name: sink.get_stats() for name, sink in self.log_sinks.items()}
+
+    def get_latency_stats(self) -> dict:
+        """
+        Returns the latency of each stage of the pipeline, see LatencyStats.get_stats().
+        """
+        return {stage: stats.get_stats() for stage, stats in self.latency.items()}
+
+    def _open_raw_log_sink(self, port_name: str) -> LogSink:
+        """
+        Opens the raw log of one serial port. The default port writes to shared_data.log_raw_file_path,
+        and other ports to the same path with "-{port name}" added, e.g. mainlog-radio.bin.
+        """
+        if port_name == DEFAULT_PORT:
+            sink_name = "raw"
+            path = shared_data.log_raw_file_path
+        else:
+            sink_name = f"raw-{port_name}"
+            stem, extension = os.path.splitext(shared_data.log_raw_file_path)
+            path = f"{stem}-{port_name}{extension}"
+        raw_writer = RotatingLogWriter(path, lambda segment_path: RawLogWriter(segment_path, buffering=1 << 20),
+                                       lambda frame, received_time: received_time,
+                                       compressor=self.compressor, scan_segment=scan_raw_log, **self.log_rotation_options)
+        sink = LogSink(sink_name, raw_writer, **self.log_sink_options)
+        sink.start()
+        # Replaced, not modified, so that get_log_stats() can iterate it from other threads
+        self.log_sinks = {**self.log_sinks, sink_name: sink}
+        return sink
+
+    def open(self):
+        """
+        Opens the log sinks. Call this before process_batch().
+        """
+        processed_writer = RotatingLogWriter(shared_data.log_processed_file_path, ProcessedLogWriter,
+                                             lambda parser_name, parsed_data: parsed_data["received_time"],
+                                             compressor=self.compressor, scan_segment=scan_processed_log,
+                                             **self.log_rotation_options)
+        processed_sink = LogSink("processed", processed_writer, **self.log_sink_options)
+        processed_sink.start()
+        self.log_sinks = {"processed": processed_sink}
+        self._processed_log = processed_sink
+        self._raw_logs = {DEFAULT_PORT: self._open_raw_log_sink(DEFAULT_PORT)}
+        if self.parse_workers > 0:
+            self.parse_pool = ParsePool(self.parse_workers, lambda item, parsed: self._publish(*item, parsed))
+            self.parse_pool.start()
+
+    def close(self):
+        """
+        Writes the queued log records and waits for the compression of finished segments.
+        """
+        if self.parse_pool is not None:
+            # Publishes the batches that are still being parsed before the logs are closed
+            self.parse_pool.close()
+        for sink in self.log_sinks.values():
+            sink.close()
+        self.compressor.join()
+
+    def process_batch(self, port_name: str, batch: list[tuple[bytes, int]]):
+        """
+        Logs, parses and publishes a list of (bytes, received_time) read from one port.
+        Log records are handed to the log sinks, which write them on their own threads.
+        Parsed data is tagged with its port as parsed_data["port"], and afterwards
+        the latest parsed data is published as shared_data.data_snapshot and shared_data.port_snapshots.
+        With parse workers, the batch is published later from the collector thread of the pool, in the same order.
+        """
+        start = time.perf_counter()
+        if self.parse_pool is not None:
+            try:
+                self.parse_pool.submit((port_name, batch), [frame or b"" for frame, _ in batch])
+            except RuntimeError as e:
+                self._abandon_parse_pool(e)
+                self._parse_and_publish(port_name, batch)
+        else:
+            self._parse_and_publish(port_name, batch)
+        self.latency["process"].record(time.perf_counter() - start)
+
+    def _parse_and_publish(self, port_name: str, batch: list[tuple[bytes, int]]):
+        start = time.perf_counter()
+        parsed = [self.parser_manager.parse_data(frame) if frame is not None else ({}, None) for frame, _ in batch]
+        self.latency["parse"].record(time.perf_counter() - start)
+        self._publish(port_name, batch, parsed)
+
+    def _abandon_parse_pool(self, error: RuntimeError):
+        """
+        Parses on this thread from now on, after a worker process died (e.g. killed for memory),
+        including the batches the pool had not returned yet.
+        """
+        logger.error("%s. Parsing in the Background thread from now on.", error)
+        parse_pool = self.parse_pool
+        self.parse_pool = None
+        for port_name, batch in parse_pool.abandon():
+            self._parse_and_publish(port_name, batch)
+
+    def _publish(self, port_name: str, batch: list[tuple[bytes, int]], parsed: list[tuple[dict, str | None]]):
+        """
+        Logs and publishes a batch with the (parsed_data, parser_name) of each of its frames.
+        """
+        start = time.perf_counter()
+        raw_log = self._raw_logs.get(port_name)
+        if raw_log is None:
+            raw_log = self._raw_logs[port_name] = self._open_raw_log_sink(port_name)
+        processed_log = self._processed_log
+        parsed_frame_counts = self.parsed_frame_counts
+        # One level check per batch; the per-frame messages are not even formatted when DEBUG is off
+        debug = logger.isEnabledFor(logging.DEBUG)
+        updates = {}
+        for data, (parsed_data, parser_name) in zip(batch, parsed):
+            if data == (None, None):
+                logger.info("Connection closed: %s", port_name)
+                continue
+            if debug:
+                logger.debug("[%s] Frame %s received at %d, parsed by %s: %s", port_name, data[0].hex(), data[1], parser_name, parsed_data)
+            raw_log.put(data[0], data[1])
+            if parser_name is None:
+                self.unparsed_frame_count += 1
+                self.telemetry_feed.publish(None, data[0], data[1])
+            else:
+                parsed_data["received_time"] = data[1]  # Use the received time from the queue
+                parsed_data["port"] = port_name
+                parsed_frame_counts[parser_name] += 1
+                processed_log.put(parser_name, parsed_data)
+                self.history[parser_name].append(parsed_data)
+                self.broadcaster.publish(parser_name, parsed_data)
+                self.telemetry_feed.publish(parser_name, data[0], data[1], parsed_data)
+                updates[parser_name] = parsed_data
+        if updates:
+            # One snapshot per batch; replacing the reference is atomic, so HTTP readers need no lock
+            shared_data.data_snapshot = shared_data.data_snapshot.update(updates)
+            port_snapshot = shared_data.port_snapshots.get(port_name, shared_data.EMPTY_SNAPSHOT).update(updates)
+            shared_data.port_snapshots = MappingProxyType({**shared_data.port_snapshots, port_name: port_snapshot})
+        self.latency["publish"].record(time.perf_counter() - start)
+        received_time = batch[0][1] if batch else None
+        if received_time is not None:
+            self.processed_frame_count += len(batch)
+            self.latency["end_to_end"].record(max(time.time() - received_time / 1000, 0.0))
+
     def latest_data_dict(self, queue: Queue):
         """
-        Continuously fetches the latest data from the queue.
-        This function runs in a separate thread.
-        """
-        log_count = 0
-        with open(shared_data.log_raw_file_path, "a") as log_file:
-            with open(shared_data.log_processed_file_path, "a") as processed_log_file:
-                while True:
-                    while not queue.empty():
-                        data = queue.get()
-                        if data == (None, None):
-                            print("connection closed")
-                            continue
-                        print(f"Latest data: {data}")
-                        log_file.write(f"{data[1]}, {data[0].hex()}\n")
-                        parsed_data, parser_name = self.parser_manager.parse_data(data[0])
-                        print(f"Parsed data: {parsed_data}, Parser name: {parser_name}")
-                        if parser_name is None:
-                            print("No parser found for the data.")
-                        else:
-                            parsed_data["received_time"] = data[1]  # Use the received time from the queue
-                            processed_log_file.write(f"{parser_name}, {parsed_data}\n")
-                            with shared_data.data_lock:
-                                shared_data.data_dict[parser_name] = parsed_data  # Assuming data is a tuple (parsed_data, parser_name)
-
-                        log_count += 1
-                        if log_count >= 20:
-                            log_file.flush()
-                            processed_log_file.flush()
-                            log_count = 0
-                    else:
-                        threading.Event().wait(0.05)  # Wait for 0.05 seconds before checking again
-
-        print("Background thread stopped.")
+        Continuously fetches the latest data from the queue and processes it with process_batch().
+        Each item in the queue is (port name, list of (bytes, received_time)).
+        This function runs in a separate thread, until stop() is called and the queue is empty.
+        """
+        self.open()
+        try:
+            while not self._shutdown_requested.is_set():
+                try:
+                    port_name, batch = queue.get(timeout=self.get_timeout)
+                except Empty:
+                    if self._stop_requested.is_set():
+                        return
+                    continue
+                received_time = batch[-1][1]
+                if received_time is not None:
+                    self.latency["queue_wait"].record(max(time.time() - received_time / 1000, 0.0))
+                self.process_batch(port_name, batch)
+        finally:
+            self.close()
+            self._stopped.set()
+            logger.info("Background thread stopped.")
+
+    def stop(self):
+        """
+        Lets latest_data_dict() return once the queue is empty, e.g. at the end of a replay.
+        """
+        self._stop_requested.set()
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        Lets latest_data_dict() return after the current batch without emptying the queue, and waits until
+        it has closed the logs. The worker threads are daemons, so without this the process would exit
+        with the current log segments unfinished.
+        """
+        self._shutdown_requested.set()
+        self._stopped.wait(timeout)
 
     def get_background_thread(self, queue: Queue) -> threading.Thread:
         """
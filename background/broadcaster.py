@@ -0,0 +1,167 @@
+from collections import deque
+import itertools
+import json
+import threading
+import time
+
+class Event:
+    """
+    One parsed record published by the Background worker.
+    The JSON text is made on first use and shared by all subscribers.
+    """
+    __slots__ = ("seq", "parser_name", "data", "_json")
+
+    def __init__(self, seq: int, parser_name: str, data: dict):
+        self.seq = seq
+        self.parser_name = parser_name
+        self.data = data
+        self._json = None
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.data)
+        return self._json
+
+
+class Subscription:
+    """
+    Bounded queue of events for one client. When the client is too slow and the
+    queue is full, the oldest event is dropped, so the publisher never waits.
+    """
+    def __init__(self, parser_names: set[str] | None, size: int):
+        self.parser_names = parser_names
+        self._events = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self.dropped_count = 0
+        self.closed = False
+        self._listener = None
+
+    def accepts(self, parser_name: str) -> bool:
+        return self.parser_names is None or parser_name in self.parser_names
+
+    def set_listener(self, listener):
+        """
+        Calls listener() when an event arrives in the empty queue and on close(), from the thread that pushed
+        or closed, e.g. to wake a client that waits on an event loop instead of in get().
+        listener must not block.
+        """
+        with self._condition:
+            self._listener = listener
+
+    def push(self, event: Event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self.dropped_count += 1
+            listener = self._listener if not self._events else None
+            self._events.append(event)
+            self._condition.notify()
+        if listener is not None:
+            listener()
+
+    def get(self, timeout: float) -> list[Event]:
+        """
+        Waits up to timeout seconds for events and returns all queued ones (possibly none).
+        """
+        with self._condition:
+            if not self._events and not self.closed:
+                self._condition.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+            listener = self._listener
+        if listener is not None:
+            listener()
+
+
+class Broadcaster:
+    """
+    Delivers each parsed record to the streaming clients as soon as it is produced.
+
+    Each subscriber has its own bounded queue (see Subscription), and the latest
+    recent_size events are also kept with their sequence numbers so that
+    long-poll clients can ask for everything after the last seq they saw.
+    """
+    def __init__(self, subscriber_queue_size: int = 256, recent_size: int = 1024):
+        self.subscriber_queue_size = subscriber_queue_size
+        self._recent = deque(maxlen=recent_size)
+        self._condition = threading.Condition()
+        self._seq = 0
+        # Replaced, not modified, so that publish() can iterate it without a lock
+        self._subscriptions = ()
+
+    @property
+    def seq(self) -> int:
+        """
+        Sequence number of the latest event (0 if there is none yet).
+        """
+        return self._seq
+
+    def publish(self, parser_name: str, data: dict):
+        """
+        Called by the Background worker for each parsed record. Never blocks on clients.
+        data must not be modified afterwards.
+        """
+        with self._condition:
+            self._seq += 1
+            event = Event(self._seq, parser_name, data)
+            self._recent.append(event)
+            self._condition.notify_all()
+        for subscription in self._subscriptions:
+            if subscription.accepts(parser_name):
+                subscription.push(event)
+
+    def subscribe(self, parser_names: set[str] | None = None, since: int = None) -> Subscription:
+        """
+        Returns a new subscription. parser_names limits the events to those parsers.
+        If since is given, the recent events after it are queued first.
+        """
+        subscription = Subscription(parser_names, self.subscriber_queue_size)
+        with self._condition:
+            if since is not None:
+                for event in self._recent:
+                    if event.seq > since and subscription.accepts(event.parser_name):
+                        subscription.push(event)
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._condition:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription.close()
+
+    def get_subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def wait_since(self, since: int, parser_names: set[str] | None = None, timeout: float = 25.0, limit: int = None) -> tuple[list[Event], int, int]:
+        """
+        For long-poll clients. Waits up to timeout seconds until there are events after since,
+        and returns (events, missed, seq).
+        missed is the number of events (of any parser) after since that are no longer kept,
+        and seq is what the client should pass as since next time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if since > self._seq:
+                # The server was restarted since the client saw since, so start over
+                since = 0
+            while True:
+                oldest = self._recent[0].seq if self._recent else self._seq + 1
+                # Sequence numbers in _recent are consecutive, so skip to since directly
+                start = max(since - oldest + 1, 0)
+                events = [event for event in itertools.islice(self._recent, start, None)
+                          if parser_names is None or event.parser_name in parser_names]
+                seq = self._seq
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        missed = max(oldest - since - 1, 0)
+        if limit is not None and len(events) > limit:
+            events = events[:limit]
+            seq = events[-1].seq if events else since
+        return events, missed, seq
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+class HistoryBuffer:
+    """
+    Fixed-capacity ring buffer of parsed data, stored as one preallocated numpy array per key.
+    When the buffer is full, the oldest records are overwritten, so memory stays bounded.
+
+    The column arrays are allocated on the first append, when the type of each value is known:
+    bool, int and float values get numeric arrays, anything else (e.g. lists) an object array.
+    """
+    def __init__(self, keys: list[str], capacity: int):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self.keys = list(keys)
+        if "received_time" not in self.keys:
+            self.keys.append("received_time")
+        self.capacity = capacity
+        self._columns = None
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _allocate(self, parsed_data: dict):
+        self._columns = {}
+        for key in self.keys:
+            value = parsed_data.get(key)
+            if isinstance(value, bool):
+                column = np.zeros(self.capacity, dtype=np.bool_)
+            elif isinstance(value, (int, np.integer)):
+                column = np.zeros(self.capacity, dtype=np.int64)
+            elif isinstance(value, (float, np.floating)):
+                column = np.full(self.capacity, np.nan, dtype=np.float64)
+            else:
+                column = np.empty(self.capacity, dtype=object)
+            self._columns[key] = column
+
+    def append(self, parsed_data: dict):
+        """
+        Appends one parsed dict. Keys that are not in keys are ignored.
+        """
+        with self._lock:
+            if self._columns is None:
+                self._allocate(parsed_data)
+            index = self._next
+            for key, column in self._columns.items():
+                column[index] = parsed_data.get(key)
+            self._next = (index + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def query(self, since: int = None, limit: int = None) -> dict[str, list]:
+        """
+        Returns {key: list of values}, oldest first.
+        If since is given, only records received after it are returned and limit takes the oldest of them,
+        so that a client can page forward with the last received_time it got.
+        Otherwise limit takes the newest records.
+        """
+        with self._lock:
+            if self._columns is None:
+                return {key: [] for key in self.keys}
+            order = (np.arange(self._count) + (self._next - self._count)) % self.capacity
+            if since is not None:
+                times = self._columns["received_time"][order]
+                order = order[np.searchsorted(times, since, side="right"):]
+                if limit is not None:
+                    order = order[:limit]
+            elif limit is not None:
+                order = order[max(len(order) - limit, 0):]
+            # Fancy indexing copies the values, so they can be converted after the lock is released
+            columns = {key: column[order] for key, column in self._columns.items()}
+        return {key: column.tolist() for key, column in columns.items()}
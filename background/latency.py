@@ -0,0 +1,53 @@
+import math
+
+# Bucket i counts samples below 2**i microseconds; the last one also counts everything slower
+BUCKET_COUNT = 32
+
+
+class LatencyStats:
+    """
+    Count, mean, maximum and approximate percentiles of durations.
+    Samples are counted in power of two buckets, so recording costs no allocation
+    and percentiles are upper bounds within a factor of two.
+    Meant to be recorded by one thread; readers on other threads may see a sample half counted.
+    """
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        microseconds = seconds * 1e6
+        index = math.frexp(microseconds)[1] if microseconds >= 1 else 0
+        self.buckets[min(index, BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Returns the upper bound in seconds of the bucket that contains the given fraction of the samples.
+        """
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min(2 ** index / 1e6, self.max)
+        return self.max
+
+    def get_stats(self) -> dict:
+        """
+        Returns the statistics in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
@@ -0,0 +1,269 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentManifest:
+    """
+    JSON file that lists the segments of one log and the time range of each,
+    so that a replay tool can open the right file directly.
+
+        {"segments": [{"path": ..., "start_time": ..., "end_time": ..., "records": ..., "status": ...}]}
+
+    status is "active" while the segment is being written, "closed" after rotation
+    and "compressed" once the compressed file has replaced it.
+    Paths are relative to the directory of the manifest. Times are received times in ms.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self._lock = threading.Lock()
+        self.segments = []
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.segments = json.load(f).get("segments", [])
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segments": self.segments}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, segment_path: str):
+        with self._lock:
+            self.segments.append({"path": os.path.relpath(segment_path, self.directory), "start_time": None,
+                                  "end_time": None, "records": 0, "status": "active"})
+            self._save()
+
+    def close(self, segment_path: str, start_time: int, end_time: int, records: int):
+        with self._lock:
+            segment = self._find(segment_path)
+            segment.update({"start_time": start_time, "end_time": end_time, "records": records, "status": "closed"})
+            self._save()
+
+    def replace(self, segment_path: str, compressed_path: str):
+        with self._lock:
+            segment = self._find(segment_path)
+            segment.update({"path": os.path.relpath(compressed_path, self.directory), "status": "compressed"})
+            self._save()
+
+    def remove(self, segment_path: str):
+        with self._lock:
+            self.segments.remove(self._find(segment_path))
+            self._save()
+
+    def unfinished(self) -> list[tuple[str, str]]:
+        """
+        Returns (absolute path, status) of the segments that are "active" or "closed",
+        e.g. left by a crash before they were closed or compressed.
+        """
+        with self._lock:
+            return [(os.path.join(self.directory, segment["path"]), segment["status"])
+                    for segment in self.segments if segment["status"] in ("active", "closed")]
+
+    def _find(self, segment_path: str) -> dict:
+        relative_path = os.path.relpath(segment_path, self.directory)
+        for segment in reversed(self.segments):
+            if segment["path"] == relative_path:
+                return segment
+        raise KeyError(segment_path)
+
+    def find(self, start_time: int, end_time: int = None) -> list[str]:
+        """
+        Returns absolute paths of the segments that may hold records in [start_time, end_time].
+        """
+        paths = []
+        with self._lock:
+            for segment in self.segments:
+                if segment["end_time"] is not None and segment["end_time"] < start_time:
+                    continue
+                if end_time is not None and segment["start_time"] is not None and segment["start_time"] > end_time:
+                    continue
+                paths.append(os.path.join(self.directory, segment["path"]))
+        return paths
+
+
+class SegmentCompressor:
+    """
+    Compresses finished segments on its own thread, so writing never waits for compression.
+    """
+    def __init__(self, compression: str = "gzip"):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {COMPRESSIONS}, got {compression}")
+        if compression == "zstd" and zstd is None:
+            logger.warning("zstd is not available in this Python. Using gzip instead.")
+            compression = "gzip"
+        self.compression = compression
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, path: str, manifest: SegmentManifest):
+        if self.compression == "none":
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="segment-compressor", daemon=True)
+            self._thread.start()
+        self._queue.put((path, manifest))
+
+    def join(self, timeout: float = None):
+        """
+        Waits until the submitted segments are compressed.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, manifest = item
+            try:
+                compressed_path = self._compress(path)
+                manifest.replace(path, compressed_path)
+                os.remove(path)
+            except (OSError, KeyError) as e:
+                logger.error("Failed to compress %s: %s", path, e)
+
+    def _compress(self, path: str) -> str:
+        if self.compression == "zstd":
+            compressed_path = path + ".zst"
+            opener = zstd.open
+        else:
+            compressed_path = path + ".gz"
+            opener = gzip.open
+        tmp_path = compressed_path + ".tmp"
+        with open(path, "rb") as src, opener(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp_path, compressed_path)
+        return compressed_path
+
+
+class RotatingLogWriter:
+    """
+    Log writer that splits a log into segments by size or time.
+
+    For a base path "mainlog.bin", segments are written as
+    "mainlog-YYYYmmdd-HHMMSS-mmm.bin" next to it and listed in "mainlog.manifest.json".
+    open_segment(path) must return a writer with write(*record) -> int, flush() and close(),
+    and time_of(*record) returns the received time of a record in ms.
+    A max_bytes or max_seconds of 0 disables that trigger.
+    Finished segments are handed to the compressor.
+
+    Segments that a crash left active are finished when the writer is created:
+    scan_segment(path) returns their (start_time, end_time, records), which are written to the manifest,
+    and they are compressed like the others. Without scan_segment their time range stays unknown.
+    """
+    def __init__(self, base_path: str, open_segment, time_of, max_bytes: int = 64 << 20,
+                 max_seconds: float = 3600, compressor: SegmentCompressor = None, scan_segment=None):
+        stem, self._extension = os.path.splitext(base_path)
+        self._stem = stem
+        self.open_segment = open_segment
+        self.time_of = time_of
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compressor = compressor
+        self.scan_segment = scan_segment
+        self.manifest = SegmentManifest(stem + ".manifest.json")
+        self._writer = None
+        self._segment_path = None
+        self._recover()
+        self._open()
+
+    def _recover(self):
+        """
+        Closes the segments left active by a crash and compresses them and the closed segments whose compression was cut off.
+        """
+        for path, status in self.manifest.unfinished():
+            if not os.path.exists(path):
+                logger.warning("Log segment %s is missing.", path)
+                self.manifest.remove(path)
+                continue
+            if status == "active":
+                start_time, end_time, records = None, None, 0
+                if self.scan_segment is not None:
+                    try:
+                        start_time, end_time, records = self.scan_segment(path)
+                    except (OSError, ValueError) as e:
+                        logger.error("Failed to read %s: %s", path, e)
+                    else:
+                        if records == 0:
+                            self.manifest.remove(path)
+                            os.remove(path)
+                            continue
+                self.manifest.close(path, start_time, end_time, records)
+            if self.compressor is not None:
+                self.compressor.submit(path, self.manifest)
+
+    def _new_segment_path(self) -> str:
+        now_ms = int(time.time() * 1000)
+        while True:
+            path = f"{self._stem}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now_ms // 1000))}-{now_ms % 1000:03d}{self._extension}"
+            # A segment rotated within the same ms must not reuse the name, even after it was compressed
+            if path != self._segment_path and not os.path.exists(path) and not os.path.exists(path + ".gz") \
+                    and not os.path.exists(path + ".zst"):
+                return path
+            now_ms += 1
+
+    def _open(self):
+        path = self._new_segment_path()
+        self._writer = self.open_segment(path)
+        self._segment_path = path
+        self._opened_at = time.monotonic()
+        self._segment_bytes = 0
+        self._records = 0
+        self._start_time = None
+        self._end_time = None
+        self.manifest.add(path)
+
+    def _finish(self):
+        self._writer.close()
+        if self._records == 0:
+            self.manifest.remove(self._segment_path)
+            os.remove(self._segment_path)
+            return
+        self.manifest.close(self._segment_path, self._start_time, self._end_time, self._records)
+        if self.compressor is not None:
+            self.compressor.submit(self._segment_path, self.manifest)
+
+    def write(self, *record) -> int:
+        if (self.max_bytes and self._segment_bytes >= self.max_bytes) or \
+                (self.max_seconds and time.monotonic() - self._opened_at >= self.max_seconds):
+            self.rotate()
+        written = self._writer.write(*record)
+        received_time = self.time_of(*record)
+        if self._start_time is None:
+            self._start_time = received_time
+        self._end_time = received_time
+        self._records += 1
+        self._segment_bytes += written
+        return written
+
+    def rotate(self):
+        """
+        Closes the current segment and starts a new one.
+        """
+        self._finish()
+        self._open()
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._finish()
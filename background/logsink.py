@@ -0,0 +1,211 @@
+from collections import deque
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ProcessedLogWriter:
+    """
+    Writes parsed data as "{parser_name}, {parsed_data}" lines.
+    """
+    def __init__(self, path: str, buffering: int = 1 << 20):
+        self._file = open(path, "a", buffering=buffering)
+
+    def write(self, parser_name: str, parsed_data: dict) -> int:
+        line = f"{parser_name}, {parsed_data}\n"
+        self._file.write(line)
+        return len(line)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+_RECEIVED_TIME = re.compile(r"'received_time': (\d+)")
+
+
+def scan_processed_log(path: str) -> tuple[int | None, int | None, int]:
+    """
+    Returns (first received time, last received time, number of records) of a log written by ProcessedLogWriter.
+    A line cut off by a crash is not counted.
+    """
+    first_time = last_time = None
+    count = 0
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            match = _RECEIVED_TIME.search(line)
+            if match is None or not line.endswith("\n"):
+                continue
+            received_time = int(match.group(1))
+            if first_time is None:
+                first_time = received_time
+            last_time = received_time
+            count += 1
+    return first_time, last_time, count
+
+
+class LogSink:
+    """
+    Writes log records on its own thread so that a slow disk does not delay parsing.
+
+    Records are put into a bounded ring and written in batches by writer.write(*record),
+    which must return the number of bytes written. The writer is flushed when
+    flush_bytes have been written or flush_interval seconds have passed since the last flush.
+
+    When the ring is full, policy decides what happens:
+        "drop":  the new record is dropped and counted
+        "block": put() waits until the sink thread makes room
+
+    Errors of the writer (disk full, storage removed) are logged and counted, and the records
+    that could not be written are lost. The sink keeps draining the ring, so producers never wait for a failed writer.
+    """
+    POLICIES = ("drop", "block")
+
+    def __init__(self, name: str, writer, capacity: int = 8192, policy: str = "drop",
+                 flush_bytes: int = 1 << 18, flush_interval: float = 1.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}, got {policy}")
+        self.name = name
+        self.writer = writer
+        self.capacity = capacity
+        self.policy = policy
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._ring = deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name=f"logsink-{name}", daemon=True)
+
+        self.records_written = 0
+        self.bytes_written = 0
+        self.dropped_count = 0
+        self.blocked_count = 0
+        self.flush_count = 0
+        self.failed_count = 0
+        self.error_count = 0
+        self.last_error = None
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, *record) -> bool:
+        """
+        Queues one record for writing. Returns False if it was dropped.
+        """
+        with self._condition:
+            if len(self._ring) >= self.capacity:
+                if self.policy == "drop":
+                    self.dropped_count += 1
+                    return False
+                self.blocked_count += 1
+                while len(self._ring) >= self.capacity and not self._closing:
+                    self._condition.wait()
+            self._ring.append(record)
+            if len(self._ring) == 1:
+                self._condition.notify_all()
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """
+        Writes the queued records, flushes and closes the writer.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        else:
+            self._close_writer()
+
+    def _run(self):
+        bytes_since_flush = 0
+        last_flush = time.monotonic()
+        write = self.writer.write
+        while True:
+            with self._condition:
+                while not self._ring and not self._closing:
+                    remaining = self.flush_interval - (time.monotonic() - last_flush)
+                    if bytes_since_flush > 0 and remaining <= 0:
+                        break
+                    self._condition.wait(remaining if bytes_since_flush > 0 else None)
+                records = self._ring
+                self._ring = deque()
+                closing = self._closing
+                # Wake producers waiting for room
+                self._condition.notify_all()
+
+            written = 0
+            failed = 0
+            for record in records:
+                try:
+                    written += write(*record)
+                except Exception as e:
+                    failed += 1
+                    error = e
+            if failed:
+                self.failed_count += failed
+                self._error(f"write {failed} records", error)
+            self.records_written += len(records) - failed
+            self.bytes_written += written
+            bytes_since_flush += written
+
+            now = time.monotonic()
+            if bytes_since_flush > 0 and (closing or bytes_since_flush >= self.flush_bytes or now - last_flush >= self.flush_interval):
+                self._flush()
+                bytes_since_flush = 0
+                last_flush = time.monotonic()
+            if closing:
+                self._close_writer()
+                return
+
+    def _error(self, action: str, error: Exception):
+        self.error_count += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        logger.error("[%s] Failed to %s: %s", self.name, action, self.last_error)
+
+    def _close_writer(self):
+        try:
+            self.writer.close()
+        except Exception as e:
+            self._error("close the log", e)
+
+    def _flush(self):
+        start = time.perf_counter()
+        try:
+            self.writer.flush()
+        except Exception as e:
+            self._error("flush", e)
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.flush_count += 1
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+    def get_stats(self) -> dict:
+        """
+        Returns counters of the sink.
+        """
+        return {
+            "queue_depth": len(self._ring),
+            "capacity": self.capacity,
+            "policy": self.policy,
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "dropped": self.dropped_count,
+            "blocked": self.blocked_count,
+            "failed": self.failed_count,
+            "errors": self.error_count,
+            "last_error": self.last_error,
+            "flush_count": self.flush_count,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "avg_flush_ms": self._total_flush_ms / self.flush_count if self.flush_count else 0.0,
+        }
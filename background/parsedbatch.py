@@ -0,0 +1,66 @@
+import numpy as np
+
+class ParsedBatch:
+    """
+    Parsed frames of one parser, stored as one numpy array per key.
+    Per-frame dicts are only built when records() or an index is used.
+    """
+    def __init__(self, parser_name: str, keys: list[str], columns: dict[str, np.ndarray] = None, records: list[dict] = None,
+                 indexes: list[int] = None):
+        """
+        Either columns or records must be given.
+        records is used for parsers that can only parse one frame at a time;
+        their columns are then built on first access.
+        indexes are the positions of the frames in the list given to ParserManager.parse_batch().
+        """
+        self.parser_name = parser_name
+        self.keys = list(keys)
+        self.indexes = indexes
+        self._columns = columns
+        self._records = records
+        self._column_lists = None
+
+    def __len__(self) -> int:
+        if self._records is not None:
+            return len(self._records)
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        Returns {key: array of values}.
+        """
+        if self._columns is None:
+            self._columns = {key: np.array([record.get(key) for record in self._records]) for key in self._keys_in_records()}
+        return self._columns
+
+    def _keys_in_records(self) -> list[str]:
+        keys = list(self.keys)
+        for key in (self._records[0] if self._records else {}):
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def records(self) -> list[dict]:
+        """
+        Returns the frames as a list of dicts, in the same form as parse() returns.
+        """
+        if self._records is None:
+            column_lists = self._get_column_lists()
+            names = list(column_lists)
+            self._records = [dict(zip(names, values)) for values in zip(*column_lists.values())]
+        return self._records
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __getitem__(self, index: int) -> dict:
+        if self._records is not None:
+            return self._records[index]
+        return {key: values[index] for key, values in self._get_column_lists().items()}
+
+    def _get_column_lists(self) -> dict[str, list]:
+        # tolist() converts numpy scalars to python values, so the dicts can be serialized to json
+        if self._column_lists is None:
+            self._column_lists = {key: column.tolist() for key, column in self.columns.items()}
+        return self._column_lists
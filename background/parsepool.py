@@ -0,0 +1,240 @@
+"""
+# parsepool.py
+Parses frames in worker processes, for links whose frame rate one Background thread cannot keep up with.
+
+Frames are copied into one slot of a shared memory ring, and only (sequence number, slot) goes
+through the task pipe. Each worker parses a whole slot with ParserManager.parse_batch() and
+returns the parsed columns. Results are handed back in the order the batches were submitted,
+so the data of each parser keeps its order whichever worker finished first.
+"""
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import struct
+import threading
+import time
+
+from background.parsermanager import ParserManager
+
+logger = logging.getLogger(__name__)
+
+COUNT = struct.Struct("<I")  # number of frames in a slot
+LENGTH = struct.Struct("<I")  # length of each frame, followed by the frames themselves
+
+
+def _pack_frames(buffer: memoryview, frames: list[bytes]):
+    COUNT.pack_into(buffer, 0, len(frames))
+    offset = COUNT.size
+    for frame in frames:
+        LENGTH.pack_into(buffer, offset, len(frame))
+        offset += LENGTH.size
+    for frame in frames:
+        buffer[offset:offset + len(frame)] = frame
+        offset += len(frame)
+
+
+def _unpack_frames(buffer: memoryview) -> list[bytes]:
+    count = COUNT.unpack_from(buffer, 0)[0]
+    lengths = struct.unpack_from(f"<{count}I", buffer, COUNT.size)
+    offset = COUNT.size + LENGTH.size * count
+    data = bytes(buffer[offset:offset + sum(lengths)])
+    frames = []
+    offset = 0
+    for length in lengths:
+        frames.append(data[offset:offset + length])
+        offset += length
+    return frames
+
+
+def _packed_size(frames: list[bytes]) -> int:
+    return COUNT.size + LENGTH.size * len(frames) + sum(len(frame) for frame in frames)
+
+
+def _worker_main(shm_name: str, slot_size: int, tasks, results):
+    """
+    Runs in each worker process until it gets None.
+    """
+    # Spawned workers share the resource tracker of the parent, which unlinks the memory only if the parent leaks it
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # The main process reports the frames no parser can handle
+    logging.getLogger("background.parsermanager").setLevel(logging.ERROR)
+    parser_manager = ParserManager()
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            seq, slot, frames = task
+            if frames is None:
+                frames = _unpack_frames(shm.buf[slot * slot_size:(slot + 1) * slot_size])
+            try:
+                batches = parser_manager.parse_batch(frames)
+            except Exception as e:
+                logger.error("Parse worker error: %s", e)
+                batches = {}
+            results.put((seq, slot, len(frames), batches))
+    finally:
+        shm.close()
+
+
+def in_frame_order(frame_count: int, batches: dict) -> list[tuple[dict, str | None]]:
+    """
+    Converts the result of ParserManager.parse_batch() into one (parsed_data, parser_name) per frame,
+    as ParserManager.parse_data() returns them. Frames no parser can handle are ({}, None).
+    """
+    parsed = [({}, None)] * frame_count
+    for parser_name, batch in batches.items():
+        for index, parsed_data in zip(batch.indexes, batch.records()):
+            parsed[index] = (parsed_data, parser_name)
+    return parsed
+
+
+class ParsePool:
+    """
+    Pool of worker processes that parse lists of frames.
+
+    submit(item, frames) is called from one thread, and on_result(item, parsed) is called
+    with the same item on the collector thread of the pool, in submission order.
+    parsed is a list of (parsed_data, parser_name), one per frame.
+
+    submit() blocks while all slots are in use. If a worker process dies, the pool stops and
+    submit() raises RuntimeError, because the batch it was parsing is lost. abandon() then returns
+    the items that were not delivered, so that the caller can parse them itself.
+    """
+    def __init__(self, worker_count: int, on_result, slot_count: int = None, slot_size: int = 1 << 20):
+        if worker_count < 1:
+            raise ValueError("worker_count must be positive")
+        self.worker_count = worker_count
+        self.on_result = on_result
+        # Enough slots to keep every worker busy while the collector catches up
+        self.slot_count = slot_count or worker_count * 4
+        self.slot_size = slot_size
+        self.error = None
+        self._closing = False
+        self.submitted_count = 0
+        self.inline_count = 0
+        self._pending = {}  # seq -> item
+        self._workers = []
+        self._collector = None
+
+    def start(self):
+        # Workers are spawned, not forked, because the parent already runs threads
+        context = multiprocessing.get_context("spawn")
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_count * self.slot_size)
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._free_slots = queue.Queue()
+        for slot in range(self.slot_count):
+            self._free_slots.put(slot)
+        self._workers = [context.Process(target=_worker_main, name=f"parse-worker-{i}", daemon=True,
+                                         args=(self._shm.name, self.slot_size, self._tasks, self._results))
+                         for i in range(self.worker_count)]
+        for worker in self._workers:
+            worker.start()
+        self._collector = threading.Thread(target=self._collect, name="parse-collector", daemon=True)
+        self._collector.start()
+
+    def submit(self, item, frames: list[bytes]):
+        """
+        Queues frames for parsing. on_result(item, parsed) is called when they and all earlier frames are parsed.
+        """
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        if _packed_size(frames) > self.slot_size:
+            # Too large for a slot: sent through the pipe instead
+            seq = self._add_pending(item)
+            self.inline_count += 1
+            self._tasks.put((seq, None, frames))
+            return
+        while True:
+            if self.error is not None:
+                # Not pending yet, so abandon() does not return it
+                raise RuntimeError(self.error)
+            try:
+                slot = self._free_slots.get(timeout=1.0)
+                break
+            except queue.Empty:
+                continue
+        seq = self._add_pending(item)
+        _pack_frames(self._shm.buf[slot * self.slot_size:(slot + 1) * self.slot_size], frames)
+        self._tasks.put((seq, slot, None))
+
+    def _add_pending(self, item) -> int:
+        seq = self.submitted_count
+        self._pending[seq] = item
+        self.submitted_count += 1
+        return seq
+
+    def _collect(self):
+        waiting = {}
+        next_seq = 0
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [worker.name for worker in self._workers if not worker.is_alive()]
+                if dead and not self._closing:
+                    self.error = f"Parse worker stopped: {', '.join(dead)}"
+                    logger.error("%s", self.error)
+                    return
+                continue
+            if message is None:
+                return
+            seq, slot, frame_count, batches = message
+            if slot is not None:
+                self._free_slots.put(slot)
+            waiting[seq] = (frame_count, batches)
+            while next_seq in waiting:
+                frame_count, batches = waiting.pop(next_seq)
+                self.on_result(self._pending.pop(next_seq), in_frame_order(frame_count, batches))
+                next_seq += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "workers": self.worker_count,
+            "submitted": self.submitted_count,
+            "pending": len(self._pending),
+            "free_slots": self._free_slots.qsize() if self._workers else self.slot_count,
+            "inline": self.inline_count,
+        }
+
+    def abandon(self) -> list:
+        """
+        Stops the pool after an error without waiting for the workers, and returns the submitted items
+        whose results were not delivered, in submission order.
+        """
+        self._closing = True
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        if self._collector is not None:
+            # It returns after setting the error
+            self._collector.join(5.0)
+            self._collector = None
+            self._shm.close()
+            self._shm.unlink()
+        items = [self._pending[seq] for seq in sorted(self._pending)]
+        self._pending.clear()
+        return items
+
+    def close(self, timeout: float = 5.0):
+        """
+        Waits for the queued batches, then stops the workers and frees the shared memory.
+        """
+        if self._collector is None:
+            return
+        self._closing = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.terminate()
+        # Workers have flushed their results, so this comes after all of them
+        self._results.put(None)
+        self._collector.join(max(deadline - time.monotonic(), 0))
+        self._collector = None
+        self._shm.close()
+        self._shm.unlink()
@@ -1,11 +1,16 @@
 from abc import ABC, abstractmethod
 import importlib
+import logging
 import os
 import pkgutil
-import warnings
+import numpy as np
 from background.abstractparser import AbstractParser
+from background.parsedbatch import ParsedBatch
+from background.structparser import StructParser
 from background.parsers import __path__ as parsers_path
 
+logger = logging.getLogger(__name__)
+
 class ParserManager:
     """
     Manages the loading and selection of data parsers.
@@ -13,18 +18,60 @@ class ParserManager:
     def __init__(self):
         self.parsers = self._load_parsers()
         self.parser_names = [parser.get_name() for parser in self.parsers]
+        self._dispatch_table, self._prefix_lengths, self._fallback_parsers = self._build_dispatch_table(self.parsers)
 
     def parse_data(self, data: bytes) -> tuple[dict[str, any], str]:
         """
         Parses the given byte data using the appropriate parser.
         Returns a dictionary of parsed values.
         """
-        parser = self._select_parser(data, self.parsers)
+        parser = self._select_parser(data)
         if parser is not None:
             return parser.parse(data), parser.get_name()
         else:
             return {}, None
 
+    def parse_batch(self, frames: list[bytes], received_times: list[int] = None) -> dict[str, ParsedBatch]:
+        """
+        Parses many frames at once, e.g. when replaying a log.
+        Frames are grouped by parser, and frames of a StructParser are converted
+        with one np.frombuffer into its structured dtype.
+        If received_times is given, each batch also has a "received_time" column.
+        Returns {parser name: ParsedBatch}, where ParsedBatch.indexes are the positions of its frames in frames.
+        Frames that no parser can handle are skipped.
+        """
+        groups = {}
+        unparsed_count = 0
+        for i, frame in enumerate(frames):
+            parser = self._lookup_parser(frame)
+            if parser is None:
+                unparsed_count += 1
+                continue
+            group = groups.get(parser)
+            if group is None:
+                group = groups[parser] = ([], [])
+            group[0].append(frame)
+            group[1].append(i)
+        if unparsed_count:
+            logger.warning("No parser can handle %d of %d frames.", unparsed_count, len(frames))
+
+        batches = {}
+        for parser, (group_frames, indexes) in groups.items():
+            name = parser.get_name()
+            if isinstance(parser, StructParser):
+                records = np.frombuffer(b''.join(group_frames), dtype=parser.get_dtype())
+                batch = ParsedBatch(name, parser.get_keys(), columns=parser.parse_columns(records), indexes=indexes)
+                if received_times is not None:
+                    batch.columns["received_time"] = np.array([received_times[i] for i in indexes], dtype=np.int64)
+            else:
+                parsed = [parser.parse(frame) for frame in group_frames]
+                if received_times is not None:
+                    for parsed_data, i in zip(parsed, indexes):
+                        parsed_data["received_time"] = received_times[i]
+                batch = ParsedBatch(name, parser.get_keys(), records=parsed, indexes=indexes)
+            batches[name] = batch
+        return batches
+
     def get_parser_names(self) -> list[str]:
         """
         Returns a list of available parser names.
@@ -52,22 +99,85 @@ class ParserManager:
                 if isinstance(instance, AbstractParser):
                     parser_instances.append(instance)
                 else:
-                    print(f"Module {module_name} has invalid 'parser' object.")
-                    print(f"Expected instance of AbstractParser subclass, got {type(instance)}")
+                    logger.error("Module %s has invalid 'parser' object. Expected instance of AbstractParser subclass, got %s",
+                                 module_name, type(instance))
             else:
-                print(f"Module {module_name} does not define 'parser'")
-                print(f"Please ensure it defines a 'parser' object that is an instance of AbstractParser subclass.")
+                logger.error("Module %s does not define 'parser'. "
+                             "Please ensure it defines a 'parser' object that is an instance of AbstractParser subclass.", module_name)
         return parser_instances
 
-    def _select_parser(self, data: bytes, parsers: list[AbstractParser]):
-        selected_parser = None
+    @staticmethod
+    def _id_constraints(parser: AbstractParser) -> dict[int, int]:
+        """
+        Returns the id bytes of the parser as {index: byte value}.
+        """
+        constraints = {}
+        for index, id_value in parser.get_id_bytes():
+            for offset, byte in enumerate(id_value):
+                constraints[index + offset] = byte
+        return constraints
+
+    @staticmethod
+    def _leading_prefix(constraints: dict[int, int]) -> bytes | None:
+        """
+        Returns the id bytes as one bytes object if they cover index 0 to n-1 without gaps.
+        Otherwise returns None.
+        """
+        if sorted(constraints) != list(range(len(constraints))):
+            return None
+        return bytes(constraints[index] for index in range(len(constraints)))
+
+    def _build_dispatch_table(self, parsers: list[AbstractParser]):
+        """
+        Builds a (data length, id prefix) -> parser table.
+        Parsers whose id bytes are not a leading prefix, or which override can_parse,
+        are scanned with can_parse instead.
+        Raises ValueError if two parsers can accept the same data.
+        """
+        constraints = []
         for parser in parsers:
+            parser_constraints = self._id_constraints(parser)
+            if parser_constraints and max(parser_constraints) >= parser.get_data_length():
+                raise ValueError(f"Id bytes of {parser.get_name()} are out of its data length {parser.get_data_length()}")
+            constraints.append(parser_constraints)
+
+        # Two parsers with the same length are ambiguous unless some id byte differs
+        for i in range(len(parsers)):
+            for j in range(i + 1, len(parsers)):
+                if parsers[i].get_data_length() != parsers[j].get_data_length():
+                    continue
+                shared = constraints[i].keys() & constraints[j].keys()
+                if all(constraints[i][index] == constraints[j][index] for index in shared):
+                    raise ValueError(f"Multiple parsers can parse the same data: {parsers[i].get_name()} and {parsers[j].get_name()}")
+
+        dispatch_table = {}
+        prefix_lengths = {}
+        fallback_parsers = []
+        for parser, parser_constraints in zip(parsers, constraints):
+            prefix = self._leading_prefix(parser_constraints)
+            if prefix is None or type(parser).can_parse is not AbstractParser.can_parse:
+                fallback_parsers.append(parser)
+                continue
+            length = parser.get_data_length()
+            dispatch_table[(length, prefix)] = parser
+            lengths = prefix_lengths.setdefault(length, [])
+            if len(prefix) not in lengths:
+                lengths.append(len(prefix))
+        return dispatch_table, {length: tuple(lengths) for length, lengths in prefix_lengths.items()}, fallback_parsers
+
+    def _select_parser(self, data: bytes):
+        parser = self._lookup_parser(data)
+        if parser is None:
+            logger.warning("No parser can handle the provided data: %s", data.hex())
+        return parser
+
+    def _lookup_parser(self, data: bytes):
+        length = len(data)
+        for prefix_length in self._prefix_lengths.get(length, ()):
+            parser = self._dispatch_table.get((length, data[:prefix_length]))
+            if parser is not None:
+                return parser
+        for parser in self._fallback_parsers:
             if parser.can_parse(data):
-                if selected_parser is None:
-                    selected_parser = parser
-                else:
-                    raise ValueError(f"Multiple parsers can parse the data: {selected_parser.get_name()} and {parser.get_name()}\n" \
-                                      f"for data: {data.hex()}")
-        if selected_parser is None:
-            warnings.warn(f"No parser can handle the provided data.\nData: {data.hex()}")
-        return selected_parser
+                return parser
+        return None
@@ -1,39 +1,25 @@
-from background.abstractparser import AbstractParser
-import struct
+import numpy as np
+from background.structparser import StructParser
 
-class PCSenderParser(AbstractParser):
+class PCSenderParser(StructParser):
     """
-    Parser for humidity and temperature sensor data.
+    Parser for data sent from the PC.
     """
-    def __init__(self):
-        self.parser=struct.Struct(">BxxxIIIBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBBB")
-
-    @staticmethod
-    def get_name() -> str:
-        return "pcsender"
-
-    @staticmethod
-    def get_keys() -> list[str]:
-        return ["timestamp", "target_longitude", "target_latitude", "additional_data"]
-
-    @staticmethod
-    def get_data_length() -> int:
-        return 48
-
-    @staticmethod
-    def get_id_bytes() -> list[(int, bytes)]:
-        return [(0, b'\xE0')]  # Assuming the first byte is the ID for humidity and temperature sensor
+    name = "pcsender"
+    struct_format = ">xxxxIII32s"
+    id_bytes = [(0, b'\xE0')]  # Assuming the first byte is the ID for PC sender
+    fields = ["timestamp", "target_longitude", "target_latitude", "additional_data"]
 
     def parse(self, data: bytes) -> dict:
-        if len(data) != self.get_data_length():
-            raise ValueError(f"Expected {self.get_data_length()} bytes, got {len(data)} bytes")
-
-        _id, timestamp, target_longitude, target_latitude, *additional_data = self.parser.unpack(data)
-        return {
-            "timestamp": timestamp,
-            "target_longitude": target_longitude,
-            "target_latitude": target_latitude,
-            "additional_data": additional_data
-        }
-
-parser = PCSenderParser()
\ No newline at end of file
+        parsed_data = super().parse(data)
+        # Keep additional_data as a list of ints so that it can be serialized to json
+        parsed_data["additional_data"] = list(parsed_data["additional_data"])
+        return parsed_data
+
+    def parse_columns(self, records: np.ndarray) -> dict[str, np.ndarray]:
+        columns = super().parse_columns(records)
+        # numpy strips trailing 0x00 from bytes values, so view them as a (frames, 32) uint8 array
+        columns["additional_data"] = np.ascontiguousarray(columns["additional_data"]).view(np.uint8).reshape(len(records), -1)
+        return columns
+
+parser = PCSenderParser()
@@ -1,69 +1,96 @@
 import bisect
 import numpy as np
-from background.abstractparser import AbstractParser
-import struct
+from background.structparser import StructParser
 
-class ServoControllerParser(AbstractParser):
+class WingAngleTable:
     """
-    Parser for servo controller data.
+    Lookup table from servo angle to wing angle.
+    The table is built on first use, so loading the parser package stays fast.
     """
-    def __init__(self):
-        self.parser=struct.Struct(">BBxxIffffffffff")
-        self.rudder_wing2servo = lambda x: 1.12e-4*x**4 + 5.84e-3*x**3 + -0.0205*x**2 + 4.21*x + 4.39 + 180
-        self.elevator_wing2servo = lambda x: -1.49e-3*x**4 + -0.0401*x**3 + -0.267*x**2 + -6.07*x + -47.1 + 180
-        self.list_r = [(self.rudder_wing2servo(i), i) for i in np.arange(-20, 20, 0.01)]
-        self.list_e = [(self.elevator_wing2servo(i), i) for i in np.arange(-20, 20, 0.01)]
+    def __init__(self, wing2servo):
+        """
+        wing2servo is a function from wing angle to servo angle that also accepts numpy arrays.
+        """
+        self.wing2servo = wing2servo
+        self._servo = None
+
+    def _build(self):
+        wing = np.arange(-20, 20, 0.01)
+        servo = self.wing2servo(wing)
         # サーボの角度順にソート
-        self.list_r.sort(key=lambda x: x[0])
-        self.list_e.sort(key=lambda x: x[0])
-        # bisect用にサーボの角度のみのリストを作成
-        self.list_r_servo = [angle for angle, _ in self.list_r]
-        self.list_e_servo = [angle for angle, _ in self.list_e] 
-        
+        order = np.argsort(servo, kind="stable")
+        self._servo = servo[order]
+        # np.float64の小数点がきれいに表示されないため、roundで小数点以下2桁に丸めておく
+        self._wing = np.round(wing[order], 2)
+        # 1つずつ引く場合はnumpyよりbisectの方が速いので、listも用意しておく
+        self._servo_list = self._servo.tolist()
+        self._wing_list = self._wing.tolist()
+        self._last_index = len(self._servo_list) - 1
 
-    @staticmethod
-    def get_name() -> str:
-        return "servocontroller"
+    def lookup(self, servo_angle: float) -> float:
+        """
+        Returns the wing angle for one servo angle.
+        Angles beyond the table are clamped to its ends.
+        """
+        if self._servo is None:
+            self._build()
+        index = bisect.bisect_left(self._servo_list, servo_angle)
+        return self._wing_list[min(index, self._last_index)]
+
+    def lookup_array(self, servo_angles: np.ndarray) -> np.ndarray:
+        """
+        Returns the wing angles for an array of servo angles, same as lookup() for each element.
+        """
+        if self._servo is None:
+            self._build()
+        servo_angles = np.asarray(servo_angles, dtype=np.float64)
+        indexes = np.searchsorted(self._servo, servo_angles, side="left")
+        # bisect_left returns 0 for NaN, while searchsorted sorts NaN to the end
+        indexes[np.isnan(servo_angles)] = 0
+        return self._wing[np.minimum(indexes, self._last_index)]
+
+class ServoControllerParser(StructParser):
+    """
+    Parser for servo controller data.
+    """
+    name = "servocontroller"
+    struct_format = ">xBxxIffffffffff"
+    id_bytes = [(0, b'\x10')]
+    fields = ["status", "timestamp", "rudder", "elevator", "voltage", "i_rudder", "i_elevator", "trim",
+              "pos_rudder", "pos_elevator", "temp_rudder", "temp_elevator"]
+
+    def __init__(self):
+        super().__init__()
+        self.rudder_table = WingAngleTable(lambda x: 1.12e-4*x**4 + 5.84e-3*x**3 + -0.0205*x**2 + 4.21*x + 4.39 + 180)
+        self.elevator_table = WingAngleTable(lambda x: -1.49e-3*x**4 + -0.0401*x**3 + -0.267*x**2 + -6.07*x + -47.1 + 180)
 
     @staticmethod
     def get_keys() -> list[str]:
         return ["timestamp", "rudder", "elevator", "voltage", "i_rudder", "i_elevator", "trim", "status", \
                 "pos_rudder", "pos_elevator", "temp_rudder", "temp_elevator", "pos_rudder_wing", "pos_elevator_wing"]
 
-    @staticmethod
-    def get_data_length() -> int:
-        return 48 
-
-    @staticmethod
-    def get_id_bytes() -> list[(int, bytes)]:
-        return [(0, b'\x10')]
-
     def _rudder_servo_to_wing_angle(self, servo_angle: float) -> float:
-        left = bisect.bisect_left(self.list_r_servo, servo_angle)
-        return round(self.list_r[left][1], 2)   # np.float64の小数点がきれいに表示されないため、roundで小数点以下2桁に丸める
+        return self.rudder_table.lookup(servo_angle)
 
     def _elevator_servo_to_wing_angle(self, servo_angle: float) -> float:
-        left = bisect.bisect_left(self.list_e_servo, servo_angle)
-        return round(self.list_e[left][1], 2)
+        return self.elevator_table.lookup(servo_angle)
+
+    def servo_to_wing_angles(self, pos_rudder: np.ndarray, pos_elevator: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Converts whole arrays of servo positions to wing angles at once, e.g. for log replay.
+        Returns (pos_rudder_wing, pos_elevator_wing).
+        """
+        return self.rudder_table.lookup_array(pos_rudder), self.elevator_table.lookup_array(pos_elevator)
 
     def parse(self, data: bytes) -> dict:
-        _id,status,timestamp,rudder,elevator,voltage,i_rudder,i_elevator,trim,pos_rudder,pos_elevator,temp_rudder,temp_elevator=self.parser.unpack(data)
+        parsed_data = super().parse(data)
+        parsed_data["pos_rudder_wing"] = self._rudder_servo_to_wing_angle(parsed_data["pos_rudder"])
+        parsed_data["pos_elevator_wing"] = self._elevator_servo_to_wing_angle(parsed_data["pos_elevator"])
+        return parsed_data
+
+    def parse_columns(self, records: np.ndarray) -> dict[str, np.ndarray]:
+        columns = super().parse_columns(records)
+        columns["pos_rudder_wing"], columns["pos_elevator_wing"] = self.servo_to_wing_angles(columns["pos_rudder"], columns["pos_elevator"])
+        return columns
 
-        return {
-            "timestamp": timestamp,
-            "rudder": rudder,
-            "elevator": elevator,
-            "voltage": voltage,
-            "i_rudder": i_rudder,
-            "i_elevator": i_elevator,
-            "trim": trim,
-            "status": status,
-            "pos_rudder": pos_rudder,
-            "pos_elevator": pos_elevator,
-            "temp_rudder": temp_rudder,
-            "temp_elevator": temp_elevator,
-            "pos_rudder_wing": self._rudder_servo_to_wing_angle(pos_rudder),  # Placeholder for wing position
-            "pos_elevator_wing": self._elevator_servo_to_wing_angle(pos_elevator)  # Placeholder for wing position
-        }
-        
 parser = ServoControllerParser()
\ No newline at end of file
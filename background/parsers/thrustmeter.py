@@ -4,12 +4,7 @@ class ThrustmeterParser(tachometer.StrainAndCadenceParser):
     """
     Parser for thrustmeter sensor data.
     """
-    @staticmethod
-    def get_name() -> str:
-        return "thrustmeter"
+    name = "thrustmeter"
+    id_bytes = [(0, b'\x21')]  # Assuming the first byte is the ID for thrustmeter sensor
 
-    @staticmethod
-    def get_id_bytes() -> list[(int, bytes)]:
-        return [(0, b'\x21')]  # Assuming the first byte is the ID for thrustmeter sensor
-
-parser = ThrustmeterParser()
\ No newline at end of file
+parser = ThrustmeterParser()
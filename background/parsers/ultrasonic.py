@@ -1,38 +1,12 @@
-from background.abstractparser import AbstractParser
-import struct
+from background.structparser import StructParser
 
-class UltrasonicParser(AbstractParser):
+class UltrasonicParser(StructParser):
     """
     Parser for ultrasonic sensor data.
     """
-    def __init__(self):
-        self.parser=struct.Struct(">BxxxIff")
+    name = "ultrasonic"
+    struct_format = ">xxxxIff"
+    id_bytes = [(0, b'\x50')]  # Assuming the first byte is the ID for ultrasonic sensor
+    fields = ["timestamp", "altitude", "temperature"]
 
-    @staticmethod
-    def get_name() -> str:
-        return "ultrasonic"
-
-    @staticmethod
-    def get_keys() -> list[str]:
-        return ["timestamp", "altitude", "temperature"]
-
-    @staticmethod
-    def get_data_length() -> int:
-        return 16
-
-    @staticmethod
-    def get_id_bytes() -> list[(int, bytes)]:
-        return [(0, b'\x50')]  # Assuming the first byte is the ID for ultrasonic sensor
-
-    def parse(self, data: bytes) -> dict:
-        if len(data) != self.get_data_length():
-            raise ValueError(f"Expected {self.get_data_length()} bytes, got {len(data)} bytes")
-
-        _id, timestamp, altitude, temperature = self.parser.unpack(data)
-        return {
-            "timestamp": timestamp,
-            "altitude": altitude,
-            "temperature": temperature
-        }
-
-parser = UltrasonicParser()
\ No newline at end of file
+parser = UltrasonicParser()
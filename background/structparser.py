@@ -0,0 +1,134 @@
+import re
+import struct
+
+import numpy as np
+
+from background.abstractparser import AbstractParser
+
+_FORMAT_TOKEN = re.compile(r"(\d*)([xcbB?hHiIlLqQnNefdspP])")
+_BYTE_ORDERS = {"@": "=", "=": "=", "<": "<", ">": ">", "!": ">"}
+
+def struct_format_to_dtype(struct_format: str, names: list[str]) -> np.dtype:
+    """
+    Converts a struct module format to a numpy structured dtype with the given field names.
+    Padding bytes ('x') are skipped, so names must match the unpacked values.
+    Raises ValueError for formats that numpy cannot express (e.g. 'p', 'P', 'n').
+    """
+    byte_order = struct_format[0] if struct_format and struct_format[0] in _BYTE_ORDERS else "@"
+    body = struct_format[1:] if struct_format and struct_format[0] in _BYTE_ORDERS else struct_format
+    prefix = struct_format[:len(struct_format) - len(body)]
+    order_prefix = prefix
+    np_order = _BYTE_ORDERS[byte_order]
+    formats = []
+    offsets = []
+    for count, code in _FORMAT_TOKEN.findall(body.replace(" ", "")):
+        count = int(count) if count else 1
+        code_size = struct.calcsize(order_prefix + code)
+        if code == "x":
+            prefix += f"{count}x"
+            continue
+        if code == "s":
+            # Offset of the value, including any native alignment before it
+            offsets.append(struct.calcsize(prefix + f"{count}s") - count)
+            formats.append(f"S{count}")
+            prefix += f"{count}s"
+            continue
+        if code in "bhilq":
+            np_code = f"{np_order}i{code_size}"
+        elif code in "BHILQc":
+            np_code = f"{np_order}u{code_size}"
+        elif code in "efd":
+            np_code = f"{np_order}f{code_size}"
+        elif code == "?":
+            np_code = "?"
+        else:
+            raise ValueError(f"Format code '{code}' cannot be converted to a numpy dtype")
+        for _ in range(count):
+            offsets.append(struct.calcsize(prefix + code) - code_size)
+            formats.append(np_code)
+            prefix += code
+    if len(formats) != len(names):
+        raise ValueError(f"struct_format '{struct_format}' has {len(formats)} values, but {len(names)} names are given")
+    return np.dtype({"names": list(names), "formats": formats, "offsets": offsets,
+                     "itemsize": struct.calcsize(struct_format)})
+
+class StructParser(AbstractParser):
+    """
+    Base class for parsers whose data is one fixed C struct.
+
+    A subclass only declares the following class attributes:
+        name:          the parser name returned by get_name()
+        struct_format: the struct module format of the whole data.
+                       Bytes that are not values (id bytes, padding) are written as 'x'.
+        id_bytes:      returned by get_id_bytes()
+        fields:        names of the unpacked values, in the order of struct_format
+        history_capacity: (optional) returned by get_history_capacity()
+
+    get_data_length() is derived from struct_format, and parse() returns
+    dict(zip(fields, values)). The schema is checked when the parser is created.
+    """
+    name: str = None
+    struct_format: str = None
+    id_bytes: list[(int, bytes)] = []
+    fields: list[str] = []
+    history_capacity: int = 1000
+
+    def __init__(self):
+        if self.struct_format is None:
+            raise TypeError(f"{type(self).__name__} must define struct_format")
+        self.parser = struct.Struct(self.struct_format)
+        self._fields = tuple(self.fields)
+        self._data_length = self.parser.size
+        self._unpack = self.parser.unpack
+        self._dtype = None
+        self.check_schema()
+
+    def check_schema(self):
+        """
+        Raises ValueError if fields do not match the values unpacked by struct_format.
+        """
+        value_count = len(self.parser.unpack(bytes(self._data_length)))
+        if value_count != len(self._fields):
+            raise ValueError(f"{type(self).__name__}: struct_format '{self.struct_format}' unpacks {value_count} values, "
+                             f"but {len(self._fields)} fields are given")
+        if len(set(self._fields)) != len(self._fields):
+            raise ValueError(f"{type(self).__name__}: fields must not contain duplicates")
+
+    @classmethod
+    def get_name(cls) -> str:
+        return cls.name
+
+    @classmethod
+    def get_keys(cls) -> list[str]:
+        return list(cls.fields)
+
+    @classmethod
+    def get_data_length(cls) -> int:
+        return struct.calcsize(cls.struct_format)
+
+    @classmethod
+    def get_id_bytes(cls) -> list[(int, bytes)]:
+        return cls.id_bytes
+
+    def get_history_capacity(self) -> int:
+        return self.history_capacity
+
+    def get_dtype(self) -> np.dtype:
+        """
+        Returns the numpy structured dtype of one frame, with fields as its names.
+        """
+        if self._dtype is None:
+            self._dtype = struct_format_to_dtype(self.struct_format, self._fields)
+        return self._dtype
+
+    def parse_columns(self, records: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Converts an array of get_dtype() records into {key: column}.
+        Override this together with parse() when parse() changes or adds values.
+        """
+        return {name: records[name] for name in self._fields}
+
+    def parse(self, data: bytes) -> dict:
+        if len(data) != self._data_length:
+            raise ValueError(f"Expected {self._data_length} bytes, got {len(data)} bytes")
+        return dict(zip(self._fields, self._unpack(data)))
@@ -0,0 +1,184 @@
+from collections import deque
+import json
+import math
+import struct
+import threading
+
+RECORD_HEADER = struct.Struct("<BQ")  # parser index, received time in ms
+UNKNOWN_PARSER = 0xff
+MODES = ("raw", "packed")
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+
+def encode_ws_frame(payload: bytes, opcode: int = OPCODE_BINARY) -> bytes:
+    """
+    Encodes one unmasked (server to client) WebSocket frame.
+    The result can be sent as is to every client, so each record is encoded only once.
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class PackedLayout:
+    """
+    Layout of the packed records of one parser: RECORD_HEADER followed by
+    one little endian float64 per numeric key. Keys whose values are not numbers are left out.
+    """
+    def __init__(self, parser_name: str, parser_index: int, parsed_data: dict):
+        self.keys = [key for key, value in parsed_data.items()
+                     if key != "received_time" and isinstance(value, (int, float)) and not isinstance(value, bool)]
+        self._struct = struct.Struct(RECORD_HEADER.format + "d" * len(self.keys))
+        self.parser_index = parser_index
+        self.message = encode_ws_frame(json.dumps({"type": "layout", "parser": parser_name, "index": parser_index,
+                                                   "keys": self.keys}).encode(), OPCODE_TEXT)
+
+    def pack(self, received_time: int, parsed_data: dict) -> bytes:
+        return self._struct.pack(self.parser_index, received_time,
+                                 *[parsed_data.get(key, math.nan) for key in self.keys])
+
+
+class TelemetrySubscription:
+    """
+    Bounded queue of encoded WebSocket frames for one client.
+    When the client is too slow and the queue is full, the oldest frame is dropped.
+
+    every maps a parser name to N, so that only every Nth record of that parser is sent.
+    """
+    def __init__(self, mode: str, parser_names: set[str] | None, every: dict[str, int], default_every: int, size: int):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode}")
+        self.mode = mode
+        self.parser_names = parser_names
+        self.every = every
+        self.default_every = max(default_every, 1)
+        self._counters = {}
+        self._messages = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self.dropped_count = 0
+        self.closed = False
+        # Parsers whose layout message has been queued, for the packed mode
+        self.known_layouts = set()
+
+    def accepts(self, parser_name: str | None) -> bool:
+        """
+        Called by the publisher only, so the counters need no lock.
+        """
+        if self.parser_names is not None and parser_name not in self.parser_names:
+            return False
+        every = self.every.get(parser_name, self.default_every)
+        if every <= 1:
+            return True
+        count = self._counters.get(parser_name, 0)
+        self._counters[parser_name] = count + 1
+        return count % every == 0
+
+    def push(self, *messages: bytes):
+        with self._condition:
+            for message in messages:
+                if len(self._messages) == self._messages.maxlen:
+                    self.dropped_count += 1
+                self._messages.append(message)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> list[bytes]:
+        """
+        Waits up to timeout seconds and returns all queued frames (possibly none).
+        """
+        with self._condition:
+            if not self._messages and not self.closed:
+                self._condition.wait(timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+        return messages
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class TelemetryFeed:
+    """
+    Fan-out of decoded frames and parsed records to WebSocket clients (see httpserver/websocketserver.py).
+
+    Each record is encoded into a WebSocket frame at most once per mode, and the same bytes are
+    queued for every subscriber. Nothing is encoded while there are no subscribers.
+
+    Binary messages start with RECORD_HEADER (parser index, received time):
+        raw:    followed by the decoded frame. Frames no parser can handle have index UNKNOWN_PARSER.
+        packed: followed by float64 values, whose keys are sent in a "layout" text message first.
+    """
+    def __init__(self, parser_names: list[str], subscriber_queue_size: int = 1024):
+        self.parser_names = list(parser_names)
+        self._parser_indexes = {name: i for i, name in enumerate(self.parser_names)}
+        self.subscriber_queue_size = subscriber_queue_size
+        self._layouts = {}
+        self._lock = threading.Lock()
+        # Replaced, not modified, so that publish() can iterate it without a lock
+        self._subscriptions = ()
+
+    def hello_message(self, mode: str) -> bytes:
+        return encode_ws_frame(json.dumps({"type": "hello", "mode": mode, "parsers": self.parser_names}).encode(), OPCODE_TEXT)
+
+    def subscribe(self, mode: str = "packed", parser_names: set[str] | None = None,
+                  every: dict[str, int] = None, default_every: int = 1) -> TelemetrySubscription:
+        subscription = TelemetrySubscription(mode, parser_names, every or {}, default_every, self.subscriber_queue_size)
+        with self._lock:
+            subscription.push(self.hello_message(mode))
+            if mode == "packed":
+                for name, layout in self._layouts.items():
+                    if subscription.parser_names is None or name in subscription.parser_names:
+                        subscription.push(layout.message)
+                        subscription.known_layouts.add(name)
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: TelemetrySubscription):
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription.close()
+
+    def get_subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, parser_name: str | None, frame: bytes, received_time: int, parsed_data: dict = None):
+        """
+        Called by the Background worker for every frame. parser_name is None for frames no parser can handle.
+        """
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return
+        raw_message = None
+        packed_message = None
+        layout = None
+        for subscription in subscriptions:
+            if not subscription.accepts(parser_name):
+                continue
+            if subscription.mode == "raw":
+                if raw_message is None:
+                    raw_message = encode_ws_frame(RECORD_HEADER.pack(self._parser_indexes.get(parser_name, UNKNOWN_PARSER),
+                                                                     received_time) + bytes(frame))
+                subscription.push(raw_message)
+            elif parsed_data is not None:
+                if packed_message is None:
+                    layout = self._get_layout(parser_name, parsed_data)
+                    packed_message = encode_ws_frame(layout.pack(received_time, parsed_data))
+                if parser_name in subscription.known_layouts:
+                    subscription.push(packed_message)
+                else:
+                    subscription.known_layouts.add(parser_name)
+                    subscription.push(layout.message, packed_message)
+
+    def _get_layout(self, parser_name: str, parsed_data: dict) -> PackedLayout:
+        layout = self._layouts.get(parser_name)
+        if layout is None:
+            with self._lock:
+                layout = self._layouts[parser_name] = PackedLayout(parser_name, self._parser_indexes[parser_name], parsed_data)
+        return layout
@@ -0,0 +1,72 @@
+"""
+# baseline_cobs.py
+Copy of the list-based COBS codec that lib/cobs.py shipped with before the bytes-native rewrite.
+It is kept only so that benchmark/bench_cobs.py can measure the speedup against it.
+"""
+
+def cobs_decode(enc_data:list[int], index:int=0):
+    if type(enc_data) is not list and type(enc_data) is not str and type(enc_data) is not bytes:
+        raise TypeError("enc_data must be a list of integers, a string, or bytes")
+    dec_data:list[int] = []
+    enc_idx = index
+
+    next_0x00 = 0
+    next_is_overhead = True
+    is_end = False
+
+    while enc_idx < len(enc_data):
+        if (enc_data[enc_idx] < 0 or enc_data[enc_idx] > 255):
+            raise ValueError("enc_data must contain integers in the range 0-255")
+        if next_0x00 != 0:
+            dec_data.append(enc_data[enc_idx])
+            enc_idx += 1
+        else:
+            if enc_data[enc_idx] == 0x00:
+                is_end = True
+                break
+
+            if next_is_overhead == True:
+                pass
+            else:
+                dec_data.append(0)
+
+            next_0x00 = enc_data[enc_idx]
+            enc_idx += 1
+
+            if next_0x00 == 0xff:
+                next_is_overhead = True
+            else:
+                next_is_overhead = False
+        next_0x00 -= 1
+
+    if is_end == False:
+        return [], enc_idx+1
+    return dec_data, enc_idx+1
+
+
+def cobs_encode(data:list[int]):
+    if type(data) is not list and type(data) is not str and type(data) is not bytes:
+        raise TypeError("data must be a list of integers, a string, or bytes")
+    encoded_data:list[int] = []
+    encoding_block:list[int] = [0x00]
+
+    for byte in data:
+        if (byte < 0 or byte > 255):
+            raise ValueError("data must contain integers in the range 0-255")
+        if len(encoding_block) == 255:
+            encoding_block[0] = len(encoding_block)
+            encoded_data.extend(encoding_block)
+            encoding_block = [0x00]
+
+        if byte == 0x00:
+            encoding_block[0] = len(encoding_block)
+            encoded_data.extend(encoding_block)
+            encoding_block = [0x00]
+        else:
+            encoding_block.append(byte)
+
+    encoding_block[0] = len(encoding_block)
+    encoded_data.extend(encoding_block)
+    encoded_data.append(0)
+
+    return encoded_data
@@ -0,0 +1,87 @@
+"""
+# bench_cobs.py
+Compares the throughput of lib.cobs against the original list-based codec
+(benchmark/baseline_cobs.py) and the `cobs` package pinned in requirements.txt.
+
+    $ python3 benchmark/bench_cobs.py [--zero-ratio 0.15] [--frames 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+# Add the parent directory to sys.path to import lib.cobs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cobs.cobs
+import lib.cobs
+import benchmark.baseline_cobs as baseline_cobs
+
+
+def make_frames(count: int, zero_ratio: float = 0.15, seed: int = 0) -> list[bytes]:
+    """
+    Returns frames that look like sensor packets (8-48 bytes).
+    Each byte is 0x00 with probability zero_ratio. Packed sensor structs have
+    padding and small integers, so 0.1-0.2 is typical for the parsers in background/parsers.
+    """
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        length = rng.choice([8, 16, 24, 28, 44, 48])
+        frames.append(bytes(0 if rng.random() < zero_ratio else rng.randrange(1, 256) for _ in range(length)))
+    return frames
+
+
+def run(frame_count: int = 2000, zero_ratio: float = 0.15, repeat: int = 5) -> dict[str, float]:
+    """
+    Runs each codec over the same frames and returns the best time per frame in microseconds.
+    """
+    frames = make_frames(frame_count, zero_ratio)
+    encoded_frames = [lib.cobs.cobs_encode_bytes(frame) for frame in frames]
+    encoded_lists = [list(frame) for frame in encoded_frames]
+    frame_lists = [list(frame) for frame in frames]
+    stream = b''.join(encoded_frames)
+
+    def stream_decode():
+        decoder = lib.cobs.CobsStreamDecoder()
+        for _ in decoder.feed(stream):
+            pass
+
+    def package_stream_decode():
+        for frame in stream.split(b'\x00')[:-1]:
+            cobs.cobs.decode(frame)
+
+    def baseline_stream_decode():
+        data = list(stream)
+        index = 0
+        while index < len(data):
+            _, index = baseline_cobs.cobs_decode(data, index)
+
+    cases = {
+        "encode/baseline cobs_encode (list)": lambda: [baseline_cobs.cobs_encode(frame) for frame in frame_lists],
+        "encode/lib.cobs.cobs_encode (list wrapper)": lambda: [lib.cobs.cobs_encode(frame) for frame in frame_lists],
+        "encode/lib.cobs.cobs_encode_bytes": lambda: [lib.cobs.cobs_encode_bytes(frame) for frame in frames],
+        "encode/cobs.cobs.encode": lambda: [cobs.cobs.encode(frame) + b'\x00' for frame in frames],
+        "decode/baseline cobs_decode (list)": lambda: [baseline_cobs.cobs_decode(frame) for frame in encoded_lists],
+        "decode/lib.cobs.cobs_decode (list wrapper)": lambda: [lib.cobs.cobs_decode(frame) for frame in encoded_lists],
+        "decode/lib.cobs.cobs_decode_bytes": lambda: [lib.cobs.cobs_decode_bytes(frame) for frame in encoded_frames],
+        "decode/cobs.cobs.decode": lambda: [cobs.cobs.decode(frame[:-1]) for frame in encoded_frames],
+        "stream/baseline cobs_decode loop": baseline_stream_decode,
+        "stream/lib.cobs.CobsStreamDecoder": stream_decode,
+        "stream/bytes.split + cobs.cobs.decode": package_stream_decode,
+    }
+    results = {}
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results[name] = best / frame_count * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="COBS codec benchmark")
+    argparser.add_argument("--frames", type=int, default=2000, help="Number of frames (default: 2000)")
+    argparser.add_argument("--zero-ratio", type=float, default=0.15, help="Probability of a 0x00 byte in a frame (default: 0.15)")
+    args = argparser.parse_args()
+    for name, usec in run(args.frames, args.zero_ratio).items():
+        print(f"{name:45s} {usec:8.3f} us/frame")
@@ -0,0 +1,104 @@
+"""
+# bench_parsepool.py
+Compares parsing frames on one thread (Background without --parse-workers) with the
+worker processes of background/parsepool.py, for several batch sizes and worker counts.
+
+The pool pays for copying, pickling the results and building the dicts again in the main
+process, so it only wins once batches are large enough and there are free cores.
+The crossover is the smallest batch size where the pool parses more frames per second.
+
+    $ python3 benchmark/bench_parsepool.py [--frames 100000] [--workers 1,2,4] [--batch-sizes 16,64,256,1024,4096]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import warnings
+
+# Add the parent directory to sys.path to import background.parsepool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.parsepool import ParsePool
+from background.parsermanager import ParserManager
+from lib.cobs import CobsStreamDecoder
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "main-log.bin")
+
+
+def load_frames(count: int) -> list[bytes]:
+    """
+    Returns count frames of the recorded log, repeated as needed.
+    """
+    with open(LOG_PATH, "rb") as f:
+        frames = list(CobsStreamDecoder().feed(f.read()))
+    return (frames * (count // len(frames) + 1))[:count]
+
+
+def run_single(frames: list[bytes], batch_size: int) -> float:
+    """
+    Returns frames per second of ParserManager.parse_data() on this thread.
+    """
+    parser_manager = ParserManager()
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        [parser_manager.parse_data(frame) for frame in frames[i:i + batch_size]]
+    return len(frames) / (time.perf_counter() - start)
+
+
+def run_pool(frames: list[bytes], batch_size: int, worker_count: int) -> float:
+    """
+    Returns frames per second from the first submit() until the last result is handed back.
+    Starting the workers is not measured.
+    """
+    batch_count = (len(frames) + batch_size - 1) // batch_size
+    warmed_up = threading.Event()
+    done = threading.Event()
+
+    def on_result(item, parsed):
+        if item == "warmup":
+            warmed_up.set()
+        elif item == batch_count - 1:
+            done.set()
+
+    pool = ParsePool(worker_count, on_result)
+    pool.start()
+    try:
+        pool.submit("warmup", frames[:1])
+        warmed_up.wait()
+        # Give the other workers time to import the parsers as well
+        time.sleep(1.0)
+        start = time.perf_counter()
+        for i in range(batch_count):
+            pool.submit(i, frames[i * batch_size:(i + 1) * batch_size])
+        done.wait()
+        return len(frames) / (time.perf_counter() - start)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Parse pool benchmark")
+    argparser.add_argument("--frames", type=int, default=100000, help="Number of frames (default: 100000)")
+    argparser.add_argument("--workers", default="1,2,4", help="Comma separated worker counts (default: 1,2,4)")
+    argparser.add_argument("--batch-sizes", default="16,64,256,1024,4096", help="Comma separated batch sizes (default: 16,64,256,1024,4096)")
+    args = argparser.parse_args()
+    warnings.simplefilter("ignore")
+    frames = load_frames(args.frames)
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    print(f"{os.cpu_count()} CPUs, {len(frames)} frames")
+    print(f"{'batch size':>10s} {'single':>12s}" + "".join(f" {f'{count} workers':>12s}" for count in worker_counts))
+    crossovers = {count: None for count in worker_counts}
+    for batch_size in batch_sizes:
+        single = run_single(frames, batch_size)
+        row = f"{batch_size:10d} {single:12.0f}"
+        for count in worker_counts:
+            pooled = run_pool(frames, batch_size, count)
+            row += f" {pooled:12.0f}"
+            if pooled > single and crossovers[count] is None:
+                crossovers[count] = batch_size
+        print(row + "  frames/s")
+    for count, batch_size in crossovers.items():
+        print(f"{count} workers: " + (f"faster from batch size {batch_size}" if batch_size else "never faster than one thread"))
@@ -0,0 +1,321 @@
+"""
+# run.py
+Runs the benchmarks of the ingest pipeline and prints the results as JSON:
+
+    cobs.*        encoding, decoding and stream decoding of lib.cobs
+    parse.*       ParserManager.parse_data() for the frames of each parser
+    background.*  Background.process_batch() over the recorded log, with and without the log files
+    http.*        latency of GET /data with several clients at once, served by waitress (or --http-server asyncio)
+
+Results can be saved as a baseline and later runs compared against it. The comparison exits
+with status 1 when a result is worse than the baseline by more than --tolerance, so it can gate changes.
+
+    $ python3 benchmark/run.py -o baseline.json
+    $ python3 benchmark/run.py --baseline baseline.json --tolerance 0.2
+
+Metric names ending with _per_s are better when higher, the others (_ms) when lower.
+Compare only results of the same machine.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from queue import Queue
+
+# Add the parent directory to sys.path to import lib.cobs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import background.background as background
+from background.parsermanager import ParserManager
+from benchmark.bench_cobs import make_frames
+from benchmark.bench_parsepool import load_frames
+import lib.cobs
+from lib.log import setup_logging
+import serialhandler.serialhandler as serialhandler
+import shared_data
+from tools.simulator import make_frame
+
+SUITES = ("cobs", "parse", "background", "http")
+HTTP_SERVERS = ("waitress", "asyncio")
+
+
+def best_rate(func, count: int, repeat: int) -> float:
+    """
+    Runs func repeat times and returns count divided by the fastest run, i.e. items per second.
+    """
+    best = min(_timed(func) for _ in range(repeat))
+    return count / best
+
+
+def _timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_cobs(frame_count: int, repeat: int) -> dict[str, float]:
+    frames = make_frames(frame_count)
+    encoded_frames = [lib.cobs.cobs_encode_bytes(frame) for frame in frames]
+    stream = b"".join(encoded_frames)
+
+    def stream_decode():
+        for _ in lib.cobs.CobsStreamDecoder().feed(stream):
+            pass
+
+    stream_rate = best_rate(stream_decode, len(stream), repeat)
+    return {
+        "cobs.encode.frames_per_s": best_rate(lambda: [lib.cobs.cobs_encode_bytes(frame) for frame in frames], frame_count, repeat),
+        "cobs.decode.frames_per_s": best_rate(lambda: [lib.cobs.cobs_decode_bytes(frame) for frame in encoded_frames], frame_count, repeat),
+        "cobs.stream_decode.frames_per_s": stream_rate / len(stream) * frame_count,
+        "cobs.stream_decode.mb_per_s": stream_rate / 1e6,
+    }
+
+
+def bench_parse(frame_count: int, repeat: int) -> dict[str, float]:
+    parser_manager = ParserManager()
+    # Same seed, so every run parses the same bytes
+    rng = random.Random(0)
+    results = {}
+    for parser in parser_manager.parsers:
+        frames = [make_frame(parser, rng) for _ in range(64)]
+        frames = (frames * (frame_count // len(frames) + 1))[:frame_count]
+        results[f"parse.{parser.get_name()}.frames_per_s"] = best_rate(
+            lambda: [parser_manager.parse_data(frame) for frame in frames], frame_count, repeat)
+    return results
+
+
+class _NullLog:
+    """
+    Log sink that drops every record, to measure Background without writing the log files.
+    """
+    def put(self, *record):
+        pass
+
+
+def bench_background(frame_count: int, batch_size: int, repeat: int) -> dict[str, float]:
+    frames = load_frames(frame_count)
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for logging in (True, False):
+            best = None
+            for i in range(repeat):
+                shared_data.log_raw_file_path = os.path.join(temp_dir, f"mainlog-{logging}-{i}.bin")
+                shared_data.log_processed_file_path = os.path.join(temp_dir, f"processedlog-{logging}-{i}.txt")
+                background_instance = background.Background(Queue(), log_compression="none")
+                background_instance.open()
+                if not logging:
+                    background_instance._processed_log = _NullLog()
+                    background_instance._raw_logs = {shared_data.DEFAULT_PORT: _NullLog()}
+                received_time = int(time.time() * 1000)
+                batches = [[(frame, received_time) for frame in frames[j:j + batch_size]]
+                           for j in range(0, len(frames), batch_size)]
+                start = time.perf_counter()
+                for batch in batches:
+                    background_instance.process_batch(shared_data.DEFAULT_PORT, batch)
+                elapsed = time.perf_counter() - start
+                background_instance.close()
+                best = elapsed if best is None else min(best, elapsed)
+            results[f"background.{'logging' if logging else 'no_logging'}.frames_per_s"] = frame_count / best
+    return results
+
+
+def serve_in_thread(app, server: str, threads: int):
+    """
+    Serves app on a free port of 127.0.0.1 from another thread with waitress or the asyncio server of
+    httpserver/asyncwsgi.py. Returns (port, stop), where stop() shuts the server down.
+    """
+    if server == "waitress":
+        import waitress
+
+        wsgi_server = waitress.create_server(app, host="127.0.0.1", port=0, threads=threads)
+        stopping = threading.Event()
+
+        def loop():
+            # Like wsgi_server.run(), but checks for stop() after each poll,
+            # so that the sockets are not closed while they are polled
+            while not stopping.is_set():
+                wsgi_server.asyncore.loop(timeout=0.05, map=wsgi_server._map, count=1)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+
+        def stop():
+            stopping.set()
+            thread.join()
+            wsgi_server.close()
+
+        return wsgi_server.effective_port, stop
+
+    import asyncio
+    from httpserver.asyncwsgi import AsyncWSGIServer
+
+    asyncio_server = AsyncWSGIServer(app, "127.0.0.1", 0, threads=threads)
+    started = threading.Event()
+    running = {}
+
+    async def serve():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        running["port"] = (await asyncio_server.start()).sockets[0].getsockname()[1]
+        started.set()
+        try:
+            await asyncio_server.serve()
+        except asyncio.CancelledError:
+            pass
+
+    # asyncio.run() also ends the connection handlers that are still open
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    started.wait()
+
+    def stop():
+        running["loop"].call_soon_threadsafe(running["task"].cancel)
+        thread.join()
+
+    return running["port"], stop
+
+
+def bench_http(client_count: int, request_count: int, server: str = "waitress") -> dict[str, float]:
+    """
+    Serves /data of a Background that has processed the recorded log, and measures
+    the requests of client_count clients, each sending request_count requests over one keep-alive connection.
+    """
+    from serialserver import create_app
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shared_data.log_raw_file_path = os.path.join(temp_dir, "mainlog.bin")
+        shared_data.log_processed_file_path = os.path.join(temp_dir, "processedlog.txt")
+        background_instance = background.Background(Queue(), log_compression="none")
+        background_instance.open()
+        received_time = int(time.time() * 1000)
+        background_instance.process_batch(shared_data.DEFAULT_PORT, [(frame, received_time) for frame in load_frames(10000)])
+        app = create_app(serialhandler.serial_handler(), background_instance)
+        port, stop = serve_in_thread(app, server, max(client_count, 4))
+        latencies = [[] for _ in range(client_count)]
+        errors = []
+
+        def client(durations: list[float]):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            try:
+                for _ in range(request_count):
+                    start = time.perf_counter()
+                    connection.request("GET", "/data")
+                    response = connection.getresponse()
+                    response.read()
+                    durations.append(time.perf_counter() - start)
+                    if response.status != 200:
+                        errors.append(response.status)
+            finally:
+                connection.close()
+
+        try:
+            threads = [threading.Thread(target=client, args=(durations,)) for durations in latencies]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            stop()
+            background_instance.close()
+    if errors:
+        raise RuntimeError(f"GET /data failed {len(errors)} times, e.g. with status {errors[0]}")
+    # Exact percentiles; the buckets of background.latency are too coarse to compare runs
+    durations = sorted(duration for client_durations in latencies for duration in client_durations)
+    return {
+        "http.data.requests_per_s": len(durations) / elapsed,
+        "http.data.mean_ms": sum(durations) / len(durations) * 1000,
+        "http.data.p50_ms": durations[len(durations) // 2] * 1000,
+        "http.data.p99_ms": durations[min(int(len(durations) * 0.99), len(durations) - 1)] * 1000,
+    }
+
+
+def run(suites: tuple[str, ...] = SUITES, frame_count: int = 20000, batch_size: int = 256, repeat: int = 3,
+        client_count: int = 8, request_count: int = 200, http_server: str = "waitress") -> dict:
+    """
+    Runs the given suites and returns {"environment": {...}, "results": {metric: value}}.
+    """
+    results = {}
+    if "cobs" in suites:
+        results.update(bench_cobs(frame_count, repeat))
+    if "parse" in suites:
+        results.update(bench_parse(frame_count, repeat))
+    if "background" in suites:
+        results.update(bench_background(frame_count, batch_size, repeat))
+    if "http" in suites:
+        results.update(bench_http(client_count, request_count, http_server))
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "time": int(time.time()),
+            "options": {"frames": frame_count, "batch_size": batch_size, "repeat": repeat,
+                        "clients": client_count, "requests": request_count, "http_server": http_server},
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[dict]:
+    """
+    Returns {"metric", "baseline", "current", "change", "regression"} for each metric in both.
+    change is the relative improvement, negative when the result got worse.
+    """
+    comparisons = []
+    for metric, current in results.items():
+        previous = baseline.get(metric)
+        if not previous:
+            continue
+        change = current / previous - 1 if metric.endswith("_per_s") else previous / current - 1 if current else 0.0
+        comparisons.append({"metric": metric, "baseline": previous, "current": current, "change": change,
+                            "regression": change < -tolerance})
+    return comparisons
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmarks of the ingest pipeline")
+    argparser.add_argument("--suites", default=",".join(SUITES), help=f"Comma separated suites to run (default: {','.join(SUITES)})")
+    argparser.add_argument("--frames", type=int, default=20000, help="Number of frames per measurement (default: 20000)")
+    argparser.add_argument("--batch-size", type=int, default=256, help="Frames per batch given to Background (default: 256)")
+    argparser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the best is kept (default: 3)")
+    argparser.add_argument("--clients", type=int, default=8, help="Concurrent HTTP clients (default: 8)")
+    argparser.add_argument("--requests", type=int, default=200, help="Requests per HTTP client (default: 200)")
+    argparser.add_argument("--http-server", choices=HTTP_SERVERS, default="waitress",
+                           help="Server of the http suite: waitress, or asyncio for httpserver/asyncwsgi.py (default: waitress)")
+    argparser.add_argument("-o", "--output", default=None, help="Also write the results to this JSON file")
+    argparser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare with")
+    argparser.add_argument("--tolerance", type=float, default=0.1,
+                           help="Relative slowdown against the baseline that counts as a regression (default: 0.1)")
+    args = argparser.parse_args()
+    suites = tuple(suite.strip() for suite in args.suites.split(","))
+    unknown_suites = set(suites) - set(SUITES)
+    if unknown_suites:
+        argparser.error(f"unknown suites: {', '.join(sorted(unknown_suites))}")
+
+    # Unparseable frames of the recorded log would be reported at WARNING
+    setup_logging("ERROR")
+    output = run(suites, args.frames, args.batch_size, args.repeat, args.clients, args.requests, args.http_server)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        output["comparison"] = compare(output["results"], baseline["results"], args.tolerance)
+        regressions = [comparison for comparison in output["comparison"] if comparison["regression"]]
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    for comparison in regressions:
+        print(f"Regression: {comparison['metric']} {comparison['baseline']:.4g} -> {comparison['current']:.4g} "
+              f"({comparison['change']:+.1%})", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
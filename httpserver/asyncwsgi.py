@@ -0,0 +1,225 @@
+"""
+# asyncwsgi.py
+Minimal HTTP/1.1 server on asyncio that runs a WSGI app (the Flask app of serialserver.py).
+
+Connections, keep-alive and sending are handled by the event loop; the app itself runs in a
+thread pool, because Flask handlers block. Streaming responses are sent chunk by chunk as the app yields them.
+A response iterable that can also be iterated with async for (the EventStream of /stream) is iterated
+on the event loop, so open streams hold no pool thread while they wait for events.
+Other streaming responses take a pool thread for each chunk.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+import io
+import socket
+import sys
+from urllib.parse import unquote
+
+MAX_HEADER_SIZE = 65536
+MAX_BODY_SIZE = 1 << 20
+
+_END = object()
+_REASONS = {400: "Bad Request", 413: "Payload Too Large", 501: "Not Implemented"}
+
+
+class AsyncWSGIServer:
+    """
+    Serves app on host:port. threads is the size of the pool that runs the app,
+    and keep_alive is how many seconds an idle connection is kept open.
+    """
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 7878, threads: int = 16, keep_alive: float = 120):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+        self._server = None
+
+    async def start(self) -> asyncio.Server:
+        """
+        Starts listening. The bound address is in the sockets of the returned server, e.g. for port 0.
+        """
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE)
+        return self._server
+
+    async def serve(self):
+        """
+        Serves until cancelled.
+        """
+        if self._server is None:
+            await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keep_alive)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+                request = self._parse_head(head)
+                if request is None:
+                    await self._send_error(writer, 400)
+                    return
+                method, target, version, headers = request
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._send_error(writer, 501)
+                    return
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    await self._send_error(writer, 400)
+                    return
+                if length < 0 or length > MAX_BODY_SIZE:
+                    await self._send_error(writer, 413)
+                    return
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                environ = self._environ(method, target, version, headers, body, writer)
+                if not await self._respond(environ, writer, version, keep_alive):
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> tuple[str, str, str, dict[str, str]] | None:
+        lines = head[:-4].decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3 or parts[2] not in ("HTTP/1.0", "HTTP/1.1"):
+            return None
+        headers = {}
+        for line in lines[1:]:
+            name, separator, value = line.partition(":")
+            if not separator:
+                return None
+            name = name.strip().lower()
+            value = value.strip()
+            # Repeated headers are joined as RFC 9110 allows
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+        return parts[0], parts[1], parts[2], headers
+
+    def _environ(self, method: str, target: str, version: str, headers: dict[str, str], body: bytes,
+                 writer: asyncio.StreamWriter) -> dict:
+        path, _, query = target.partition("?")
+        peer = writer.get_extra_info("peername") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": str(self.port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": peer[0],
+            "REMOTE_PORT": str(peer[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers.items():
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name == "content-length":
+                environ["CONTENT_LENGTH"] = value
+            else:
+                environ["HTTP_" + name.upper().replace("-", "_")] = value
+        return environ
+
+    def _call_app(self, environ: dict):
+        """
+        Runs the app in a pool thread. Responses with Content-Length are read completely here,
+        so that short responses need only one hop to the pool.
+        Returns (status, headers, body bytes or the iterable to stream).
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = headers
+            return lambda data: None
+
+        result = self.app(environ, start_response)
+        headers = response["headers"]
+        if any(name.lower() == "content-length" for name, _ in headers):
+            try:
+                return response["status"], headers, b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        return response["status"], headers, result
+
+    async def _respond(self, environ: dict, writer: asyncio.StreamWriter, version: str, keep_alive: bool) -> bool:
+        """
+        Sends the response of one request. Returns whether the connection stays open.
+        """
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self._executor, self._call_app, environ)
+        streaming = not isinstance(body, bytes)
+        # Responses to HEAD, 204 and 304 have no body, whatever the app returns
+        send_body = environ["REQUEST_METHOD"] != "HEAD" and status[:3] not in ("204", "304")
+        chunked = streaming and send_body and version == "HTTP/1.1"
+        if streaming and send_body and not chunked:
+            # An HTTP/1.0 client can only tell the end of the body by the closed connection
+            keep_alive = False
+        lines = [f"{version} {status}", f"Date: {formatdate(usegmt=True)}", "Server: serial-server"]
+        lines += [f"{name}: {value}" for name, value in headers if name.lower() not in ("connection", "transfer-encoding")]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not streaming:
+            if send_body:
+                writer.write(body)
+            await writer.drain()
+            return keep_alive
+
+        async_iterator = body.__aiter__() if hasattr(body, "__aiter__") else None
+        iterator = iter(body) if async_iterator is None else None
+        try:
+            # Without a body the stream is not read at all, as it may never end
+            while send_body:
+                if async_iterator is not None:
+                    chunk = await anext(async_iterator, _END)
+                else:
+                    chunk = await loop.run_in_executor(self._executor, next, iterator, _END)
+                if chunk is _END:
+                    break
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            # Lets the app clean up, e.g. unsubscribe a stream whose client went away
+            if async_iterator is not None:
+                body.close()
+            elif hasattr(body, "close"):
+                await loop.run_in_executor(self._executor, body.close)
+        return keep_alive
+
+    @staticmethod
+    async def _send_error(writer: asyncio.StreamWriter, status: int):
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,77 @@
+import asyncio
+
+from background.broadcaster import Broadcaster, Event, Subscription
+
+
+class EventStream:
+    """
+    Body of a /stream response: the Server-Sent Events of one subscription, as bytes.
+
+    Threaded servers (Flask, waitress) iterate it, and each open stream waits in get() on one of their threads.
+    httpserver/asyncwsgi.py iterates it with async for instead, which waits on the event loop,
+    so idle streams do not hold a thread of the pool that runs the other requests.
+    Closing it unsubscribes.
+    """
+    def __init__(self, broadcaster: Broadcaster, subscription: Subscription, keep_alive: float = 15.0):
+        self.broadcaster = broadcaster
+        self.subscription = subscription
+        self.keep_alive = keep_alive
+        self._started = False
+        self._wake = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if not self._started:
+            self._started = True
+            return self._retry()
+        if self.subscription.closed:
+            raise StopIteration
+        return self._format(self.subscription.get(timeout=self.keep_alive))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if not self._started:
+            self._started = True
+            loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self.subscription.set_listener(lambda: _call_soon(loop, self._wake.set))
+            return self._retry()
+        if self.subscription.closed:
+            raise StopAsyncIteration
+        self._wake.clear()
+        # The listener fires only for an event that arrives in the empty queue, so empty it before waiting
+        events = self.subscription.get(timeout=0)
+        if not events:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.keep_alive)
+            except asyncio.TimeoutError:
+                pass
+            events = self.subscription.get(timeout=0)
+        return self._format(events)
+
+    def close(self):
+        self.broadcaster.unsubscribe(self.subscription)
+
+    @staticmethod
+    def _retry() -> bytes:
+        # Tell the client how long to wait before reconnecting
+        return b"retry: 1000\n\n"
+
+    @staticmethod
+    def _format(events: list[Event]) -> bytes:
+        if not events:
+            # Comment line, keeps proxies from closing an idle connection
+            return b": keep-alive\n\n"
+        return "".join(f"id: {event.seq}\nevent: {event.parser_name}\ndata: {event.to_json()}\n\n" for event in events).encode()
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback):
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        # The loop was closed, e.g. at shutdown; the publisher must not fail because of it
+        pass
@@ -1,16 +1,67 @@
-from flask import Blueprint, current_app, request, jsonify
+import json
+import math
+import time
+
+from flask import Blueprint, Response, current_app, g, request, jsonify
 
 import shared_data
 import lib.cobs
+from httpserver.eventstream import EventStream
+from httpserver.jsoncache import CachedJson, SnapshotJsonCache
+from httpserver.metrics import PROMETHEUS_CONTENT_TYPE, PipelineMetrics
 
 
 app = Blueprint("api", __name__)
+json_cache = SnapshotJsonCache()
+# port name -> cache of that port's snapshots
+port_json_caches = {}
+metrics = PipelineMetrics()
+
+@app.before_app_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_app_request
+def _record_request(response: Response) -> Response:
+    start = g.get("request_start")
+    if start is not None:
+        # The rule, e.g. /data/<parsername>, so that every parser does not get its own series
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.record_request(endpoint, time.perf_counter() - start)
+    return response
+
+def _request_body() -> dict:
+    return request.get_json(silent=True) or {}
 
 @app.route('/serial/state', methods=['GET'])
 def get_serial_state():
-    with shared_data.state_lock:
-        state = shared_data.serial_state.name
-    return jsonify({"state": state})
+    """
+    With wait, waits up to that many seconds until a port changes its state after version since
+    (default: the current version), so that clients can follow the transitions without polling.
+    """
+    serial_handler_instance = current_app.config["serial_handler_instance"]
+    port_name = request.args.get("port")
+    if port_name is not None and port_name not in serial_handler_instance.ports:
+        return jsonify({"error": "Port not found", "available": list(serial_handler_instance.ports.keys())}), 404
+    wait = request.args.get("wait")
+    if wait is not None:
+        try:
+            timeout = min(float(wait), 60.0)
+            since = request.args.get("since")
+            since = int(since) if since is not None else serial_handler_instance.get_states_with_version()[1]
+        except ValueError:
+            return jsonify({"error": "wait and since must be numbers"}), 400
+        if not math.isfinite(timeout):
+            # A NaN deadline never passes, so the request would wait forever
+            return jsonify({"error": "wait must be a finite number"}), 400
+        if timeout < 0:
+            return jsonify({"error": "wait must not be negative"}), 400
+        serial_handler_instance.wait_for_state_change(since, timeout)
+    ports, version = serial_handler_instance.get_states_with_version()
+    if port_name is not None:
+        return jsonify({**ports[port_name], "version": version})
+    # "state" is the state of the default port, as before ports had names
+    return jsonify({"state": ports[shared_data.DEFAULT_PORT]["state"], "ports": ports, "version": version})
 
 @app.route('/serial/available_ports', methods=['GET'])
 def get_available_ports():
@@ -20,38 +71,44 @@ def get_available_ports():
 
 @app.route('/serial/connect', methods=['POST'])
 def connect_serial():
-    data = request.json
+    data = _request_body()
     portname = data.get("portname")
     baudrate = data.get("baudrate", 115200)
+    port_name = data.get("port", shared_data.DEFAULT_PORT)
     if not portname:
         return jsonify({"error": "Port name is required"}), 400
     serial_handler_instance = current_app.config["serial_handler_instance"]
-    success = serial_handler_instance.connect(portname, baudrate)
+    try:
+        success = serial_handler_instance.connect(portname, baudrate, name=port_name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     if success:
-        return jsonify({"status": "connected"})
+        return jsonify({"status": "connected", "port": port_name})
     else:
         return jsonify({"error": "Failed to connect"}), 500
     
 @app.route('/serial/disconnect', methods=['POST'])
 def disconnect_serial():
+    port_name = _request_body().get("port", shared_data.DEFAULT_PORT)
     serial_handler_instance = current_app.config["serial_handler_instance"]
-    if serial_handler_instance.disconnect():
-        return jsonify({"status": "disconnected"})
+    if serial_handler_instance.disconnect(port_name):
+        return jsonify({"status": "disconnected", "port": port_name})
     else:
         return jsonify({"status": "port is not open"}), 204
 
 @app.route('/serial/write', methods=['POST'])
 def write_serial():
-    data = request.json
+    data = _request_body()
     payload = data.get("payload")
+    port_name = data.get("port", shared_data.DEFAULT_PORT)
     if not payload:
         return jsonify({"error": "Payload is required"}), 400
     try:
-        encoded_payload = bytes(lib.cobs.cobs_encode(payload))
+        encoded_payload = lib.cobs.cobs_encode_bytes(bytes(payload))
     except Exception as e:
         return jsonify({"error": f"Encoding error: {str(e)}"}), 500
     serial_handler_instance = current_app.config["serial_handler_instance"]
-    success = serial_handler_instance.write_data(encoded_payload)
+    success = serial_handler_instance.write_data(encoded_payload, port_name)
     if success:
         return jsonify({"status": "data sent"})
     else:
@@ -61,20 +118,148 @@ def write_serial():
 def test():
     return jsonify({"message": "This is a test endpoint"})
 
+def _since_version_arg() -> int | None:
+    since_version = request.args.get("since_version")
+    return int(since_version) if since_version is not None else None
+
+def _not_modified(version: int) -> Response:
+    return Response(status=304, headers={"X-Data-Version": str(version)})
+
+def _cached_json_response(cached: CachedJson, version: int) -> Response:
+    """
+    Returns the cached bytes with ETag and Last-Modified, or 304 if the client already has them.
+    """
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(cached.etag)
+    else:
+        # Compared in ms: the header has whole seconds, so data received later in the same second
+        # is newer than a client that sends that second can have
+        not_modified = (cached.last_modified is not None and request.if_modified_since is not None
+                        and cached.last_modified <= request.if_modified_since.timestamp())
+    if not_modified:
+        response = _not_modified(version)
+    else:
+        response = Response(cached.body, mimetype="application/json", headers={"X-Data-Version": str(version)})
+    response.set_etag(cached.etag)
+    if cached.last_modified is not None:
+        response.last_modified = cached.last_modified
+    # Clients may keep the data, but must revalidate it every time
+    response.cache_control.no_cache = True
+    return response
+
+def _snapshot_arg() -> tuple[shared_data.DataSnapshot, SnapshotJsonCache] | None:
+    """
+    Returns the snapshot and cache of the port given by ?port=, or of all ports if it is not given.
+    Returns None for a port that has no data.
+    """
+    port_name = request.args.get("port")
+    if port_name is None:
+        return shared_data.data_snapshot, json_cache
+    snapshot = shared_data.port_snapshots.get(port_name)
+    if snapshot is None:
+        return None
+    return snapshot, port_json_caches.setdefault(port_name, SnapshotJsonCache())
+
+def _port_not_found() -> tuple[Response, int]:
+    return jsonify({"error": "No data found for this port", "available": list(shared_data.port_snapshots.keys())}), 404
+
 @app.route('/data/<string:parsername>', methods=['GET'])
 def parsed_data(parsername):
-    data = None
-    with shared_data.data_lock:
-        data = shared_data.data_dict.get(parsername)
-    if data is None:
-        return jsonify({"error": "No data found for this parser", "available": list(shared_data.data_dict.keys())}), 404
-    return jsonify(data)
+    try:
+        since_version = _since_version_arg()
+    except ValueError:
+        return jsonify({"error": "since_version must be an integer"}), 400
+    snapshot_and_cache = _snapshot_arg()
+    if snapshot_and_cache is None:
+        return _port_not_found()
+    snapshot, cache = snapshot_and_cache
+    cached = cache.get_parser(snapshot, parsername)
+    if cached is None:
+        return jsonify({"error": "No data found for this parser", "available": list(snapshot.data.keys())}), 404
+    # A since_version newer than the snapshot comes from before a restart, so it is ignored
+    if since_version is not None and snapshot.versions[parsername] <= since_version <= snapshot.version:
+        return _not_modified(snapshot.version)
+    return _cached_json_response(cached, snapshot.version)
+
+@app.route('/data/<string:parsername>/history', methods=['GET'])
+def parsed_data_history(parsername):
+    since = request.args.get("since")
+    limit = request.args.get("limit")
+    try:
+        since = int(since) if since is not None else None
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    if limit is not None and limit < 0:
+        return jsonify({"error": "limit must not be negative"}), 400
+    background_instance = current_app.config["background_instance"]
+    history = background_instance.get_history(parsername, since, limit)
+    if history is None:
+        return jsonify({"error": "Parser not found", "available": background_instance.get_parser_names()}), 404
+    return jsonify({"count": len(history["received_time"]), "data": history})
 
 @app.route('/data', methods=['GET'])
 def all_parsed_data():
-    with shared_data.data_lock:
-        data = shared_data.data_dict
-    return jsonify(data)
+    try:
+        since_version = _since_version_arg()
+    except ValueError:
+        return jsonify({"error": "since_version must be an integer"}), 400
+    snapshot_and_cache = _snapshot_arg()
+    if snapshot_and_cache is None:
+        return _port_not_found()
+    snapshot, cache = snapshot_and_cache
+    if since_version is None or since_version > snapshot.version:
+        # A since_version newer than the snapshot comes from before a restart
+        cached = cache.get_aggregate(snapshot)
+    elif since_version == snapshot.version:
+        return _not_modified(snapshot.version)
+    else:
+        cached = cache.get_changed(snapshot, since_version)
+    return _cached_json_response(cached, snapshot.version)
+
+def _parser_names_arg() -> set[str] | None:
+    parsers = request.args.get("parsers")
+    if not parsers:
+        return None
+    return {name.strip() for name in parsers.split(",") if name.strip()}
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-Sent Events. Each parsed record is sent as an event named after its parser.
+    """
+    broadcaster = current_app.config["background_instance"].broadcaster
+    last_event_id = request.headers.get("Last-Event-ID")
+    since = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    subscription = broadcaster.subscribe(_parser_names_arg(), since)
+    # Passed through as it is, so that the asyncio server can wait for events on its event loop
+    return Response(EventStream(broadcaster, subscription), mimetype="text/event-stream", direct_passthrough=True,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/stream/poll', methods=['GET'])
+def stream_poll():
+    """
+    Long-poll fallback of /stream. Returns the records after since, waiting for new ones if there are none.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        timeout = min(float(request.args.get("timeout", 25.0)), 60.0)
+        limit = request.args.get("limit")
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "since, timeout and limit must be numbers"}), 400
+    if not math.isfinite(timeout):
+        # A NaN deadline never passes, so the request would wait forever
+        return jsonify({"error": "timeout must be a finite number"}), 400
+    if since < 0 or timeout < 0 or (limit is not None and limit < 0):
+        return jsonify({"error": "since, timeout and limit must not be negative"}), 400
+    broadcaster = current_app.config["background_instance"].broadcaster
+    events, missed, seq = broadcaster.wait_since(since, _parser_names_arg(), timeout, limit)
+    # The data of each record is serialized once and shared with the other clients
+    records = ",".join(f'{{"seq": {event.seq}, "parser": {json.dumps(event.parser_name)}, "data": {event.to_json()}}}'
+                       for event in events)
+    body = f'{{"seq": {seq}, "missed": {missed}, "records": [{records}]}}'
+    return Response(body, mimetype="application/json")
 
 @app.route('/parsers', methods=['GET'])
 def get_parsers():
@@ -90,6 +275,31 @@ def get_parser_information(parsername):
         return jsonify(info), 404
     return jsonify(info)
 
+@app.route('/log/stats', methods=['GET'])
+def get_log_stats():
+    background_instance = current_app.config["background_instance"]
+    return jsonify(background_instance.get_log_stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Counters, rates and latencies of each stage of the pipeline.
+    JSON by default; the Prometheus text format with format=prometheus, or when the client
+    asks for text/plain or OpenMetrics without accepting JSON, as Prometheus does.
+    """
+    serial_handler_instance = current_app.config.get("serial_handler_instance")
+    background_instance = current_app.config["background_instance"]
+    output_format = request.args.get("format")
+    if output_format is None:
+        accept = request.headers.get("Accept", "")
+        prefers_text = "text/plain" in accept or "openmetrics" in accept
+        output_format = "prometheus" if prefers_text and "application/json" not in accept else "json"
+    if output_format == "prometheus":
+        return Response(metrics.prometheus(serial_handler_instance, background_instance), content_type=PROMETHEUS_CONTENT_TYPE)
+    if output_format != "json":
+        return jsonify({"error": "format must be json or prometheus"}), 400
+    return jsonify(metrics.collect(serial_handler_instance, background_instance))
+
 @app.route('/help', methods=['GET'])
 def help_page():
     help_content = """
@@ -104,14 +314,19 @@ def help_page():
         <h2>API Endpoints</h2>
         <ul>
             <li><strong>/test</strong>: A test endpoint to check server functionality.</li>
-            <li><strong>/serial/state</strong>: Get the current state of the serial connection.</li>
+            <li><strong>/serial/state</strong>: Get the current state of the serial connections, or wait for a change (port, wait, since).</li>
             <li><strong>/serial/available_ports</strong>: List all available serial ports.</li>
             <li><strong>/serial/connect</strong>: Connect to a specified serial port.</li>
             <li><strong>/serial/disconnect</strong>: Disconnect from the current serial port.</li>
-            <li><strong>/data/&lt;parsername&gt;</strong>: Get parsed data for a specific parser.</li>
-            <li><strong>/data</strong>: Get all parsed data from all parsers.</li>
+            <li><strong>/data/&lt;parsername&gt;</strong>: Get parsed data for a specific parser (port).</li>
+            <li><strong>/data/&lt;parsername&gt;/history</strong>: Get recent parsed data for a specific parser (since, limit).</li>
+            <li><strong>/data</strong>: Get all parsed data from all parsers (port).</li>
+            <li><strong>/stream</strong>: Receive parsed data as Server-Sent Events as soon as it arrives (parsers).</li>
+            <li><strong>/stream/poll</strong>: Long-poll version of /stream (since, parsers, timeout, limit).</li>
             <li><strong>/parsers</strong>: List all available parsers.</li>
             <li><strong>/parser/&lt;parsername&gt;</strong>: Get information about a specific parser.</li>
+            <li><strong>/log/stats</strong>: Get queue depth, bytes written and flush latency of the log writers.</li>
+            <li><strong>/metrics</strong>: Get frame rates, errors, queue depth and latencies of each stage (format=json or prometheus).</li>
         </ul>
         <h2>HELP</h2>
         <p>For more information on how to use the API, please refer to the
@@ -0,0 +1,78 @@
+import json
+import os
+
+from shared_data import DataSnapshot
+
+# ETags also contain an id of this process, so that versions from before a restart never match
+_BOOT_ID = os.urandom(4).hex()
+
+
+class CachedJson:
+    """
+    Serialized JSON of one view of a snapshot, with its validators.
+    last_modified is the latest received time in seconds, or None if there is no data.
+    """
+    __slots__ = ("body", "etag", "last_modified")
+
+    def __init__(self, body: bytes, etag: str, last_modified: float | None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class SnapshotJsonCache:
+    """
+    Keeps the JSON bytes of the latest data of each parser, and of all parsers together,
+    so that polling the same version again costs no serialization.
+
+    Entries are made on first request and are valid while the version they were made for
+    is current. The data of a parser is serialized once per change of that parser,
+    and the aggregate view is joined from those bytes.
+    Handlers run on many threads; two of them may build the same entry at once, which is harmless.
+    """
+    def __init__(self):
+        self._parsers = {}  # parser name -> (version, CachedJson)
+        self._aggregate = None  # (version, CachedJson)
+
+    def get_parser(self, snapshot: DataSnapshot, parser_name: str) -> CachedJson | None:
+        """
+        Returns the cached JSON of one parser, or None if there is no data of it.
+        """
+        version = snapshot.versions.get(parser_name)
+        if version is None:
+            return None
+        entry = self._parsers.get(parser_name)
+        if entry is None or entry[0] != version:
+            data = snapshot.data[parser_name]
+            received_time = data.get("received_time")
+            cached = CachedJson(json.dumps(data, separators=(",", ":")).encode(),
+                                f"{_BOOT_ID}-{parser_name}-{version}",
+                                received_time / 1000 if received_time is not None else None)
+            entry = self._parsers[parser_name] = (version, cached)
+        return entry[1]
+
+    def get_aggregate(self, snapshot: DataSnapshot) -> CachedJson:
+        """
+        Returns the cached JSON of all parsers, {parser name: data}.
+        """
+        entry = self._aggregate
+        if entry is None or entry[0] != snapshot.version:
+            cached = self._join(snapshot, snapshot.data.keys(), f"{_BOOT_ID}-{snapshot.version}")
+            entry = self._aggregate = (snapshot.version, cached)
+        return entry[1]
+
+    def get_changed(self, snapshot: DataSnapshot, since_version: int) -> CachedJson:
+        """
+        Returns the JSON of the parsers that changed after since_version, joined from the cached bytes.
+        """
+        return self._join(snapshot, snapshot.changed_since(since_version), f"{_BOOT_ID}-{snapshot.version}-since-{since_version}")
+
+    def _join(self, snapshot: DataSnapshot, parser_names, etag: str) -> CachedJson:
+        parts = []
+        last_modified = None
+        for name in parser_names:
+            cached = self.get_parser(snapshot, name)
+            parts.append(json.dumps(name).encode() + b":" + cached.body)
+            if cached.last_modified is not None and (last_modified is None or cached.last_modified > last_modified):
+                last_modified = cached.last_modified
+        return CachedJson(b"{" + b",".join(parts) + b"}", etag, last_modified)
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import deque
+
+from background.latency import BUCKET_COUNT, LatencyStats
+import shared_data
+
+# Rates are computed over at least this many seconds of counter samples
+RATE_WINDOW = 10.0
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RateWindow:
+    """
+    Turns counters into rates per second. Each call of rates() stores a sample of the counters,
+    and the rate is taken against the newest sample that is at least window seconds old
+    (or the oldest one, or the start, when there is none yet), so scraping more often does not make it noisier.
+    """
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self._samples = deque([(time.monotonic(), {})])
+        self._lock = threading.Lock()
+
+    def rates(self, counters: dict[str, int]) -> dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples
+            while len(samples) > 1 and now - samples[1][0] >= self.window:
+                samples.popleft()
+            base_time, base = samples[0]
+            samples.append((now, counters))
+        elapsed = now - base_time
+        return {key: (value - base.get(key, 0)) / elapsed if elapsed > 0 else 0.0 for key, value in counters.items()}
+
+
+class PipelineMetrics:
+    """
+    Collects the counters and latency histograms of the serial ports, the Background worker
+    and the HTTP handlers. The hot paths only add to counters and LatencyStats;
+    everything else is computed when the metrics are requested.
+    """
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.rate_window = RateWindow()
+        self.http_latency = {}  # endpoint -> LatencyStats
+        self._http_lock = threading.Lock()
+
+    def record_request(self, endpoint: str, seconds: float):
+        """
+        Records the duration of one HTTP request. Handlers run on many threads, so this takes a lock.
+        """
+        with self._http_lock:
+            stats = self.http_latency.get(endpoint)
+            if stats is None:
+                stats = self.http_latency[endpoint] = LatencyStats()
+            stats.record(seconds)
+
+    def _gather(self, serial_handler_instance, background_instance) -> dict:
+        """
+        Returns the counters and the LatencyStats objects, shared by collect() and prometheus().
+        """
+        ports = serial_handler_instance.ports if serial_handler_instance is not None else {}
+        port_counters = {name: port.get_counters() for name, port in list(ports.items())}
+        parser_counts = dict(background_instance.parsed_frame_counts)
+        now = time.time()
+        staleness = {}
+        for name in parser_counts:
+            data = shared_data.data_snapshot.data.get(name)
+            received_time = data.get("received_time") if data is not None else None
+            staleness[name] = max(now - received_time / 1000, 0.0) if received_time is not None else None
+        with self._http_lock:
+            http_latency = dict(self.http_latency)
+        return {
+            "ports": port_counters,
+            "port_latency": {name: port.latency for name, port in list(ports.items())},
+            "queue": serial_handler_instance.get_queue_stats() if serial_handler_instance is not None else None,
+            "parsers": parser_counts,
+            "staleness": staleness,
+            "unparsed_frames": background_instance.unparsed_frame_count,
+            "processed_frames": background_instance.processed_frame_count,
+            "stage_latency": background_instance.latency,
+            "http_latency": http_latency,
+            "log": background_instance.get_log_stats(),
+            "parse_pool": background_instance.parse_pool.get_stats() if background_instance.parse_pool is not None else None,
+        }
+
+    def collect(self, serial_handler_instance, background_instance) -> dict:
+        """
+        Returns the metrics as a dict for JSON, with rates per second and latencies in milliseconds.
+        """
+        gathered = self._gather(serial_handler_instance, background_instance)
+        counters = {"processed_frames": gathered["processed_frames"], "unparsed_frames": gathered["unparsed_frames"]}
+        for name, port_counters in gathered["ports"].items():
+            counters[f"port:{name}:bytes"] = port_counters["bytes"]
+            counters[f"port:{name}:frames"] = port_counters["frames"]
+        for name, count in gathered["parsers"].items():
+            counters[f"parser:{name}"] = count
+        rates = self.rate_window.rates(counters)
+        return {
+            "uptime_s": time.monotonic() - self.start_time,
+            "ports": {name: {**port_counters,
+                             "bytes_per_s": rates[f"port:{name}:bytes"],
+                             "frames_per_s": rates[f"port:{name}:frames"],
+                             "latency": {stage: stats.get_stats() for stage, stats in gathered["port_latency"][name].items()}}
+                      for name, port_counters in gathered["ports"].items()},
+            "queue": gathered["queue"],
+            "parsers": {name: {"frames": count, "frames_per_s": rates[f"parser:{name}"], "staleness_s": gathered["staleness"][name]}
+                        for name, count in gathered["parsers"].items()},
+            "processed_frames": gathered["processed_frames"],
+            "processed_frames_per_s": rates["processed_frames"],
+            "unparsed_frames": gathered["unparsed_frames"],
+            "unparsed_frames_per_s": rates["unparsed_frames"],
+            "latency": {stage: stats.get_stats() for stage, stats in gathered["stage_latency"].items()},
+            "http": {endpoint: stats.get_stats() for endpoint, stats in sorted(gathered["http_latency"].items())},
+            "log": gathered["log"],
+            "parse_pool": gathered["parse_pool"],
+        }
+
+    def prometheus(self, serial_handler_instance, background_instance) -> str:
+        """
+        Returns the metrics in the Prometheus text format. Rates are left to the queries (rate()),
+        and latencies are histograms in seconds with the power of two buckets of LatencyStats.
+        """
+        gathered = self._gather(serial_handler_instance, background_instance)
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: list[tuple[dict, float]]):
+            lines.append(f"# HELP serialserver_{name} {help_text}")
+            lines.append(f"# TYPE serialserver_{name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"serialserver_{name}{_labels(labels)} {_number(value)}")
+
+        def histogram(name: str, help_text: str, label: str, stats_by_label: dict[str, LatencyStats]):
+            lines.append(f"# HELP serialserver_{name} {help_text}")
+            lines.append(f"# TYPE serialserver_{name} histogram")
+            for value, stats in stats_by_label.items():
+                cumulative = 0
+                for index, count in enumerate(stats.buckets[:BUCKET_COUNT - 1]):
+                    cumulative += count
+                    lines.append(f"serialserver_{name}_bucket{_labels({label: value, 'le': _number(2 ** index / 1e6)})} {cumulative}")
+                # From the buckets rather than stats.count, which a sample being recorded may not have reached yet
+                cumulative += stats.buckets[BUCKET_COUNT - 1]
+                lines.append(f"serialserver_{name}_bucket{_labels({label: value, 'le': '+Inf'})} {cumulative}")
+                lines.append(f"serialserver_{name}_sum{_labels({label: value})} {_number(stats.total)}")
+                lines.append(f"serialserver_{name}_count{_labels({label: value})} {cumulative}")
+
+        ports = gathered["ports"]
+        metric("uptime_seconds", "gauge", "Seconds since the metrics were set up.",
+               [({}, time.monotonic() - self.start_time)])
+        for key, help_text in (("bytes", "Bytes read from the serial port."),
+                               ("frames", "COBS frames decoded."),
+                               ("decode_errors", "Broken COBS frames."),
+                               ("blocked_puts", "Batches that waited for room in the queue."),
+                               ("dropped_frames", "Frames dropped because the queue stayed full.")):
+            metric(f"port_{key}_total", "counter", help_text, [({"port": name}, counters[key]) for name, counters in ports.items()])
+        queue = gathered["queue"]
+        if queue is not None:
+            metric("queue_depth", "gauge", "Batches waiting for the background worker.", [({}, queue["depth"])])
+            metric("queue_capacity", "gauge", "Batches the queue holds for each port.", [({}, queue["capacity"])])
+        metric("parser_frames_total", "counter", "Frames parsed by each parser.",
+               [({"parser": name}, count) for name, count in gathered["parsers"].items()])
+        metric("parser_staleness_seconds", "gauge", "Seconds since the latest frame of each parser was received.",
+               [({"parser": name}, value) for name, value in gathered["staleness"].items() if value is not None])
+        metric("unparsed_frames_total", "counter", "Frames no parser accepted.", [({}, gathered["unparsed_frames"])])
+        metric("processed_frames_total", "counter", "Frames processed by the background worker.", [({}, gathered["processed_frames"])])
+        for key, metric_type, help_text in (("records_written", "counter", "Records written to the log."),
+                                            ("bytes_written", "counter", "Bytes written to the log."),
+                                            ("dropped", "counter", "Records dropped because the log queue was full."),
+                                            ("queue_depth", "gauge", "Records waiting to be written.")):
+            name = key if metric_type == "gauge" else f"{key}_total"
+            metric(f"log_{name}", metric_type, help_text, [({"log": log}, stats[key]) for log, stats in gathered["log"].items()])
+        parse_pool = gathered["parse_pool"]
+        if parse_pool is not None:
+            metric("parse_pool_pending", "gauge", "Batches being parsed by the worker processes.", [({}, parse_pool["pending"])])
+            metric("parse_pool_submitted_total", "counter", "Batches handed to the worker processes.", [({}, parse_pool["submitted"])])
+        histogram("stage_latency_seconds", "Latency of each stage of the background worker.", "stage", gathered["stage_latency"])
+        histogram("decode_latency_seconds", "Time to decode one read of a serial port.", "port",
+                  {name: latency["decode"] for name, latency in gathered["port_latency"].items() if "decode" in latency})
+        histogram("http_request_duration_seconds", "Time to handle an HTTP request, until a stream starts for streams.",
+                  "endpoint", dict(sorted(gathered["http_latency"].items())))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
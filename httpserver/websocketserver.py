@@ -0,0 +1,176 @@
+"""
+# websocketserver.py
+Minimal WebSocket (RFC 6455) server that streams the TelemetryFeed to clients.
+Flask's development server cannot upgrade connections, so this runs on its own port.
+
+Connect to ws://{host}:{ws_port}/ws with these query parameters:
+    mode:    "packed" (default) or "raw"
+    parsers: comma separated parser names (default: all)
+    every:   send only every Nth record, either one number for all parsers
+             or comma separated "parser:N" pairs
+"""
+import base64
+import hashlib
+import select
+import socket
+import socketserver
+import struct
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from background.telemetryfeed import MODES, TelemetryFeed, encode_ws_frame
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_HEADER_SIZE = 8192
+MAX_CLIENT_PAYLOAD = 1 << 16
+
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+
+def parse_subscription(query: str) -> dict:
+    """
+    Converts the query string of the request into keyword arguments of TelemetryFeed.subscribe().
+    Raises ValueError for invalid values.
+    """
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    mode = params.get("mode", "packed")
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    parsers = params.get("parsers")
+    parser_names = {name.strip() for name in parsers.split(",") if name.strip()} if parsers else None
+    every = {}
+    default_every = 1
+    for item in params.get("every", "").split(","):
+        if not item:
+            continue
+        name, _, count = item.rpartition(":")
+        if int(count) < 1:
+            raise ValueError("every must be positive")
+        if name:
+            every[name] = int(count)
+        else:
+            default_every = int(count)
+    return {"mode": mode, "parser_names": parser_names, "every": every, "default_every": default_every}
+
+
+class WebSocketHandler(socketserver.BaseRequestHandler):
+    """
+    Handles one client: performs the handshake, then sends the queued frames of its subscription.
+    """
+    def handle(self):
+        sock = self.request
+        sock.settimeout(5.0)
+        request = self._read_request()
+        if request is None:
+            return
+        path, headers = request
+        url = urlsplit(path)
+        if url.path != "/ws":
+            self._send_error(404, "Not Found")
+            return
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or key is None or headers.get("sec-websocket-version") != "13":
+            self._send_error(400, "Bad Request")
+            return
+        try:
+            options = parse_subscription(url.query)
+        except ValueError:
+            self._send_error(400, "Bad Request")
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        sock.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        feed: TelemetryFeed = self.server.feed
+        subscription = feed.subscribe(**options)
+        try:
+            while not subscription.closed:
+                messages = subscription.get(timeout=1.0)
+                if messages:
+                    sock.sendall(b"".join(messages))
+                readable, _, _ = select.select([sock], [], [], 0)
+                if readable and not self._handle_client_frame():
+                    return
+        except OSError:
+            pass
+        finally:
+            feed.unsubscribe(subscription)
+
+    def _read_request(self) -> tuple[str, dict[str, str]] | None:
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.request.recv(1024)
+            if not chunk or len(data) + len(chunk) > MAX_HEADER_SIZE:
+                return None
+            data += chunk
+        lines = data.split(b"\r\n\r\n", 1)[0].decode("latin-1").split("\r\n")
+        method, _, rest = lines[0].partition(" ")
+        if method != "GET":
+            self._send_error(405, "Method Not Allowed")
+            return None
+        path = rest.rpartition(" ")[0]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return path, headers
+
+    def _send_error(self, status: int, reason: str):
+        self.request.sendall(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+
+    def _recv_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            data += chunk
+        return data
+
+    def _handle_client_frame(self) -> bool:
+        """
+        Reads one frame from the client. Returns False when the connection should be closed.
+        Clients only send control frames; other messages are ignored.
+        """
+        first, second = self._recv_exact(2)
+        opcode = first & 0x0f
+        length = second & 0x7f
+        if length == 126:
+            length = struct.unpack("!H", self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._recv_exact(8))[0]
+        if length > MAX_CLIENT_PAYLOAD or not second & 0x80:
+            # Clients must mask their frames
+            return False
+        mask = self._recv_exact(4)
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(length)))
+        if opcode == OPCODE_CLOSE:
+            self.request.sendall(encode_ws_frame(payload[:2], OPCODE_CLOSE))
+            return False
+        if opcode == OPCODE_PING:
+            self.request.sendall(encode_ws_frame(payload, OPCODE_PONG))
+        return True
+
+
+class WebSocketServer(socketserver.ThreadingTCPServer):
+    """
+    Serves the TelemetryFeed to WebSocket clients, one thread per client.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, feed: TelemetryFeed, host: str = "127.0.0.1", port: int = 7879):
+        super().__init__((host, port), WebSocketHandler)
+        self.feed = feed
+
+    def get_server_thread(self) -> threading.Thread:
+        """
+        Returns a thread that serves until shutdown() is called.
+        """
+        return threading.Thread(target=self.serve_forever, daemon=True)
@@ -1,89 +1,219 @@
+import logging
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
 ######################################
 ##### Parse COBS                ######
 ######################################
 
+def _decode_frame(frame) -> bytes:
+    """ 終端コード(0x00)を含まない1フレーム分のCOBSデータをデコードする。
+    Args:
+        frame (bytes | bytearray | memoryview): 0x00を含まないCOBSエンコードされたデータ。
+    Returns:
+        bytes: デコードされたデータ。
+    Raises:
+        ValueError: ブロック長がフレームの長さを超えている場合。
+    """
+    frame_len = len(frame)
+    if frame_len == 0:
+        return b''
+    # 先頭のコードを除いてまとめてコピーし、コードの位置だけを0x00に書き換える。
+    # ただし、0xffのブロックの次のコードは0x00を表さないので、最後にまとめて取り除く。
+    dec_data = bytearray(frame[1:])
+    overhead_positions = None
+    src = 0
+    while True:
+        next_code = src + frame[src]
+        if next_code >= frame_len:
+            if next_code > frame_len:
+                raise ValueError("COBS decode error: block exceeds frame length")
+            break
+        if frame[src] == 0xff:
+            if overhead_positions is None:
+                overhead_positions = []
+            overhead_positions.append(next_code - 1)
+        else:
+            dec_data[next_code - 1] = 0
+        src = next_code
+    if overhead_positions is not None:
+        for position in reversed(overhead_positions):
+            del dec_data[position]
+    return bytes(dec_data)
+
+
+def cobs_decode_bytes(enc_data, index:int=0) -> tuple[bytes, int]:
+    """ bytes型のままCOBSデコードを行う。
+    cobs_decodeと同じ動作をするが、データをlistに変換せずに処理する。
+    Args:
+        enc_data (bytes | bytearray): COBSエンコードされたデータ。
+        index (int): デコードを開始するインデックス。デフォルトは0。
+    Returns:
+        (dec_data, rest_index) ((bytes, int)):
+            dec_data: デコードされたデータ。終端コードが見つからない場合や
+                      フレームが壊れている場合はb''。
+
+            rest_index: 残りのエンコードデータの開始インデックス。
+    """
+    if not isinstance(enc_data, (bytes, bytearray)):
+        raise TypeError("enc_data must be bytes or bytearray")
+    end = enc_data.find(0, index)
+    if end < 0:
+        # 終端コード(0x00)が見つからなかった場合は、
+        # b''を返す。
+        logger.warning("COBS decode error: no end code found")
+        return b'', len(enc_data) + 1
+    try:
+        dec_data = _decode_frame(memoryview(enc_data)[index:end])
+    except ValueError as e:
+        logger.warning("COBS decode error: %s", e)
+        return b'', end + 1
+    return dec_data, end + 1
+
+
+def cobs_encode_bytes(data) -> bytes:
+    """ bytes型のままCOBSエンコードを行い、終端コード(0x00)を付けて返す。
+    Args:
+        data (bytes | bytearray | memoryview): エンコードするデータ。
+    Returns:
+        bytes: COBSエンコードされたデータ。末尾に終端コード(0x00)を含む。
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        raise TypeError("data must be bytes, bytearray or memoryview")
+    encoded_data = bytearray()
+    segments = bytes(data).split(b'\x00')
+    if len(data) < 254:
+        # 254バイト未満なら0xffのブロックは現れないので、0x00で区切った各区間の前に
+        # 長さ+1のコードを付けるだけでよい。
+        for segment in segments:
+            encoded_data.append(len(segment) + 1)
+            encoded_data += segment
+        encoded_data.append(0)
+        return bytes(encoded_data)
+    last = len(segments) - 1
+    for i, segment in enumerate(segments):
+        segment_len = len(segment)
+        start = 0
+        while segment_len - start >= 254:
+            # 254個連続して0x00を含まない場合は、0xffのブロックとして書き出す。
+            encoded_data.append(0xff)
+            encoded_data += segment[start:start + 254]
+            start += 254
+        if start == segment_len and i == last and segment_len > 0:
+            # 最後のブロックがちょうど0xffで終わった場合は、空のブロックを追加しない。
+            break
+        encoded_data.append(segment_len - start + 1)
+        encoded_data += segment[start:] if start else segment
+    encoded_data.append(0)
+    return bytes(encoded_data)
+
+
+class CobsStreamDecoder:
+    """ 連続したCOBSストリームからフレームを切り出してデコードする。
+    受信したデータを何回かに分けてfeedしても、途中で切れたフレームは
+    内部のバッファに保持され、次のfeedで続きとして扱われる。
+    """
+    def __init__(self, max_frame_size:int=4096):
+        """
+        Args:
+            max_frame_size (int): 終端コードが来ないまま溜められるバイト数の上限。
+                                  超えた場合はバッファを破棄する。
+        """
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self.frame_count = 0
+        self.error_count = 0
+
+    def reset(self):
+        """ 保持している途中のフレームを破棄する。 """
+        self._buffer.clear()
+
+    def feed(self, chunk) -> Iterator[bytes]:
+        """ 受信したデータを追加し、完成したフレームのデコード結果を順に返す。
+        バッファの更新とデコードはfeedを呼んだ時点で行われるため、frame_countと
+        error_countはfeedから戻った時点で更新されている。
+        空のフレームと壊れたフレームは読み飛ばし、壊れたフレームはerror_countに数える。
+        Args:
+            chunk (bytes | bytearray | memoryview): 受信したデータ。
+        Returns:
+            Iterator[bytes]: デコードされたフレーム。
+        """
+        buffer = self._buffer
+        if buffer:
+            buffer += chunk
+            data = bytes(buffer)
+        else:
+            data = bytes(chunk)
+        last_end = data.rfind(0)
+        if last_end < 0:
+            if len(data) > self.max_frame_size:
+                # 終端コードが来ないまま溜まり続けている場合は破棄する。
+                self.error_count += 1
+                buffer.clear()
+            elif not buffer:
+                buffer += data
+            return iter(())
+        buffer[:] = data[last_end + 1:]
+        return iter(self._decode_frames(data, last_end))
+
+    def _decode_frames(self, data:bytes, last_end:int) -> list[bytes]:
+        view = memoryview(data)
+        frames = []
+        start = 0
+        while start <= last_end:
+            end = data.find(0, start)
+            if end > start:
+                try:
+                    frames.append(_decode_frame(view[start:end]))
+                except ValueError:
+                    self.error_count += 1
+            start = end + 1
+        self.frame_count += len(frames)
+        return frames
+
+
 def cobs_decode(enc_data:list[int], index:int=0):
     """ COBSデコードを行う。
     COBSエンコードされたデータをデコードし、元のデータと残りのエンコードデータを返す。
+    list[int]を扱うための互換用で、内部ではcobs_decode_bytesを用いる。
     Args:
         enc_data (list[int]): COBSエンコードされたデータのリスト。
         index (int): デコードを開始するインデックス。デフォルトは0。
     Returns:
-        (dec_data, rest_index) ((list[int], int)): 
+        (dec_data, rest_index) ((list[int], int)):
             dec_data: デコードされたデータのリスト。
 
             rest_index: 残りのエンコードデータの開始インデックス。
     """
     if type(enc_data) is not list and type(enc_data) is not str and type(enc_data) is not bytes:
         raise TypeError("enc_data must be a list of integers, a string, or bytes")
-    dec_data:list[int] = []
-    enc_idx = index
-
-    next_0x00 = 0
-    next_is_overhead = True
-    is_end = False
-
-    while enc_idx < len(enc_data):
-        if (enc_data[enc_idx] < 0 or enc_data[enc_idx] > 255):
+    if type(enc_data) is not bytes:
+        # 全体をbytesに変換すると長いデータを何度もデコードする場合に遅くなるため、
+        # 次のフレームの分だけを変換する。
+        try:
+            end = enc_data.index(0, index)
+        except ValueError:
+            end = len(enc_data)
+        try:
+            frame = bytes(enc_data[index:end + 1])
+        except ValueError:
             raise ValueError("enc_data must contain integers in the range 0-255")
-        if next_0x00 != 0:
-            dec_data.append(enc_data[enc_idx])
-            enc_idx += 1
-        else:
-            if enc_data[enc_idx] == 0x00:
-                is_end = True
-                # 終端コード(0x00)発見時は処理を終了する。
-                break
-
-            if next_is_overhead == True:
-                pass
-            else:
-                dec_data.append(0)
-
-            next_0x00 = enc_data[enc_idx]
-            enc_idx += 1
-
-            if next_0x00 == 0xff:
-                next_is_overhead = True
-            else:
-                next_is_overhead = False
-        next_0x00 -= 1
-
-    if is_end == False:
-        # 終端コード(0x00)が見つからなかった場合は、
-        # []を返す。
-        print("COBS decode error: no end code found")
-        return [], enc_idx+1
-    return dec_data, enc_idx+1
+        dec_data, rest_index = cobs_decode_bytes(frame)
+        return list(dec_data), index + rest_index
+    dec_data, rest_index = cobs_decode_bytes(enc_data, index)
+    return list(dec_data), rest_index
 
 
 def cobs_encode(data:list[int]):
+    """ COBSエンコードを行い、終端コード(0x00)を付けたlist[int]を返す。
+    list[int]を扱うための互換用で、内部ではcobs_encode_bytesを用いる。
+    """
     if type(data) is not list and type(data) is not str and type(data) is not bytes:
         raise TypeError("data must be a list of integers, a string, or bytes")
-    encoded_data:list[int] = []
-    encoding_block:list[int] = [0x00]
-
-    for byte in data:
-        if (byte < 0 or byte > 255):
+    if type(data) is not bytes:
+        try:
+            data = bytes(data)
+        except ValueError:
             raise ValueError("data must contain integers in the range 0-255")
-        if len(encoding_block) == 255:
-            # エンコードブロックが255バイト(すなわち、254個連続して0x00を含まない)場合は、
-            # 現在のエンコードブロックを追加し、新しいブロックを開始する。
-            encoding_block[0] = len(encoding_block)
-            encoded_data.extend(encoding_block)
-            encoding_block = [0x00]
-
-        if byte == 0x00:
-            encoding_block[0] = len(encoding_block)
-            encoded_data.extend(encoding_block)
-            encoding_block = [0x00]
-        else:
-            encoding_block.append(byte)
-
-
-    # 最後にencoding_blockを流し、終端コード(0x00)を追加する。
-    encoding_block[0] = len(encoding_block)
-    encoded_data.extend(encoding_block)
-    encoded_data.append(0)
-
-    return encoded_data
\ No newline at end of file
+    return list(cobs_encode_bytes(data))
@@ -0,0 +1,116 @@
+"""
+# log.py
+Console messages of the server, on top of the standard logging module.
+
+Modules log with logging.getLogger(__name__). Messages written for every frame are DEBUG and are
+guarded with logger.isEnabledFor(logging.DEBUG), so they cost one level check when disabled.
+setup_logging() adds what plain logging lacks for this server:
+    sampling:      only 1 in `sample` DEBUG records of the same message are kept
+    rate limiting: at most `burst` records of the same message per `interval` seconds;
+                   the next one that passes says how many were suppressed
+    a queue:       records are written by a separate thread, and dropped when it falls behind,
+                   so that a slow or blocked terminal never stalls reading and parsing
+"Same message" is the logger and the format string, so messages must pass their values as arguments
+(logger.warning("Dropped %d frames", count)), not formatted into the string.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Samples DEBUG records and limits records of the same message, see the module docstring.
+    Used from every thread that logs.
+    """
+    def __init__(self, burst: int = 10, interval: float = 1.0, sample: int = 1):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample = sample
+        self.suppressed_count = 0
+        self._windows = {}  # (logger name, format string) -> [window start, passed, suppressed]
+        self._debug_counts = {}  # (logger name, format string) -> DEBUG records seen
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        with self._lock:
+            if self.sample > 1 and record.levelno <= logging.DEBUG:
+                seen = self._debug_counts.get(key, 0)
+                self._debug_counts[key] = seen + 1
+                if seen % self.sample:
+                    return False
+            if self.burst <= 0:
+                return True
+            window = self._windows.get(key)
+            suppressed = 0
+            if window is None or record.created - window[0] >= self.interval:
+                if window is not None:
+                    suppressed = window[2]
+                window = self._windows[key] = [record.created, 0, 0]
+            if window[1] >= self.burst:
+                window[2] += 1
+                self.suppressed_count += 1
+                return False
+            window[1] += 1
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full instead of reporting an error.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped_count = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+_listener = None
+
+
+def setup_logging(level: str = "INFO", burst: int = 10, interval: float = 1.0, sample: int = 1,
+                  queue_size: int = 10000, stream=None) -> DroppingQueueHandler:
+    """
+    Sends the records of all loggers of level and above through the filter and the queue to stream (stderr).
+    Can be called again to change the settings. Returns the handler, whose dropped_count and
+    filters[0].suppressed_count tell how much was left out.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(FORMAT))
+    queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(burst, interval, sample))
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+    _listener.start()
+    return queue_handler
+
+
+@atexit.register
+def _stop_listener():
+    # Writes the records that are still queued
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,314 @@
+"""
+# rawlog.py
+Binary, append-only log of raw (COBS decoded) frames.
+
+File layout (all integers are little endian):
+
+    header:  magic b"SSRAWLOG" (8 bytes), version (u16), header size (u16)
+    records: kind (u8), payload length (u16), received time in ms (u64), payload
+
+A record of kind RECORD_FRAME holds one decoded frame.
+After every `index_interval` frames the writer appends a RECORD_INDEX record whose payload is
+
+    magic b"SSRAWIDX" (8 bytes), offset of this record (u64), offset of the previous index record (u64),
+    offset of the first record of the block (u64), received time of the first frame (u64), frame count (u32)
+
+and whose received time is that of the last frame of the block.
+The index records form a chain from the end of the file, so a reader can find
+the block that contains a given time without reading every record.
+"""
+import gzip
+import mmap
+import os
+import struct
+from typing import Iterator
+
+MAGIC = b"SSRAWLOG"
+INDEX_MAGIC = b"SSRAWIDX"
+VERSION = 1
+HEADER = struct.Struct("<8sHH")
+RECORD = struct.Struct("<BHQ")
+INDEX = struct.Struct("<8sQQQQI")
+RECORD_FRAME = 0
+RECORD_INDEX = 1
+MAX_FRAME_LENGTH = 0xffff
+
+
+def _find_last_index(buffer, end: int) -> tuple[int, tuple] | tuple[None, None]:
+    """
+    Returns (offset, index payload fields) of the last valid index record before end,
+    or (None, None) if there is none.
+    """
+    position = end
+    while True:
+        position = buffer.rfind(INDEX_MAGIC, HEADER.size, position)
+        if position < 0:
+            return None, None
+        record_offset = position - RECORD.size
+        if record_offset >= HEADER.size and position + INDEX.size <= end:
+            fields = INDEX.unpack_from(buffer, position)
+            kind, length, _ = RECORD.unpack_from(buffer, record_offset)
+            # Frame data can contain the magic by chance, so check that the record points to itself
+            if kind == RECORD_INDEX and length == INDEX.size and fields[1] == record_offset:
+                return record_offset, fields
+
+
+class RawLogWriter:
+    """
+    Appends frames to a binary raw log. Opening an existing log continues it,
+    after dropping a record cut off by a crash and counting the frames of the unfinished index block.
+    """
+    def __init__(self, path: str, index_interval: int = 1024, buffering: int = 1 << 16):
+        self.path = path
+        self.index_interval = index_interval
+        self._prev_index_offset = 0
+        self._block_first_time = None
+        self._block_count = 0
+        self._last_time = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._block_offset, end = self._resume()
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        else:
+            self._block_offset = None
+        self._file = open(path, "ab", buffering=buffering)
+        self._offset = self._file.tell()
+        if self._offset == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, HEADER.size))
+            self._offset = HEADER.size
+            self._block_offset = self._offset
+
+    def _resume(self) -> tuple[int, int]:
+        """
+        Checks the header of an existing log, finds where the current index block starts and
+        counts the frames written after the last index record. Returns (block offset, end of the last
+        complete record); a record cut off by a crash is after the end and is truncated before appending.
+        """
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+                raise ValueError(f"{self.path} is not a raw log file")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                index_offset, _ = _find_last_index(mm, len(mm))
+                if index_offset is None:
+                    block_offset = HEADER.size
+                else:
+                    self._prev_index_offset = index_offset
+                    block_offset = index_offset + RECORD.size + INDEX.size
+                offset = block_offset
+                size = len(mm)
+                while offset + RECORD.size <= size:
+                    kind, length, received_time = RECORD.unpack_from(mm, offset)
+                    end = offset + RECORD.size + length
+                    if kind != RECORD_FRAME or end > size:
+                        break
+                    if self._block_first_time is None:
+                        self._block_first_time = received_time
+                    self._block_count += 1
+                    self._last_time = received_time
+                    offset = end
+        return block_offset, offset
+
+    def write(self, frame: bytes, received_time: int) -> int:
+        """
+        Appends one frame and returns the number of bytes written.
+        """
+        if len(frame) > MAX_FRAME_LENGTH:
+            raise ValueError(f"Frame is too long: {len(frame)} bytes")
+        self._file.write(RECORD.pack(RECORD_FRAME, len(frame), received_time))
+        self._file.write(frame)
+        written = RECORD.size + len(frame)
+        self._offset += written
+        if self._block_first_time is None:
+            self._block_first_time = received_time
+        self._block_count += 1
+        self._last_time = received_time
+        if self._block_count >= self.index_interval:
+            written += self._write_index()
+        return written
+
+    def _write_index(self) -> int:
+        index_offset = self._offset
+        self._file.write(RECORD.pack(RECORD_INDEX, INDEX.size, self._last_time))
+        self._file.write(INDEX.pack(INDEX_MAGIC, index_offset, self._prev_index_offset,
+                                    self._block_offset, self._block_first_time, self._block_count))
+        written = RECORD.size + INDEX.size
+        self._offset += written
+        self._prev_index_offset = index_offset
+        self._block_offset = self._offset
+        self._block_first_time = None
+        self._block_count = 0
+        return written
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        """
+        Writes the index of the last block and closes the file.
+        """
+        if self._file.closed:
+            return
+        if self._block_count > 0:
+            self._write_index()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _read_compressed(path: str) -> bytes | None:
+    """
+    Returns the decompressed contents of a .gz or .zst log segment, or None for other files.
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    if path.endswith(".zst"):
+        from compression import zstd  # Python 3.14+
+        with zstd.open(path, "rb") as f:
+            return f.read()
+    return None
+
+
+class RawLogReader:
+    """
+    Reads a binary raw log through mmap. Frames are returned as memoryviews into
+    the mapped file, so nothing is copied. Release them before calling close().
+    Compressed segments (.gz, .zst) written by log rotation are decompressed into memory instead.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mmap = None
+        data = _read_compressed(path)
+        if data is None:
+            self._file = open(path, "rb")
+            self._size = os.fstat(self._file.fileno()).st_size
+        else:
+            self._size = len(data)
+        if self._size < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a raw log file")
+        if data is None:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mmap = data
+        magic, version, header_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a raw log file")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported raw log version: {version}")
+        self._data_offset = header_size
+        self._view = memoryview(self._mmap)
+
+    def index(self) -> list[tuple[int, int, int, int]]:
+        """
+        Returns the index blocks as (block offset, first time, last time, frame count), oldest first.
+        """
+        blocks = []
+        index_offset, fields = _find_last_index(self._mmap, self._size)
+        while index_offset is not None:
+            _, _, prev_offset, block_offset, first_time, count = fields
+            last_time = RECORD.unpack_from(self._mmap, index_offset)[2]
+            blocks.append((block_offset, first_time, last_time, count))
+            if prev_offset == 0:
+                break
+            index_offset = prev_offset
+            fields = INDEX.unpack_from(self._mmap, index_offset + RECORD.size)
+        blocks.reverse()
+        return blocks
+
+    def _start_offset(self, since: int) -> int:
+        blocks = self.index()
+        for block_offset, _, last_time, _ in blocks:
+            if last_time >= since:
+                return block_offset
+        if blocks:
+            # Only the frames after the last index record can be newer
+            index_offset, _ = _find_last_index(self._mmap, self._size)
+            return index_offset + RECORD.size + INDEX.size
+        return self._data_offset
+
+    def records(self, since: int = None) -> Iterator[tuple[int, memoryview]]:
+        """
+        Iterates (received_time, frame) in file order.
+        If since is given, frames received before it are skipped, using the index to jump ahead.
+        A truncated record at the end of the file (e.g. after a crash) ends the iteration.
+        """
+        offset = self._data_offset if since is None else self._start_offset(since)
+        view = self._view
+        size = self._size
+        unpack_from = RECORD.unpack_from
+        record_size = RECORD.size
+        while offset + record_size <= size:
+            kind, length, received_time = unpack_from(view, offset)
+            payload_offset = offset + record_size
+            offset = payload_offset + length
+            if offset > size:
+                break
+            if kind != RECORD_FRAME or (since is not None and received_time < since):
+                continue
+            yield received_time, view[payload_offset:offset]
+
+    def __iter__(self):
+        return self.records()
+
+    def close(self):
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._mmap = None
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def scan_raw_log(path: str) -> tuple[int | None, int | None, int]:
+    """
+    Returns (received time of the first frame, of the last frame, number of frames) of a raw log,
+    e.g. to fill in the manifest entry of a segment that was not closed.
+    """
+    first_time = last_time = None
+    count = 0
+    if os.path.getsize(path) <= HEADER.size:
+        # Nothing was written, or not even the whole header
+        return first_time, last_time, count
+    with RawLogReader(path) as reader:
+        for received_time, frame in reader.records():
+            frame.release()
+            if first_time is None:
+                first_time = received_time
+            last_time = received_time
+            count += 1
+    return first_time, last_time, count
+
+
+def convert_text_log(text_path: str, raw_path: str) -> int:
+    """
+    Converts a text log written as "{received_time}, {frame hex}" per line
+    (the old mainlog.txt format) into a binary raw log. Returns the number of frames converted.
+    Lines that cannot be read are skipped.
+    """
+    count = 0
+    with open(text_path, "r") as text_file, RawLogWriter(raw_path) as writer:
+        for line in text_file:
+            received_time, _, frame_hex = line.partition(",")
+            try:
+                writer.write(bytes.fromhex(frame_hex.strip()), int(received_time))
+            except ValueError:
+                continue
+            count += 1
+    return count
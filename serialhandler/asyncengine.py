@@ -0,0 +1,109 @@
+"""
+# asyncengine.py
+Reads the serial ports from one asyncio event loop instead of one thread per port.
+
+The file descriptor of each connected port is watched with loop.add_reader(), so frames are
+decoded and handed to Background.process_batch() as soon as bytes arrive, without the queue
+and the polling of the threaded engine. Needs a platform where serial ports are selectable (POSIX).
+"""
+import asyncio
+import logging
+
+import serial
+
+from background.background import Background
+from serialhandler.serialhandler import SerialPort, serial_handler
+from shared_data import SerialState
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSerialEngine:
+    """
+    Watches every port of the serial handler while it is connected.
+    connect() and disconnect() may still be called from other threads (e.g. HTTP handlers);
+    the state changes are passed to the loop with call_soon_threadsafe().
+    After an error the port is reconnected with the backoff of SerialPort.next_reconnect_delay().
+    """
+    def __init__(self, handler: serial_handler, background: Background):
+        self.handler = handler
+        self.background = background
+        self._loop = None
+        self._watched = {}  # port name -> file descriptor
+        self._reconnects = {}  # port name -> asyncio.TimerHandle
+
+    async def run(self):
+        """
+        Opens the Background log sinks and reads the ports until cancelled.
+        """
+        self._loop = asyncio.get_running_loop()
+        self.background.open()
+        self.handler.set_state_listener(self._on_state_change)
+        try:
+            for port in list(self.handler.ports.values()):
+                if port.get_state() == SerialState.CONNECTED:
+                    self._watch(port)
+            await asyncio.Event().wait()
+        finally:
+            self.handler.set_state_listener(None)
+            for name in list(self._watched):
+                self._unwatch(name)
+            for handle in self._reconnects.values():
+                handle.cancel()
+            self.background.close()
+
+    def _on_state_change(self, port: SerialPort, state: SerialState):
+        # May be called from any thread
+        if state == SerialState.CONNECTED:
+            self._loop.call_soon_threadsafe(self._watch, port)
+        elif state in (SerialState.DISCONNECTED, SerialState.ERROR):
+            self._loop.call_soon_threadsafe(self._unwatch, port.name)
+        if state == SerialState.ERROR:
+            self._loop.call_soon_threadsafe(self._schedule_reconnect, port)
+
+    def _watch(self, port: SerialPort):
+        self._unwatch(port.name)
+        ser = port.ser
+        if ser is None or not ser.is_open or not port.set_state(SerialState.READING, expected=(SerialState.CONNECTED,)):
+            return
+        # Reads return what is buffered and never block the loop
+        ser.timeout = 0
+        fd = ser.fileno()
+        self._loop.add_reader(fd, self._on_readable, port, ser)
+        self._watched[port.name] = fd
+
+    def _schedule_reconnect(self, port: SerialPort):
+        handle = self._reconnects.pop(port.name, None)
+        if handle is not None:
+            handle.cancel()
+        delay = port.next_reconnect_delay()
+        if delay is not None:
+            self._reconnects[port.name] = self._loop.call_later(delay, self._reconnect, port)
+
+    def _reconnect(self, port: SerialPort):
+        self._reconnects.pop(port.name, None)
+        # A connect or disconnect during the delay cancels this reconnect
+        if port.get_state() == SerialState.ERROR:
+            port.reconnect()
+
+    def _unwatch(self, port_name: str):
+        fd = self._watched.pop(port_name, None)
+        if fd is not None:
+            self._loop.remove_reader(fd)
+
+    def _on_readable(self, port: SerialPort, ser: serial.Serial):
+        try:
+            data = ser.read(ser.in_waiting or 1)
+            if not data:
+                # Readable but empty means the device is gone, e.g. the USB adapter was unplugged
+                raise serial.SerialException("device reports readiness to read but returned no data")
+        except (serial.SerialException, OSError) as e:
+            self._unwatch(port.name)
+            if port.set_state(SerialState.ERROR, expected=(SerialState.READING,)):
+                logger.error("[%s] Serial error: %s", port.name, e)
+                port.close_after_error(ser)
+                self.background.process_batch(port.name, [(None, None)])
+            return
+        batch = port.decode_chunk(data)
+        if batch:
+            self.background.process_batch(port.name, batch)
@@ -0,0 +1,215 @@
+"""
+# replay.py
+Plays a recorded log into the pipeline in place of serial_handler, to reproduce an incident
+or to load the server with real traffic.
+
+Three kinds of files are read, all through mmap:
+    binary raw logs of lib/rawlog.py (mainlog.bin, also .gz/.zst segments)
+    text raw logs, "{received_time}, {frame hex}" per line (the old mainlog.txt)
+    COBS encoded byte streams as they came from the serial port (e.g. test/main-log.bin)
+
+Frames are paced by their recorded received_time at speed times the original rate.
+speed=0, and COBS streams which have no times, inject as fast as the pipeline takes them.
+"""
+import logging
+import mmap
+import re
+import threading
+import time
+from queue import Queue
+from typing import Iterator
+
+import lib.cobs as cobs
+import lib.rawlog as rawlog
+from serialhandler.statemachine import SerialStateMachine
+from shared_data import DEFAULT_PORT, SerialState
+
+_TEXT_LINE = re.compile(rb"^\d+, *[0-9A-Fa-f]*\r?$")
+FORMATS = ("binary", "text", "cobs")
+
+logger = logging.getLogger(__name__)
+
+
+def detect_format(path: str) -> str:
+    """
+    Returns "binary", "text" or "cobs" from the first bytes of the file.
+    """
+    if path.endswith((".gz", ".zst")):
+        return "binary"
+    with open(path, "rb") as f:
+        head = f.read(256)
+    if head.startswith(rawlog.MAGIC):
+        return "binary"
+    if _TEXT_LINE.match(head.split(b"\n", 1)[0]):
+        return "text"
+    return "cobs"
+
+
+def read_frames(path: str, log_format: str = None) -> Iterator[tuple[int | None, bytes]]:
+    """
+    Iterates (received_time, frame) of a log file. received_time is None for COBS streams.
+    """
+    log_format = log_format or detect_format(path)
+    if log_format == "binary":
+        with rawlog.RawLogReader(path) as reader:
+            for received_time, frame in reader:
+                try:
+                    yield received_time, bytes(frame)
+                finally:
+                    # The reader cannot be closed while views into it are alive
+                    frame.release()
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if log_format == "text":
+            for line in iter(data.readline, b""):
+                received_time, _, frame_hex = line.partition(b",")
+                try:
+                    yield int(received_time), bytes.fromhex(frame_hex.strip().decode("ascii"))
+                except ValueError:
+                    continue
+        else:
+            decoder = cobs.CobsStreamDecoder()
+            for offset in range(0, len(data), 1 << 16):
+                for frame in decoder.feed(data[offset:offset + (1 << 16)]):
+                    yield None, frame
+
+
+class ReplaySource:
+    """
+    Takes the place of serial_handler: frames of the log are put into queue as
+    (port name, [(bytes, received_time), ...]) by the thread of get_serial_thread().
+
+    received_time is the time each frame is injected, so that the latency stats of Background
+    measure this run; keep_time=True keeps the recorded times instead, e.g. to compare logs.
+    The port shows READING while the log is played, and DISCONNECTED when it has ended.
+    """
+    def __init__(self, path: str, speed: float = 1.0, queue_size: int = 64, batch_size: int = 256,
+                 keep_time: bool = False, repeat: int = 1, port_name: str = DEFAULT_PORT, log_format: str = None):
+        self.path = path
+        self.speed = speed
+        self.queue = Queue(queue_size)
+        self.batch_size = batch_size
+        self.keep_time = keep_time
+        self.repeat = repeat
+        self.port_name = port_name
+        self.log_format = log_format or detect_format(path)
+        self.states = SerialStateMachine()
+        self.states.add_port(port_name)
+        self.ports = {port_name: self}
+        self.latency = {}
+        self.injected_frame_count = 0
+        self.blocked_put_count = 0
+        self.max_lag = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.finished = threading.Event()
+
+    def replay(self):
+        """
+        Plays the log repeat times. Blocks while the queue is full, so nothing is dropped.
+        """
+        self.states.set(self.port_name, SerialState.CONNECTED)
+        self.states.set(self.port_name, SerialState.READING)
+        self.start_time = time.perf_counter()
+        try:
+            for _ in range(self.repeat):
+                self._replay_once()
+        finally:
+            self.end_time = time.perf_counter()
+            self.states.set(self.port_name, SerialState.DISCONNECTED)
+            self.finished.set()
+
+    def _replay_once(self):
+        start = time.perf_counter()
+        first_time = None
+        batch = []
+        for received_time, frame in read_frames(self.path, self.log_format):
+            if self.speed > 0 and received_time is not None:
+                if first_time is None:
+                    first_time = received_time
+                delay = start + (received_time - first_time) / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    # Hands over what is due before waiting for the next frame
+                    if batch:
+                        self._put(batch)
+                        batch = []
+                    time.sleep(delay)
+                elif -delay > self.max_lag:
+                    self.max_lag = -delay
+            if not self.keep_time or received_time is None:
+                received_time = int(time.time() * 1000)
+            batch.append((frame, received_time))
+            if len(batch) >= self.batch_size:
+                self._put(batch)
+                batch = []
+        if batch:
+            self._put(batch)
+
+    def _put(self, batch: list[tuple[bytes, int]]):
+        if self.queue.full():
+            self.blocked_put_count += 1
+        self.queue.put((self.port_name, batch))
+        self.injected_frame_count += len(batch)
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of injected frames, the elapsed time and how far the replay fell behind the recorded pace.
+        """
+        end = self.end_time or time.perf_counter()
+        elapsed = end - self.start_time if self.start_time is not None else 0.0
+        return {
+            "path": self.path,
+            "format": self.log_format,
+            "speed": self.speed,
+            "frames": self.injected_frame_count,
+            "elapsed_s": elapsed,
+            "frames_per_s": self.injected_frame_count / elapsed if elapsed else 0.0,
+            "blocked_puts": self.blocked_put_count,
+            "max_lag_ms": self.max_lag * 1000,
+        }
+
+    def get_serial_thread(self) -> tuple[Queue, threading.Thread]:
+        self.serial_thread = threading.Thread(target=self.replay, name="replay", daemon=True)
+        return self.queue, self.serial_thread
+
+    # The rest is what httpserver.py uses of serial_handler
+
+    def get_info(self) -> dict:
+        return {"state": self.states.get(self.port_name).name, "device": self.path, "baudrate": None,
+                "reconnect_attempts": 0}
+
+    def get_counters(self) -> dict[str, int]:
+        return {"bytes": 0, "frames": self.injected_frame_count, "decode_errors": 0,
+                "blocked_puts": self.blocked_put_count, "dropped_frames": 0}
+
+    def get_states(self) -> dict[str, dict]:
+        return self.get_states_with_version()[0]
+
+    def get_states_with_version(self) -> tuple[dict[str, dict], int]:
+        states, version = self.states.get_all()
+        return {self.port_name: {**self.get_info(), "state": states[self.port_name].name}}, version
+
+    def wait_for_state_change(self, since: int, timeout: float) -> int:
+        return self.states.wait_for_change(since, timeout)
+
+    def get_queue_stats(self) -> dict[str, int]:
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "batch_size": self.batch_size,
+            "blocked_puts": self.blocked_put_count,
+            "dropped_frames": 0,
+        }
+
+    def list_serial_ports(self) -> list[dict]:
+        return []
+
+    def connect(self, portname: str, baudrate: int = 9600, timeout=0.1, name: str = DEFAULT_PORT) -> bool:
+        logger.warning("Replaying a log. Cannot connect to a serial port.")
+        return False
+
+    def disconnect(self, name: str = DEFAULT_PORT) -> bool:
+        return False
+
+    def write_data(self, data: bytes, name: str = DEFAULT_PORT) -> bool:
+        return False
@@ -1,123 +1,426 @@
+import logging
+import re
 import time
 from serial import Serial
 import serial
 import serial.tools.list_ports as list_ports
 import threading
-from queue import Queue
+from queue import Queue, Full
 
 import lib.cobs as cobs
-import shared_data
+from background.latency import LatencyStats
+from serialhandler.statemachine import SerialStateMachine
+from shared_data import DEFAULT_PORT, SerialState
 
-class serial_handler:
-    def __init__(self):
+# Port names are used in log file names, so only simple names are allowed
+_PORT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+logger = logging.getLogger(__name__)
+
+class PortQueue(Queue):
+    """
+    Queue of (port name, batch) items in which each port may hold at most port_size items.
+    A busy port that fills its share waits and drops its own batches, while the other ports can still put theirs.
+    """
+    def __init__(self, port_size: int = 0):
+        super().__init__()
+        self.port_size = port_size
+        self._port_counts = {}
+
+    def put(self, item, block: bool = True, timeout: float = None):
+        name = item[0]
+        with self.not_full:
+            if self.port_size > 0:
+                if not block:
+                    if self._port_counts.get(name, 0) >= self.port_size:
+                        raise Full
+                elif timeout is None:
+                    while self._port_counts.get(name, 0) >= self.port_size:
+                        self.not_full.wait()
+                else:
+                    deadline = time.monotonic() + timeout
+                    while self._port_counts.get(name, 0) >= self.port_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Full
+                        self.not_full.wait(remaining)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _put(self, item):
+        super()._put(item)
+        self._port_counts[item[0]] = self._port_counts.get(item[0], 0) + 1
+
+    def _get(self):
+        item = super()._get()
+        self._port_counts[item[0]] -= 1
+        # Waiting ports may be others than the one that got room, so wake them all
+        self.not_full.notify_all()
+        return item
+
+
+class SerialPort:
+    """
+    One named serial link, e.g. "radio" or "wired".
+    Each port has its own reader thread and COBS decoder, and its own share of the queue (see PortQueue),
+    so a busy link does not make the others wait or drop frames. Decoded frames of all ports go to
+    the same queue as (port name, [(bytes, received_time), ...]) and are parsed by the same background thread.
+
+    on_state_change(port, state) is called after every state change, from the thread that changed it.
+
+    After an error the port is opened again after reconnect_delay seconds, doubling the delay
+    after each failure up to reconnect_max_delay. reconnect_delay=0 disables reconnecting.
+    """
+    def __init__(self, name: str, queue: Queue, batch_size: int = 256, put_timeout: float = 0.5, on_state_change=None,
+                 states: SerialStateMachine = None, reconnect_delay: float = 0.5, reconnect_max_delay: float = 30.0):
+        self.name = name
         self.ser = None
+        self.device = None
+        self.baudrate = None
+        self.timeout = None
+        self.queue = queue
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.states = states or SerialStateMachine()
+        self.states.add_port(name)
+        self.on_state_change = on_state_change
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnect_attempts = 0
         self.read_thread = None
-        self.queue = Queue(10)
         self.cannot_read_count = 0
+        self.blocked_put_count = 0
+        self.dropped_frame_count = 0
+        self.byte_count = 0
+        # Keeps partial frames across reads
+        self.decoder = cobs.CobsStreamDecoder()
+        # decode: decoder.feed() of one read
+        self.latency = {"decode": LatencyStats()}
 
-    def list_serial_ports(self) -> list[dict[str, str, str]]:
-        available_ports = []
-        for port in list_ports.comports():
-            print(f"Port: {port.device}, Description: {port.description}, HWID: {port.hwid}")
-            available_ports.append({"device": port.device, "description": port.description, "hwid": port.hwid})
-        return available_ports
+    def get_state(self) -> SerialState:
+        return self.states.get(self.name)
+
+    def set_state(self, state: SerialState, expected: tuple[SerialState, ...] = None) -> bool:
+        """
+        See SerialStateMachine.set(). Returns whether the state was changed.
+        """
+        if not self.states.set(self.name, state, expected):
+            return False
+        if self.on_state_change is not None:
+            self.on_state_change(self, state)
+        return True
+
+    def get_info(self) -> dict:
+        return {"state": self.get_state().name, "device": self.device, "baudrate": self.baudrate,
+                "reconnect_attempts": self.reconnect_attempts}
+
+    def get_counters(self) -> dict[str, int]:
+        """
+        Returns the totals of this port since it was added.
+        """
+        return {
+            "bytes": self.byte_count,
+            "frames": self.decoder.frame_count,
+            "decode_errors": self.decoder.error_count,
+            "blocked_puts": self.blocked_put_count,
+            "dropped_frames": self.dropped_frame_count,
+        }
 
-    def connect(self, portname: str, baudrate: int = 9600, timeout=1) -> bool:
+    def connect(self, portname: str, baudrate: int = 9600, timeout=0.1) -> bool:
+        """
+        Opens the serial port. timeout is how long one read blocks when no data is
+        waiting, so it also bounds how long the reader takes to notice a disconnect.
+        """
+        self.reconnect_attempts = 0
+        return self._open(portname, baudrate, timeout)
+
+    def reconnect(self) -> bool:
+        """
+        Opens the last device again after an error.
+        """
+        self.reconnect_attempts += 1
+        logger.info("[%s] Reconnecting to %s (attempt %d).", self.name, self.device, self.reconnect_attempts)
+        return self._open(self.device, self.baudrate, self.timeout)
+
+    def next_reconnect_delay(self) -> float | None:
+        """
+        Returns how many seconds to wait before the next reconnect, or None if the port should not reconnect.
+        """
+        if self.reconnect_delay <= 0 or self.device is None or self.get_state() != SerialState.ERROR:
+            return None
+        return min(self.reconnect_delay * 2 ** self.reconnect_attempts, self.reconnect_max_delay)
+
+    def _open(self, portname: str, baudrate: int, timeout) -> bool:
         if self.ser and self.ser.is_open:
-            print("Already connected to a serial port. Disconnect it.")
+            logger.info("[%s] Already connected to a serial port. Disconnect it.", self.name)
             self.disconnect()
         try:
+            self.device = portname
+            self.baudrate = baudrate
+            self.timeout = timeout
             self.ser = Serial(portname, baudrate, timeout=timeout)
-            with shared_data.state_lock:
-                shared_data.serial_state = shared_data.SerialState.CONNECTED
-            print(f"Connected to {portname} at {baudrate} baud.")
+            self.decoder.reset()
+            self.set_state(SerialState.CONNECTED)
+            logger.info("[%s] Connected to %s at %s baud.", self.name, portname, baudrate)
             return True
         except serial.SerialException as e:
-            print(f"Connection error: {e}")
-            with shared_data.state_lock:
-                shared_data.serial_state = shared_data.SerialState.ERROR
+            logger.warning("[%s] Connection error: %s", self.name, e)
+            self.set_state(SerialState.ERROR)
             return False
 
     def disconnect(self):
         if self.ser and self.ser.is_open:
+            # The state is changed first, so that the reader does not take the closed port for an error
+            self.set_state(SerialState.DISCONNECTED)
             self.ser.close()
-            with shared_data.state_lock:
-                shared_data.serial_state = shared_data.SerialState.DISCONNECTED
-            print("Disconnected.")
+            logger.info("[%s] Disconnected.", self.name)
+            return True
+        elif self.set_state(SerialState.DISCONNECTED, expected=(SerialState.ERROR,)):
+            logger.info("[%s] Stopped reconnecting.", self.name)
             return True
         else:
-            print("Serial port is not open.")
+            logger.info("[%s] Serial port is not open.", self.name)
             return False
 
     def write_data(self, data: bytes) -> bool:
         if not self.ser or not self.ser.is_open:
-            print("Serial port is not open.")
+            logger.info("[%s] Serial port is not open.", self.name)
             return False
         try:
-            print(f"Writing data: {data.hex()}")
+            logger.debug("[%s] Writing data: %s", self.name, data.hex())
             self.ser.write(data)
             return True
         except serial.SerialException as e:
-            print(f"Error writing data: {e}")
+            logger.warning("[%s] Error writing data: %s", self.name, e)
             return False
 
     def read_data(self):
         """
         Continuously reads data from the serial port and processes it.
+        All bytes waiting in the OS buffer are read at once and every complete
+        COBS frame in them is queued. Partial frames are kept until the next read.
         If the state changes to something other than READING, it stops reading.
         """
-        if not self.ser or not self.ser.is_open:
+        ser = self.ser
+        if not ser or not ser.is_open:
             self.cannot_read_count += 1
             if self.cannot_read_count > 10:
-                print("Serial port is not open. Cannot start reading.")
+                logger.warning("[%s] Serial port is not open. Cannot start reading.", self.name)
                 self.cannot_read_count = 0
             return
-        with shared_data.state_lock:
-            shared_data.serial_state = shared_data.SerialState.READING
-        current_state = shared_data.SerialState.READING
+        if not self.set_state(SerialState.READING, expected=(SerialState.CONNECTED,)):
+            return
         while True:
             # Check if the state has changed by other threads
-            if shared_data.state_lock.acquire(timeout=0.1):
-                try:
-                    current_state = shared_data.serial_state
-                finally:
-                    shared_data.state_lock.release()
-            if current_state != shared_data.SerialState.READING:
-                print("Reading stopped due to state change.")
+            if self.get_state() != SerialState.READING:
+                logger.info("[%s] Reading stopped due to state change.", self.name)
                 return
 
-            data_buf = bytes()
             try:
-                data = self.ser.read_until(b'\x00')
+                # Drain everything the OS has buffered in one read.
+                # If nothing is waiting, block for one byte until the port's own timeout.
+                data = ser.read(ser.in_waiting or 1)
                 if not data:
-                    threading.Event().wait(0.05)  # Wait a bit before trying to read again
                     continue
-                print(f"Raw data received: {data.hex()}")
-                data_buf += data[:-1]
-                if (data.endswith(b'\x00')):
-                    decoded_data, _ = cobs.cobs_decode(data)
-                    received_time = int(time.time() * 1000)  # Current time in milliseconds
-                    self.queue.put((bytes(decoded_data), received_time))
-                    data_buf = bytes()
-            except serial.SerialException as e:
-                print(f"Serial error: {e}")
-                self.queue.put((None, None))
-                with shared_data.state_lock:
-                    shared_data.serial_state = shared_data.SerialState.ERROR
-                return 
+                self.reconnect_attempts = 0
+                batch = self.decode_chunk(data)
+                for i in range(0, len(batch), self.batch_size):
+                    self._put_batch(batch[i:i + self.batch_size])
+            except (serial.SerialException, OSError) as e:
+                # Closing the port from another thread also ends up here, but then the state is no longer READING
+                if self.set_state(SerialState.ERROR, expected=(SerialState.READING,)):
+                    logger.error("[%s] Serial error: %s", self.name, e)
+                    self.close_after_error(ser)
+                    self._put_batch([(None, None)])
+                return
+            except TypeError:
+                # pyserial reads from a file descriptor of None when disconnect() closed the port during the read
+                if self.get_state() == SerialState.READING:
+                    raise
+                return
 
-    def serial_handle(self):
+    def close_after_error(self, ser: Serial):
+        try:
+            ser.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def decode_chunk(self, data: bytes) -> list[tuple[bytes, int]]:
         """
-        Starts the serial handler, which includes reading data from the serial port.
-        If the read fails, it will attempt to reconnect.
+        Feeds bytes read from the port to the decoder and returns the completed frames as (bytes, received_time).
+        """
+        received_time = int(time.time() * 1000)  # Current time in milliseconds
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] Raw data received: %s", self.name, data.hex())
+        self.byte_count += len(data)
+        start = time.perf_counter()
+        batch = [(decoded_data, received_time) for decoded_data in self.decoder.feed(data)]
+        self.latency["decode"].record(time.perf_counter() - start)
+        return batch
+
+    def _put_batch(self, batch: list[tuple[bytes, int]]):
+        """
+        Puts a list of frames into the queue. If the queue is full, it waits up to
+        put_timeout seconds and then drops the list.
+        """
+        item = (self.name, batch)
+        try:
+            self.queue.put_nowait(item)
+            return
+        except Full:
+            self.blocked_put_count += 1
+        try:
+            self.queue.put(item, timeout=self.put_timeout)
+        except Full:
+            self.dropped_frame_count += len(batch)
+            logger.warning("[%s] Queue is full. Dropped %d frames.", self.name, len(batch))
 
-        If you want to open, close or change serial port,
-        you should call the connect or disconnect methods from outside this thread.
-        It will stop reading and wait for the next connection attempt.
+    def serial_handle(self):
+        """
+        Reads the port whenever it is connected, and reconnects after errors.
+        Call connect or disconnect from outside this thread to open, close or change the port;
+        this thread wakes up on the state change without polling.
         """
         while True:
-            self.read_data()  # returns when the state changes
-            threading.Event().wait(1)  # Wait before trying to reconnect
+            states, version = self.states.get_all()
+            if states[self.name] == SerialState.CONNECTED:
+                self.read_data()  # returns when the state changes
+                continue
+            delay = self.next_reconnect_delay()
+            if delay is None:
+                # Wakes up on any transition and checks again
+                self.states.wait_for(self.name, (SerialState.CONNECTED,), since=version)
+            elif self.states.wait_for(self.name, (SerialState.CONNECTED, SerialState.DISCONNECTED), delay) == SerialState.ERROR:
+                # Nobody connected or disconnected the port during the delay
+                self.reconnect()
+
+    def start(self):
+        """
+        Starts the reader thread of this port. Does nothing if it is already running.
+        """
+        if self.read_thread is None:
+            self.read_thread = threading.Thread(target=self.serial_handle, name=f"serial-{self.name}", daemon=True)
+            self.read_thread.start()
+
+
+class serial_handler:
+    """
+    Manages the named serial ports. All of them feed one PortQueue to the background thread.
+    Methods that take a port name use DEFAULT_PORT when it is not given.
+    """
+    def __init__(self, queue_size: int = 64, batch_size: int = 256, put_timeout: float = 0.5,
+                 reconnect_delay: float = 0.5, reconnect_max_delay: float = 30.0):
+        """
+        Frames are handed to the background thread as (port name, [(bytes, received_time), ...]).
+        queue_size is the number of lists the queue holds for each port, and batch_size is the
+        maximum number of frames in one list.
+        If the share of a port stays full for put_timeout seconds, its list is dropped.
+        reconnect_delay and reconnect_max_delay are passed to each SerialPort.
+        """
+        self.queue = PortQueue(queue_size)
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.states = SerialStateMachine()
+        self.ports = {}
+        self._ports_lock = threading.Lock()
+        self._started = False
+        self._on_state_change = None
+        self.get_port(DEFAULT_PORT, create=True)
+
+    def get_port(self, name: str = DEFAULT_PORT, create: bool = False) -> SerialPort | None:
+        """
+        Returns the port with the given name, or None if there is no such port.
+        With create=True a new port is added (and its reader started, if the handler runs).
+        Raises ValueError for names that are not [A-Za-z0-9_-]{1,32}.
+        """
+        with self._ports_lock:
+            port = self.ports.get(name)
+            if port is None and create:
+                if not _PORT_NAME.match(name):
+                    raise ValueError(f"Invalid port name: {name}")
+                port = SerialPort(name, self.queue, self.batch_size, self.put_timeout, self._on_state_change,
+                                  self.states, self.reconnect_delay, self.reconnect_max_delay)
+                # Replaced, not modified, so that other threads can iterate it without the lock
+                self.ports = {**self.ports, name: port}
+                if self._started:
+                    port.start()
+        return port
+
+    def set_state_listener(self, on_state_change):
+        """
+        Sets on_state_change(port, state) of every port, including the ports added later.
+        """
+        with self._ports_lock:
+            self._on_state_change = on_state_change
+            for port in self.ports.values():
+                port.on_state_change = on_state_change
+
+    def list_serial_ports(self) -> list[dict[str, str, str]]:
+        available_ports = []
+        for port in list_ports.comports():
+            logger.debug("Port: %s, Description: %s, HWID: %s", port.device, port.description, port.hwid)
+            available_ports.append({"device": port.device, "description": port.description, "hwid": port.hwid})
+        return available_ports
+
+    def connect(self, portname: str, baudrate: int = 9600, timeout=0.1, name: str = DEFAULT_PORT) -> bool:
+        """
+        Opens the serial device portname as the port called name, adding the port if needed.
+        """
+        return self.get_port(name, create=True).connect(portname, baudrate, timeout)
+
+    def disconnect(self, name: str = DEFAULT_PORT) -> bool:
+        port = self.get_port(name)
+        return port is not None and port.disconnect()
+
+    def write_data(self, data: bytes, name: str = DEFAULT_PORT) -> bool:
+        port = self.get_port(name)
+        return port is not None and port.write_data(data)
+
+    def get_states(self) -> dict[str, dict]:
+        """
+        Returns {port name: {"state", "device", "baudrate", "reconnect_attempts"}}.
+        """
+        return self.get_states_with_version()[0]
+
+    def get_states_with_version(self) -> tuple[dict[str, dict], int]:
+        """
+        Returns get_states() with the version of SerialStateMachine, taken at the same moment.
+        """
+        states, version = self.states.get_all()
+        return {name: {**port.get_info(), "state": states[name].name} for name, port in self.ports.items()}, version
+
+    def wait_for_state_change(self, since: int, timeout: float) -> int:
+        """
+        Waits until a port changes its state after version since, or until timeout seconds have passed.
+        Returns the current version.
+        """
+        return self.states.wait_for_change(since, timeout)
+
+    def get_queue_stats(self) -> dict[str, int]:
+        """
+        Returns counters about the hand-off queue to the background thread. capacity is the share of each port.
+        """
+        ports = self.ports.values()
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.port_size,
+            "batch_size": self.batch_size,
+            "blocked_puts": sum(port.blocked_put_count for port in ports),
+            "dropped_frames": sum(port.dropped_frame_count for port in ports),
+        }
+
+    def serial_handle(self):
+        """
+        Starts the reader thread of each port. Ports added later start their reader when they are added.
+        """
+        with self._ports_lock:
+            self._started = True
+            ports = list(self.ports.values())
+        for port in ports:
+            port.start()
 
     def get_serial_thread(self) -> tuple[Queue, threading.Thread]:
         self.serial_thread = threading.Thread(target=self.serial_handle, daemon=True)
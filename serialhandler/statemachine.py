@@ -0,0 +1,78 @@
+import threading
+
+from shared_data import SerialState
+
+# Allowed transitions. ERROR -> ERROR is a failed reconnect, which clients waiting for changes should see.
+TRANSITIONS = {
+    SerialState.DISCONNECTED: {SerialState.CONNECTED, SerialState.ERROR},
+    SerialState.CONNECTED: {SerialState.READING, SerialState.DISCONNECTED, SerialState.ERROR},
+    SerialState.READING: {SerialState.DISCONNECTED, SerialState.ERROR},
+    SerialState.ERROR: {SerialState.CONNECTED, SerialState.DISCONNECTED, SerialState.ERROR},
+}
+
+
+class SerialStateMachine:
+    """
+    States of all serial ports, guarded by one condition variable.
+    Threads wait for a transition instead of polling: the reader of a port waits for it to be connected,
+    and HTTP clients wait for any transition with wait_for_change().
+
+    version counts the transitions of all ports, so a waiter can tell whether it missed one.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._states = {}
+        self.version = 0
+
+    def add_port(self, name: str):
+        with self._condition:
+            self._states.setdefault(name, SerialState.DISCONNECTED)
+
+    def get(self, name: str) -> SerialState:
+        with self._condition:
+            return self._states[name]
+
+    def get_all(self) -> tuple[dict[str, SerialState], int]:
+        """
+        Returns ({port name: state}, version) at one moment.
+        """
+        with self._condition:
+            return dict(self._states), self.version
+
+    def set(self, name: str, state: SerialState, expected: tuple[SerialState, ...] = None) -> bool:
+        """
+        Changes the state of a port and wakes the waiting threads.
+        With expected, the state is changed only if it is one of them, and False is returned otherwise,
+        so that a thread does not overwrite a change made by another thread in the meantime.
+        Raises ValueError for a transition that is not in TRANSITIONS.
+        """
+        with self._condition:
+            current = self._states[name]
+            if expected is not None and current not in expected:
+                return False
+            if state not in TRANSITIONS[current]:
+                if state == current:
+                    return False
+                raise ValueError(f"Invalid state transition of {name}: {current.name} -> {state.name}")
+            self._states[name] = state
+            self.version += 1
+            self._condition.notify_all()
+            return True
+
+    def wait_for(self, name: str, states: tuple[SerialState, ...], timeout: float = None, since: int = None) -> SerialState:
+        """
+        Waits until the port is in one of states, or until timeout seconds have passed.
+        If since is given, it also returns as soon as version differs from it.
+        Returns the state at that moment.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._states[name] in states or (since is not None and self.version != since), timeout)
+            return self._states[name]
+
+    def wait_for_change(self, since: int, timeout: float) -> int:
+        """
+        Waits until version differs from since, or until timeout seconds have passed. Returns version.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != since, timeout)
+            return self.version
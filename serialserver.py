@@ -1,31 +1,154 @@
 import argparse
-import threading
-from flask import Flask, Blueprint, jsonify, request
-from queue import Queue
+import asyncio
+import signal
+import sys
+from flask import Flask
 
 import serialhandler.serialhandler as serial_handler
 import background.background as background
 import httpserver.httpserver as httpserver
+import httpserver.websocketserver as websocketserver
+from lib.log import LEVELS, setup_logging
+from serialhandler.replay import ReplaySource
 
-argparser = argparse.ArgumentParser(description="Serial Server\n" \
-                                    "  read and write data from serial port and provide HTTP API"
-                                    , formatter_class=argparse.RawDescriptionHelpFormatter)
-argparser.add_argument("-p", "--port", type=int, default=7878, help="Port number for the HTTP server (default: 7878)")
-args = argparser.parse_args()
+SERVERS = ("flask", "waitress")
+ENGINES = ("threaded", "asyncio")
 
-if __name__ == "__main__":
-    port_number = args.port
-    serial_handler_instance = serial_handler.serial_handler()
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    argparser = argparse.ArgumentParser(description="Serial Server\n" \
+                                        "  read and write data from serial port and provide HTTP API"
+                                        , formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("-p", "--port", type=int, default=7878, help="Port number for the HTTP server (default: 7878)")
+    argparser.add_argument("--host", default="127.0.0.1",
+                           help="Address the HTTP and WebSocket servers bind to, e.g. 0.0.0.0 for all interfaces (default: 127.0.0.1)")
+    argparser.add_argument("--server", choices=SERVERS, default="flask",
+                           help="HTTP server: flask (development server) or waitress (production server) (default: flask)")
+    argparser.add_argument("--engine", choices=ENGINES, default="threaded",
+                           help="threaded: one thread per serial port and for parsing, "
+                                "asyncio: one event loop reads the ports, parses and serves HTTP; --server is ignored (default: threaded)")
+    argparser.add_argument("--threads", type=int, default=16,
+                           help="Number of worker threads of the waitress server, or of the request handlers of the asyncio engine (default: 16)")
+    argparser.add_argument("--keep-alive", type=int, default=120,
+                           help="Seconds an idle keep-alive connection is kept open by the waitress server or the asyncio engine (default: 120)")
+    argparser.add_argument("--connection-limit", type=int, default=100,
+                           help="Maximum number of connections of the waitress server (default: 100)")
+    argparser.add_argument("--queue-size", type=int, default=64, help="Number of frame batches each serial port can queue (default: 64)")
+    argparser.add_argument("--batch-size", type=int, default=256, help="Maximum number of frames in one batch (default: 256)")
+    argparser.add_argument("--reconnect-delay", type=float, default=0.5,
+                           help="Seconds before a port is opened again after an error, 0 to disable reconnecting (default: 0.5)")
+    argparser.add_argument("--reconnect-max-delay", type=float, default=30.0,
+                           help="The reconnect delay doubles after each failure up to this many seconds (default: 30)")
+    argparser.add_argument("--parse-workers", type=int, default=0,
+                           help="Number of processes that parse the frames, 0 to parse them in the Background thread (default: 0)")
+    argparser.add_argument("--log-queue-size", type=int, default=8192, help="Number of log records waiting to be written (default: 8192)")
+    argparser.add_argument("--log-policy", choices=["drop", "block"], default="drop",
+                           help="What to do when the log queue is full: drop the record or block parsing (default: drop)")
+    argparser.add_argument("--log-rotate-bytes", type=int, default=64 << 20,
+                           help="Start a new log segment after this many bytes, 0 to disable (default: 64 MiB)")
+    argparser.add_argument("--log-rotate-seconds", type=float, default=3600,
+                           help="Start a new log segment after this many seconds, 0 to disable (default: 3600)")
+    argparser.add_argument("--log-compression", choices=["gzip", "zstd", "none"], default="gzip",
+                           help="Compression of finished log segments (default: gzip)")
+    argparser.add_argument("--replay", default=None, metavar="LOG",
+                           help="Play a recorded log (binary, text or COBS stream) instead of reading serial ports")
+    argparser.add_argument("--replay-speed", type=float, default=1.0,
+                           help="Multiple of the recorded rate for --replay, 0 for as fast as possible (default: 1.0)")
+    argparser.add_argument("--log-level", choices=LEVELS, default="INFO",
+                           help="Level of the messages printed to stderr; DEBUG prints every frame (default: INFO)")
+    argparser.add_argument("--log-rate-limit", type=int, default=10,
+                           help="Messages of the same kind printed per second at most, 0 for no limit; "
+                                "the rest are counted and summarized (default: 10)")
+    argparser.add_argument("--log-sample", type=int, default=1,
+                           help="Print only 1 in N DEBUG messages of the same kind, e.g. per-frame messages (default: 1)")
+    argparser.add_argument("--ws-port", type=int, default=None,
+                           help="Port number for the WebSocket telemetry feed (default: disabled)")
+    return argparser.parse_args(argv)
+
+def start_workers(args: argparse.Namespace) -> tuple[serial_handler.serial_handler, background.Background]:
+    """
+    Creates the serial handler and the Background worker and, with the threaded engine, starts their threads.
+    With the asyncio engine they are run by serve_asyncio() instead.
+    Call this only once per process.
+    """
+    if args.replay is not None:
+        if args.engine != "threaded":
+            raise SystemExit("--replay works only with --engine threaded.")
+        serial_handler_instance = ReplaySource(args.replay, args.replay_speed, queue_size=args.queue_size,
+                                               batch_size=args.batch_size)
+    else:
+        serial_handler_instance = serial_handler.serial_handler(queue_size=args.queue_size, batch_size=args.batch_size,
+                                                                reconnect_delay=args.reconnect_delay,
+                                                                reconnect_max_delay=args.reconnect_max_delay)
     dataQueue, read_thread = serial_handler_instance.get_serial_thread()
-    background_instance = background.Background(dataQueue)
-    background_thread = background_instance.get_background_thread(dataQueue)
-    read_thread.start()
-    background_thread.start()
+    background_instance = background.Background(dataQueue, log_queue_size=args.log_queue_size, log_policy=args.log_policy,
+                                                log_rotate_bytes=args.log_rotate_bytes,
+                                                log_rotate_seconds=args.log_rotate_seconds,
+                                                log_compression=args.log_compression,
+                                                parse_workers=args.parse_workers)
+    if args.engine == "threaded":
+        background_thread = background_instance.get_background_thread(dataQueue)
+        read_thread.start()
+        background_thread.start()
+    if args.ws_port is not None:
+        ws_server = websocketserver.WebSocketServer(background_instance.telemetry_feed, args.host, args.ws_port)
+        ws_server.get_server_thread().start()
+    return serial_handler_instance, background_instance
 
+def create_app(serial_handler_instance, background_instance) -> Flask:
+    """
+    Creates the Flask app that serves the API. It does not start any thread.
+    """
     app_main = Flask(__name__)
     app_main.config["serial_handler_instance"] = serial_handler_instance
     app_main.config["background_instance"] = background_instance
     app_main.register_blueprint(httpserver.app)
+    return app_main
+
+def serve(app_main: Flask, args: argparse.Namespace):
+    """
+    Serves the app with the server chosen by --server until the process is stopped.
+    """
+    if args.server == "waitress":
+        try:
+            import waitress
+        except ImportError:
+            raise SystemExit("--server waitress requires waitress. Install it with `pip install waitress`.")
+        waitress.serve(app_main, host=args.host, port=args.port, threads=args.threads,
+                       channel_timeout=args.keep_alive, connection_limit=args.connection_limit, ident="serial-server")
+    else:
+        # The reloader would run this module again in a child process and start the threads twice
+        app_main.run(host=args.host, port=args.port, threaded=True, use_reloader=False)
+
+def serve_asyncio(app_main: Flask, args: argparse.Namespace, serial_handler_instance, background_instance):
+    """
+    Reads the serial ports, parses the frames and serves the app from one event loop until the process is stopped.
+    """
+    from httpserver.asyncwsgi import AsyncWSGIServer
+    from serialhandler.asyncengine import AsyncSerialEngine
 
-    app_main.run(host='127.0.0.1', port=port_number)
+    engine = AsyncSerialEngine(serial_handler_instance, background_instance)
+    http_server = AsyncWSGIServer(app_main, args.host, args.port, threads=args.threads, keep_alive=args.keep_alive)
 
+    async def run():
+        await asyncio.gather(engine.run(), http_server.serve())
+
+    asyncio.run(run())
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    setup_logging(args.log_level, burst=args.log_rate_limit, sample=args.log_sample)
+    # Stop with SystemExit like with Ctrl+C (KeyboardInterrupt), so that the logs are closed below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    serial_handler_instance, background_instance = start_workers(args)
+    app_main = create_app(serial_handler_instance, background_instance)
+    if args.engine == "asyncio":
+        # asyncio.run() cancels the engine, which closes the logs itself
+        serve_asyncio(app_main, args, serial_handler_instance, background_instance)
+        return
+    try:
+        serve(app_main, args)
+    finally:
+        background_instance.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,53 @@
 This module contains shared data structures and state management for the serial server.
 It is used for thread-safe access to data and serial connection state.
 """
-import threading
 from enum import Enum, auto
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
 
-# Shared data and lock for thread-safe access (between background threads and HTTP server)
-data_lock = threading.Lock()
-data_dict = {}
+# Latest parsed data (between background threads and HTTP server)
+class DataSnapshot(NamedTuple):
+    """
+    Immutable view of the latest parsed data of each parser.
+    The Background thread replaces data_snapshot with a new snapshot after each update,
+    so readers can use it without a lock and never see a half-updated state.
+    """
+    version: int                    # Increases by one with each published snapshot
+    data: Mapping[str, dict]        # parser name -> latest parsed data
+    versions: Mapping[str, int]     # parser name -> version in which its data last changed
 
-# State management for the serial connection (between serial handler and HTTP server)
-state_lock = threading.Lock()
+    def changed_since(self, version: int) -> dict[str, dict]:
+        """
+        Returns {parser name: data} of the parsers that changed after the given version.
+        """
+        return {name: self.data[name] for name, changed in self.versions.items() if changed > version}
+
+    def update(self, updates: dict[str, dict]) -> "DataSnapshot":
+        """
+        Returns the next snapshot with updates applied.
+        """
+        version = self.version + 1
+        data = dict(self.data)
+        data.update(updates)
+        versions = dict(self.versions)
+        versions.update(dict.fromkeys(updates, version))
+        return DataSnapshot(version, MappingProxyType(data), MappingProxyType(versions))
+
+# Latest data of all ports together, and of each port (port name -> DataSnapshot)
+EMPTY_SNAPSHOT = DataSnapshot(0, MappingProxyType({}), MappingProxyType({}))
+data_snapshot = EMPTY_SNAPSHOT
+port_snapshots: Mapping[str, DataSnapshot] = MappingProxyType({})
+
+# Name of the serial port used when a request does not name one
+DEFAULT_PORT = "main"
+
+# States of a serial port (each SerialPort in serialhandler keeps its own)
 class SerialState(Enum):
     CONNECTED = auto()
     DISCONNECTED = auto()
     READING = auto()
     ERROR = auto()
-serial_state = SerialState.DISCONNECTED
 
 # File path for logging
-log_raw_file_path = "mainlog.txt"
+log_raw_file_path = "mainlog.bin"  # Binary raw log, see lib/rawlog.py
 log_processed_file_path = "processedlog.txt"
\ No newline at end of file
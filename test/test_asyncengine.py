@@ -0,0 +1,143 @@
+import sys
+import os
+import asyncio
+import http.client
+import threading
+import time
+
+import pytest
+
+# Add the parent directory to sys.path to import serialhandler.asyncengine
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response
+
+import background.background as background
+from httpserver.asyncwsgi import AsyncWSGIServer
+from lib.cobs import CobsStreamDecoder
+from serialhandler.asyncengine import AsyncSerialEngine
+import serialhandler.serialhandler as serialhandler
+import shared_data
+
+
+def test_async_wsgi_server():
+    app = Flask(__name__)
+    app.add_url_rule("/hello", "hello", lambda: {"hello": "world"})
+    app.add_url_rule("/stream", "stream", lambda: Response(iter(["a", "bb", "ccc"]), mimetype="text/plain"))
+    server = AsyncWSGIServer(app, "127.0.0.1", 0, threads=2)
+    loop = asyncio.new_event_loop()
+    port = loop.run_until_complete(server.start()).sockets[0].getsockname()[1]
+    task = loop.create_task(server.serve())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        # Both requests use the same keep-alive connection
+        for _ in range(2):
+            connection.request("GET", "/hello")
+            response = connection.getresponse()
+            assert response.status == 200
+            assert response.read() == b'{"hello":"world"}\n'
+        connection.request("GET", "/stream")
+        response = connection.getresponse()
+        assert response.headers["Transfer-Encoding"] == "chunked"
+        assert response.read() == b"abbccc"
+        connection.request("GET", "/missing")
+        assert connection.getresponse().status == 404
+        connection.close()
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+
+
+def test_async_streams_wait_on_the_event_loop():
+    import socket
+    import httpserver.httpserver as httpserver
+
+    app = Flask(__name__)
+    bg = background.Background(None)
+    app.config["background_instance"] = bg
+    app.register_blueprint(httpserver.app)
+    server = AsyncWSGIServer(app, "127.0.0.1", 0, threads=2)
+    loop = asyncio.new_event_loop()
+    port = loop.run_until_complete(server.start()).sockets[0].getsockname()[1]
+    task = loop.create_task(server.serve())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    streams = []
+    try:
+        # More idle streams than pool threads
+        for _ in range(4):
+            stream = socket.create_connection(("127.0.0.1", port), timeout=5)
+            stream.sendall(b"GET /stream HTTP/1.1\r\nHost: test\r\n\r\n")
+            streams.append(stream)
+        for stream in streams:
+            received = b""
+            while b"retry: 1000" not in received:
+                received += stream.recv(4096)
+        assert bg.broadcaster.get_subscriber_count() == 4
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        connection.request("GET", "/test")
+        assert connection.getresponse().status == 200
+        connection.close()
+
+        bg.broadcaster.publish("gps", {"latitude": 1.0})
+        for stream in streams:
+            received = b""
+            while b"\n\n" not in received.partition(b"event: gps")[2]:
+                received += stream.recv(4096)
+            assert b'data: {"latitude": 1.0}' in received
+        for stream in streams:
+            stream.close()
+        for _ in range(100):
+            if bg.broadcaster.get_subscriber_count() == 0:
+                break
+            bg.broadcaster.publish("gps", {"latitude": 2.0})
+            time.sleep(0.02)
+        assert bg.broadcaster.get_subscriber_count() == 0
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="needs a pseudo terminal")
+def test_async_serial_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_data, "log_raw_file_path", str(tmp_path / "raw.bin"))
+    monkeypatch.setattr(shared_data, "log_processed_file_path", str(tmp_path / "processed.log"))
+    monkeypatch.setattr(shared_data, "data_snapshot", shared_data.EMPTY_SNAPSHOT)
+    monkeypatch.setattr(shared_data, "port_snapshots", shared_data.port_snapshots)
+    with open("test/main-log.bin", "rb") as f:
+        stream = f.read(4096)
+    frame_count = len(list(CobsStreamDecoder().feed(stream)))
+    master, slave = os.openpty()
+
+    handler = serialhandler.serial_handler()
+    bg = background.Background(handler.queue, log_compression="none")
+    engine = AsyncSerialEngine(handler, bg)
+    processed = []
+    process_batch = bg.process_batch
+    monkeypatch.setattr(bg, "process_batch", lambda port_name, batch: (processed.extend(batch), process_batch(port_name, batch)))
+
+    async def run():
+        task = asyncio.create_task(engine.run())
+        await asyncio.sleep(0)
+        # Connected from another thread, as the HTTP handlers do
+        await asyncio.to_thread(handler.connect, os.ttyname(slave), 115200)
+        await asyncio.sleep(0.1)
+        assert handler.get_port().get_state() == shared_data.SerialState.READING
+        os.write(master, stream)
+        for _ in range(100):
+            if len(processed) >= frame_count:
+                break
+            await asyncio.sleep(0.02)
+        await asyncio.to_thread(handler.disconnect)
+        await asyncio.sleep(0.05)
+        assert engine._watched == {}
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    try:
+        asyncio.run(run())
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert len(processed) == frame_count
+    assert shared_data.data_snapshot.version > 0
+    assert handler.get_port().get_state() == shared_data.SerialState.DISCONNECTED
@@ -0,0 +1,61 @@
+import sys
+import os
+import threading
+
+# Add the parent directory to sys.path to import background.broadcaster
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.broadcaster import Broadcaster
+
+
+def test_broadcaster_subscription():
+    broadcaster = Broadcaster(subscriber_queue_size=4, recent_size=8)
+    all_parsers = broadcaster.subscribe()
+    only_a = broadcaster.subscribe({"a"})
+    for i in range(6):
+        broadcaster.publish("a" if i % 2 == 0 else "b", {"value": i})
+
+    # The slow subscriber keeps only the newest events
+    events = all_parsers.get(timeout=0)
+    assert [event.seq for event in events] == [3, 4, 5, 6]
+    assert all_parsers.dropped_count == 2
+    assert [event.to_json() for event in only_a.get(timeout=0)] == ['{"value": 0}', '{"value": 2}', '{"value": 4}']
+    assert all_parsers.get(timeout=0) == []
+
+    # A new subscriber can resume from a seq
+    resumed = broadcaster.subscribe({"b"}, since=3)
+    assert [event.seq for event in resumed.get(timeout=0)] == [4, 6]
+
+    broadcaster.unsubscribe(all_parsers)
+    broadcaster.publish("a", {"value": 6})
+    assert all_parsers.get(timeout=0) == []
+    assert all_parsers.closed
+    assert broadcaster.get_subscriber_count() == 2
+
+
+def test_broadcaster_wait_since():
+    broadcaster = Broadcaster(recent_size=4)
+    for i in range(6):
+        broadcaster.publish("a" if i % 2 == 0 else "b", {"value": i})
+
+    events, missed, seq = broadcaster.wait_since(0, timeout=0)
+    assert [event.seq for event in events] == [3, 4, 5, 6]
+    assert (missed, seq) == (2, 6)
+    events, missed, seq = broadcaster.wait_since(4, {"a"}, timeout=0)
+    assert [event.seq for event in events] == [5]
+    assert (missed, seq) == (0, 6)
+    events, missed, seq = broadcaster.wait_since(2, timeout=0, limit=2)
+    assert [event.seq for event in events] == [3, 4]
+    assert (missed, seq) == (0, 4)
+
+    # Waits until a new event is published
+    timer = threading.Timer(0.1, broadcaster.publish, args=("b", {"value": 6}))
+    timer.start()
+    events, missed, seq = broadcaster.wait_since(6, timeout=5)
+    timer.join()
+    assert [(event.seq, event.parser_name, event.data) for event in events] == [(7, "b", {"value": 6})]
+    assert seq == 7
+
+    # Nothing new within the timeout
+    events, missed, seq = broadcaster.wait_since(7, timeout=0.05)
+    assert (events, missed, seq) == ([], 0, 7)
@@ -40,4 +40,74 @@ def test_cobs():
     print(f'Decoded Data: {decoded_data}')
 
     # Check if the decoded data matches the original test data
-    assert decoded_data == test_data, "Decoded data does not match original data!"
\ No newline at end of file
+    assert decoded_data == test_data, "Decoded data does not match original data!"
+
+def test_cobs_bytes():
+    import sys
+    import os
+
+    # Add the parent directory to sys.path to import lib.cobs
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from lib.cobs import cobs_encode_bytes, cobs_decode_bytes
+    import cobs.cobs
+
+    test_data = bytes([1, 2, 3, 0, 4, 5, 6, 0, 7, 8, 9, 0]) + bytes(range(256)) + bytes(range(1, 256)) * 3
+    test_data += bytes([4, 5, 6, 0, 0, 7, 8, 9, 0, 10, 11, 12, 0])
+
+    for length in [0, 1, 253, 254, 255, 508, 509, len(test_data)]:
+        for start in range(0, len(test_data) - length + 1, 37):
+            sub_test_data = test_data[start:start + length]
+            encoded_data = cobs_encode_bytes(sub_test_data)
+            assert encoded_data == cobs.cobs.encode(sub_test_data) + b'\x00', "Encoding mismatch!"
+
+            decoded_data, rest_index = cobs_decode_bytes(encoded_data)
+            assert decoded_data == sub_test_data, "Decoded data does not match original data!"
+            assert rest_index == len(encoded_data)
+
+    # A broken frame is skipped and decoding continues from the next frame
+    decoded_data, rest_index = cobs_decode_bytes(b'\x05\x01\x00\x02\x01\x00')
+    assert decoded_data == b''
+    assert cobs_decode_bytes(b'\x05\x01\x00\x02\x01\x00', rest_index) == (b'\x01', 6)
+
+
+def test_cobs_stream_decoder():
+    import sys
+    import os
+
+    # Add the parent directory to sys.path to import lib.cobs
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from lib.cobs import CobsStreamDecoder, cobs_encode_bytes
+
+    frames = [bytes([i]) + bytes(range(i % 7)) + bytes(20) for i in range(1, 50)]
+    stream = b''.join(cobs_encode_bytes(frame) for frame in frames)
+
+    # Feeding everything at once and byte by byte must give the same frames
+    for chunk_size in [len(stream), 1, 7, 64]:
+        decoder = CobsStreamDecoder()
+        decoded_frames = []
+        for i in range(0, len(stream), chunk_size):
+            decoded_frames.extend(decoder.feed(stream[i:i + chunk_size]))
+        assert decoded_frames == frames
+        assert decoder.frame_count == len(frames)
+        assert decoder.error_count == 0
+
+    # Broken frames and empty frames are skipped
+    decoder = CobsStreamDecoder()
+    decoded_frames = list(decoder.feed(b'\x00\x09\x01\x00' + cobs_encode_bytes(b'\x10\x00\x01')))
+    assert decoded_frames == [b'\x10\x00\x01']
+    assert decoder.error_count == 1
+
+    # Data without delimiter is dropped when it grows over max_frame_size
+    decoder = CobsStreamDecoder(max_frame_size=16)
+    assert list(decoder.feed(b'\x01' * 10)) == []
+    assert list(decoder.feed(b'\x01' * 10)) == []
+    assert decoder.error_count == 1
+    assert list(decoder.feed(cobs_encode_bytes(b'\x20\x21'))) == [b'\x20\x21']
+
+    # Counters are updated as soon as feed returns, without consuming the iterator
+    decoder = CobsStreamDecoder()
+    decoder.feed(b'\x02\x05\x00\x09\x00')
+    assert decoder.frame_count == 1
+    assert decoder.error_count == 1
@@ -0,0 +1,31 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to import background.historybuffer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.historybuffer import HistoryBuffer
+
+
+def test_history_buffer():
+    history = HistoryBuffer(["count", "value", "flag", "data"], capacity=5)
+    assert history.query() == {"count": [], "value": [], "flag": [], "data": [], "received_time": []}
+    for i in range(8):
+        history.append({"count": i, "value": i / 2, "flag": i % 2 == 0, "data": [i, i], "received_time": 100 + i})
+    # Only the newest 5 records are kept
+    assert len(history) == 5
+    result = history.query()
+    assert result == {
+        "count": [3, 4, 5, 6, 7],
+        "value": [1.5, 2.0, 2.5, 3.0, 3.5],
+        "flag": [False, True, False, True, False],
+        "data": [[3, 3], [4, 4], [5, 5], [6, 6], [7, 7]],
+        "received_time": [103, 104, 105, 106, 107],
+    }
+    # limit without since takes the newest records
+    assert history.query(limit=2)["count"] == [6, 7]
+    # since returns records received after it, and limit takes the oldest of them
+    assert history.query(since=104)["count"] == [5, 6, 7]
+    assert history.query(since=104, limit=2)["count"] == [5, 6]
+    assert history.query(since=107)["count"] == []
+    assert history.query(since=0, limit=0)["count"] == []
@@ -0,0 +1,197 @@
+import sys
+import os
+from queue import Queue
+
+# Add the parent directory to sys.path to import httpserver.httpserver
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import background.background as background
+import httpserver.httpserver as httpserver
+from httpserver.jsoncache import SnapshotJsonCache
+import shared_data
+
+
+def make_client(monkeypatch):
+    # Cache entries are keyed on versions, which restart in each test
+    monkeypatch.setattr(httpserver, "json_cache", SnapshotJsonCache())
+    app = Flask(__name__)
+    app.config["background_instance"] = background.Background(Queue())
+    app.register_blueprint(httpserver.app)
+    return app.test_client()
+
+
+def test_data_snapshot_versions(monkeypatch):
+    snapshot = shared_data.DataSnapshot(0, {}, {})
+    snapshot = snapshot.update({"a": {"value": 1}, "b": {"value": 2}})
+    snapshot = snapshot.update({"a": {"value": 3}})
+    monkeypatch.setattr(shared_data, "data_snapshot", snapshot)
+    client = make_client(monkeypatch)
+
+    response = client.get("/data")
+    assert response.json == {"a": {"value": 3}, "b": {"value": 2}}
+    assert response.headers["X-Data-Version"] == "2"
+    # Only the parsers that changed after since_version
+    assert client.get("/data?since_version=1").json == {"a": {"value": 3}}
+    assert client.get("/data?since_version=2").status_code == 304
+    # A version from before a restart returns everything
+    assert client.get("/data?since_version=10").json == {"a": {"value": 3}, "b": {"value": 2}}
+    assert client.get("/data?since_version=x").status_code == 400
+
+    assert client.get("/data/b").json == {"value": 2}
+    assert client.get("/data/b?since_version=1").status_code == 304
+    assert client.get("/data/a?since_version=1").json == {"value": 3}
+    assert client.get("/data/c").status_code == 404
+
+    # Published snapshots are never modified
+    assert snapshot.update({"b": {"value": 4}}).data["b"] == {"value": 4}
+    assert client.get("/data").json["b"] == {"value": 2}
+
+
+def test_data_conditional_requests(monkeypatch):
+    snapshot = shared_data.DataSnapshot(0, {}, {}).update({"a": {"value": 1, "received_time": 1760781600000}})
+    monkeypatch.setattr(shared_data, "data_snapshot", snapshot)
+    client = make_client(monkeypatch)
+
+    response = client.get("/data")
+    etag = response.headers["ETag"]
+    assert response.json == {"a": {"value": 1, "received_time": 1760781600000}}
+    assert response.headers["Last-Modified"] == "Sat, 18 Oct 2025 10:00:00 GMT"
+    assert client.get("/data", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/data", headers={"If-Modified-Since": response.headers["Last-Modified"]}).status_code == 304
+    # The same bytes are returned until the data changes
+    assert httpserver.json_cache.get_aggregate(snapshot) is httpserver.json_cache.get_aggregate(snapshot)
+
+    parser_etag = client.get("/data/a").headers["ETag"]
+    assert client.get("/data/a", headers={"If-None-Match": parser_etag}).status_code == 304
+
+    snapshot = snapshot.update({"b": {"value": 2, "received_time": 1760781601000}})
+    monkeypatch.setattr(shared_data, "data_snapshot", snapshot)
+    response = client.get("/data", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json == {"a": {"value": 1, "received_time": 1760781600000}, "b": {"value": 2, "received_time": 1760781601000}}
+    # "a" did not change, so its ETag is still valid
+    assert client.get("/data/a", headers={"If-None-Match": parser_etag}).status_code == 304
+
+    # Updates within the same second are not hidden from clients that only send If-Modified-Since
+    snapshot = snapshot.update({"a": {"value": 3, "received_time": 1760781601100}})
+    monkeypatch.setattr(shared_data, "data_snapshot", snapshot)
+    last_modified = client.get("/data/a").headers["Last-Modified"]
+    snapshot = snapshot.update({"a": {"value": 4, "received_time": 1760781601900}})
+    monkeypatch.setattr(shared_data, "data_snapshot", snapshot)
+    response = client.get("/data/a", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert response.json["value"] == 4
+
+
+def test_data_and_state_by_port(monkeypatch):
+    import serialhandler.serialhandler as serialhandler
+    from types import MappingProxyType
+
+    main = shared_data.EMPTY_SNAPSHOT.update({"a": {"value": 1, "port": "main"}})
+    radio = shared_data.EMPTY_SNAPSHOT.update({"a": {"value": 2, "port": "radio"}, "b": {"value": 3, "port": "radio"}})
+    merged = main.update({"a": {"value": 2, "port": "radio"}, "b": {"value": 3, "port": "radio"}})
+    monkeypatch.setattr(shared_data, "data_snapshot", merged)
+    monkeypatch.setattr(shared_data, "port_snapshots", MappingProxyType({"main": main, "radio": radio}))
+    monkeypatch.setattr(httpserver, "port_json_caches", {})
+    client = make_client(monkeypatch)
+    handler = serialhandler.serial_handler()
+    handler.get_port("radio", create=True)
+    client.application.config["serial_handler_instance"] = handler
+
+    assert client.get("/data").json == {"a": {"value": 2, "port": "radio"}, "b": {"value": 3, "port": "radio"}}
+    assert client.get("/data?port=main").json == {"a": {"value": 1, "port": "main"}}
+    assert client.get("/data/a?port=main").json == {"value": 1, "port": "main"}
+    assert client.get("/data/b?port=main").status_code == 404
+    assert client.get("/data?port=wired").status_code == 404
+
+    state = client.get("/serial/state").json
+    assert state["state"] == "DISCONNECTED"
+    assert set(state["ports"]) == {"main", "radio"}
+    assert client.get("/serial/state?port=radio").json == {"state": "DISCONNECTED", "device": None, "baudrate": None,
+                                                           "reconnect_attempts": 0, "version": 0}
+    assert client.get("/serial/state?port=wired").status_code == 404
+    assert client.post("/serial/connect", json={"portname": "/dev/null", "port": "../x"}).status_code == 400
+
+
+def test_serial_state_long_poll(monkeypatch):
+    import threading
+    import serialhandler.serialhandler as serialhandler
+
+    client = make_client(monkeypatch)
+    handler = serialhandler.serial_handler()
+    client.application.config["serial_handler_instance"] = handler
+    # Changed from another thread while the request waits
+    timer = threading.Timer(0.1, handler.get_port().set_state, args=(shared_data.SerialState.ERROR,))
+    timer.start()
+    state = client.get("/serial/state?wait=10").json
+    assert (state["state"], state["version"]) == ("ERROR", 1)
+    # An older since returns at once, a current one waits until wait runs out
+    assert client.get("/serial/state?wait=10&since=0").json["version"] == 1
+    assert client.get("/serial/state?port=main&wait=0.05&since=1").json["state"] == "ERROR"
+    assert client.get("/serial/state?wait=x").status_code == 400
+    assert client.get("/serial/state?wait=nan").status_code == 400
+
+
+def test_stream_poll_rejects_bad_timeout(monkeypatch):
+    client = make_client(monkeypatch)
+    assert client.get("/stream/poll?timeout=nan").status_code == 400
+    assert client.get("/stream/poll?timeout=-1").status_code == 400
+    response = client.get("/stream/poll?timeout=0")
+    assert response.status_code == 200
+
+
+def test_metrics(monkeypatch, tmp_path):
+    import time
+    import serialhandler.serialhandler as serialhandler
+    from httpserver.metrics import PipelineMetrics
+    from lib.cobs import cobs_encode_bytes
+
+    monkeypatch.setattr(shared_data, "log_raw_file_path", str(tmp_path / "raw.bin"))
+    monkeypatch.setattr(shared_data, "log_processed_file_path", str(tmp_path / "processed.log"))
+    monkeypatch.setattr(shared_data, "data_snapshot", shared_data.EMPTY_SNAPSHOT)
+    monkeypatch.setattr(shared_data, "port_snapshots", shared_data.port_snapshots)
+    monkeypatch.setattr(httpserver, "metrics", PipelineMetrics())
+    client = make_client(monkeypatch)
+    handler = serialhandler.serial_handler()
+    client.application.config["serial_handler_instance"] = handler
+    bg = client.application.config["background_instance"]
+    bg.open()
+    try:
+        # One pitot frame, one broken frame and one frame of no parser
+        pitot = next(parser for parser in bg.parser_manager.parsers if parser.get_name() == "pitot")
+        frame = bytearray(pitot.get_data_length())
+        for index, id_value in pitot.get_id_bytes():
+            frame[index:index + len(id_value)] = id_value
+        chunk = cobs_encode_bytes(bytes(frame)) + b"\x05\x01\x00" + cobs_encode_bytes(b"\x01\x02\x03")
+        batch = handler.get_port().decode_chunk(chunk)
+        bg.process_batch("main", batch)
+    finally:
+        bg.close()
+    client.get("/data")
+
+    metrics = client.get("/metrics").json
+    assert metrics["ports"]["main"]["bytes"] == len(chunk)
+    assert (metrics["ports"]["main"]["frames"], metrics["ports"]["main"]["decode_errors"]) == (2, 1)
+    assert metrics["ports"]["main"]["latency"]["decode"]["count"] == 1
+    assert metrics["queue"]["depth"] == 0
+    assert {name for name, parser in metrics["parsers"].items() if parser["frames"]} == {"pitot"}
+    assert metrics["parsers"]["pitot"]["staleness_s"] < 60
+    assert metrics["parsers"]["gps"]["staleness_s"] is None
+    assert metrics["unparsed_frames"] == 1
+    assert metrics["processed_frames"] == 2
+    assert {stage: stats["count"] for stage, stats in metrics["latency"].items()} == \
+        {"queue_wait": 0, "parse": 1, "publish": 1, "process": 1, "end_to_end": 1}
+    assert metrics["http"]["/data"]["count"] == 1
+
+    text = client.get("/metrics", headers={"Accept": "text/plain;version=0.0.4"})
+    assert text.content_type.startswith("text/plain")
+    lines = text.get_data(as_text=True).splitlines()
+    assert 'serialserver_port_decode_errors_total{port="main"} 1' in lines
+    assert "serialserver_unparsed_frames_total 1" in lines
+    assert 'serialserver_parser_frames_total{parser="pitot"} 1' in lines
+    assert 'serialserver_stage_latency_seconds_count{stage="publish"} 1' in lines
+    assert 'serialserver_http_request_duration_seconds_bucket{endpoint="/metrics",le="+Inf"} 1' in lines
+    assert client.get("/metrics?format=prometheus").content_type.startswith("text/plain")
+    assert client.get("/metrics?format=xml").status_code == 400
@@ -0,0 +1,58 @@
+import sys
+import os
+import io
+import logging
+
+# Add the parent directory to sys.path to import lib.log
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.log import RateLimitFilter, setup_logging
+
+
+def make_record(msg: str, level: int = logging.WARNING, created: float = 0.0) -> logging.LogRecord:
+    record = logging.LogRecord("test", level, __file__, 1, msg, (), None)
+    record.created = created
+    return record
+
+
+def test_rate_limit_filter():
+    log_filter = RateLimitFilter(burst=3, interval=1.0)
+    passed = [log_filter.filter(make_record("Dropped %d frames", created=i * 0.01)) for i in range(10)]
+    assert passed == [True] * 3 + [False] * 7
+    # Other messages have their own limit
+    assert log_filter.filter(make_record("Serial error: %s", created=0.5))
+    # The first record of the next window tells how many were suppressed
+    record = make_record("Dropped %d frames", created=1.5)
+    assert log_filter.filter(record)
+    assert record.msg == "Dropped %d frames (7 similar messages suppressed)"
+    assert log_filter.suppressed_count == 7
+
+    log_filter = RateLimitFilter(burst=0, sample=4)
+    passed = [log_filter.filter(make_record("Frame %s", logging.DEBUG)) for _ in range(8)]
+    assert passed == [True, False, False, False] * 2
+    # Sampling applies to DEBUG only
+    assert all(log_filter.filter(make_record("Frame %s", logging.INFO)) for _ in range(8))
+
+
+def test_setup_logging():
+    stream = io.StringIO()
+    root = logging.getLogger()
+    level = root.level
+    try:
+        handler = setup_logging("INFO", burst=2, stream=stream)
+        logger = logging.getLogger("serialhandler.test")
+        assert not logger.isEnabledFor(logging.DEBUG)
+        for count in range(5):
+            logger.warning("[%s] Queue is full. Dropped %d frames.", "main", count)
+        logger.debug("not printed")
+        # Stopping the listener writes what is queued
+        setup_logging("WARNING", stream=io.StringIO())
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith("WARNING serialhandler.test: [main] Queue is full. Dropped 0 frames.")
+        assert handler.filters[0].suppressed_count == 3
+        assert handler.dropped_count == 0
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(level)
@@ -0,0 +1,97 @@
+import sys
+import os
+import json
+
+# Add the parent directory to sys.path to import background.logrotation
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.logrotation import RotatingLogWriter, SegmentCompressor, SegmentManifest
+from background.logsink import ProcessedLogWriter, scan_processed_log
+from lib.rawlog import RawLogReader, RawLogWriter, scan_raw_log
+
+
+def test_rotating_raw_log(tmp_path):
+    base_path = str(tmp_path / "mainlog.bin")
+    compressor = SegmentCompressor("gzip")
+    writer = RotatingLogWriter(base_path, RawLogWriter, lambda frame, received_time: received_time,
+                               max_bytes=1000, max_seconds=0, compressor=compressor)
+    frames = [(1000 + i, bytes([i % 256]) * 20) for i in range(200)]
+    for received_time, frame in frames:
+        writer.write(frame, received_time)
+    writer.close()
+    compressor.join()
+
+    with open(tmp_path / "mainlog.manifest.json") as f:
+        segments = json.load(f)["segments"]
+    assert len(segments) > 1
+    assert all(segment["status"] == "compressed" and segment["path"].endswith(".bin.gz") for segment in segments)
+    assert sum(segment["records"] for segment in segments) == len(frames)
+    # Time ranges follow each other
+    assert segments[0]["start_time"] == 1000
+    assert segments[-1]["end_time"] == 1199
+    for previous, segment in zip(segments, segments[1:]):
+        assert segment["start_time"] == previous["end_time"] + 1
+    # Only the compressed segments and the manifest are left
+    assert sorted(os.listdir(tmp_path)) == sorted([segment["path"] for segment in segments] + ["mainlog.manifest.json"])
+
+    read_frames = []
+    for path in SegmentManifest(str(tmp_path / "mainlog.manifest.json")).find(0):
+        with RawLogReader(path) as reader:
+            read_frames += [(received_time, bytes(frame)) for received_time, frame in reader.records()]
+    assert read_frames == frames
+
+    # find() only returns the segments that overlap the time range
+    manifest = SegmentManifest(str(tmp_path / "mainlog.manifest.json"))
+    middle = segments[len(segments) // 2]
+    assert manifest.find(middle["start_time"], middle["end_time"]) == [str(tmp_path / middle["path"])]
+
+
+def test_rotating_processed_log_without_compression(tmp_path):
+    base_path = str(tmp_path / "processedlog.txt")
+    writer = RotatingLogWriter(base_path, ProcessedLogWriter, lambda parser_name, parsed_data: parsed_data["received_time"],
+                               max_bytes=0, max_seconds=0, compressor=SegmentCompressor("none"))
+    writer.write("test", {"value": 1, "received_time": 5})
+    writer.rotate()
+    writer.write("test", {"value": 2, "received_time": 6})
+    writer.close()
+
+    manifest = SegmentManifest(str(tmp_path / "processedlog.manifest.json"))
+    assert [(segment["start_time"], segment["end_time"], segment["status"]) for segment in manifest.segments] == [(5, 5, "closed"), (6, 6, "closed")]
+    lines = []
+    for path in manifest.find(0):
+        with open(path) as f:
+            lines += f.readlines()
+    assert lines == ["test, {'value': 1, 'received_time': 5}\n", "test, {'value': 2, 'received_time': 6}\n"]
+
+    # An empty segment is removed when it is closed
+    writer = RotatingLogWriter(base_path, ProcessedLogWriter, lambda parser_name, parsed_data: parsed_data["received_time"])
+    writer.close()
+    assert len(SegmentManifest(str(tmp_path / "processedlog.manifest.json")).segments) == 2
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_recover_segments_after_crash(tmp_path):
+    base_path = str(tmp_path / "mainlog.bin")
+    writer = RotatingLogWriter(base_path, RawLogWriter, lambda frame, received_time: received_time, max_bytes=0, max_seconds=0)
+    for i in range(10):
+        writer.write(bytes([i]) * 20, 1000 + i)
+    # Crash: the segment is neither closed nor compressed
+    writer.flush()
+
+    compressor = SegmentCompressor("gzip")
+    writer = RotatingLogWriter(base_path, RawLogWriter, lambda frame, received_time: received_time, max_bytes=0, max_seconds=0,
+                               compressor=compressor, scan_segment=scan_raw_log)
+    writer.write(b"x", 2000)
+    writer.close()
+    compressor.join()
+
+    segments = SegmentManifest(str(tmp_path / "mainlog.manifest.json")).segments
+    assert [(segment["start_time"], segment["end_time"], segment["records"], segment["status"]) for segment in segments] == \
+        [(1000, 1009, 10, "compressed"), (2000, 2000, 1, "compressed")]
+    assert all(segment["path"].endswith(".bin.gz") for segment in segments)
+
+    # A cut off line of the processed log is not counted
+    path = str(tmp_path / "processedlog.txt")
+    with open(path, "w") as f:
+        f.write("test, {'value': 1, 'received_time': 5, 'port': 'main'}\ntest, {'value': 2, 'received_time': 6, 'po")
+    assert scan_processed_log(path) == (5, 5, 1)
@@ -0,0 +1,98 @@
+import sys
+import os
+import threading
+
+# Add the parent directory to sys.path to import background.logsink
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.logsink import LogSink, ProcessedLogWriter
+
+
+class FakeWriter:
+    """
+    Collects records. write() waits for `release` so that the sink can be made slow.
+    """
+    def __init__(self):
+        self.records = []
+        self.flush_count = 0
+        self.closed = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, *record) -> int:
+        self.release.wait()
+        self.records.append(record)
+        return 10
+
+    def flush(self):
+        self.flush_count += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_log_sink_writes_all_records():
+    writer = FakeWriter()
+    sink = LogSink("test", writer, capacity=16, policy="block", flush_bytes=100)
+    sink.start()
+    for i in range(1000):
+        assert sink.put(i, i * 2)
+    sink.close()
+
+    assert writer.records == [(i, i * 2) for i in range(1000)]
+    assert writer.closed
+    stats = sink.get_stats()
+    assert stats["records_written"] == 1000
+    assert stats["bytes_written"] == 10000
+    assert stats["dropped"] == 0
+    assert stats["flush_count"] >= 1
+
+
+def test_log_sink_drops_when_full():
+    writer = FakeWriter()
+    writer.release.clear()
+    sink = LogSink("test", writer, capacity=4, policy="drop")
+    sink.start()
+    results = [sink.put(i) for i in range(20)]
+    writer.release.set()
+    sink.close()
+
+    assert results.count(False) == sink.get_stats()["dropped"]
+    assert sink.get_stats()["dropped"] > 0
+    assert len(writer.records) == results.count(True)
+
+
+def test_log_sink_survives_writer_errors():
+    class FailingWriter(FakeWriter):
+        def write(self, *record) -> int:
+            if record[0] % 2:
+                raise OSError(28, "No space left on device")
+            return super().write(*record)
+
+        def flush(self):
+            raise OSError(5, "Input/output error")
+
+    writer = FailingWriter()
+    sink = LogSink("test", writer, capacity=4, policy="block", flush_bytes=10)
+    sink.start()
+    # With a dead sink thread, put() would wait forever once the ring is full
+    for i in range(100):
+        assert sink.put(i)
+    sink.close()
+
+    assert writer.records == [(i,) for i in range(0, 100, 2)]
+    assert writer.closed
+    stats = sink.get_stats()
+    assert stats["records_written"] == 50
+    assert stats["failed"] == 50
+    assert stats["errors"] > 0
+    assert stats["last_error"].startswith("OSError")
+
+
+def test_processed_log_writer(tmp_path):
+    path = str(tmp_path / "processedlog.txt")
+    writer = ProcessedLogWriter(path)
+    assert writer.write("gps", {"timestamp": 1}) == len("gps, {'timestamp': 1}\n")
+    writer.close()
+    with open(path) as f:
+        assert f.read() == "gps, {'timestamp': 1}\n"
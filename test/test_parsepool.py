@@ -0,0 +1,83 @@
+import sys
+import os
+import threading
+import warnings
+
+# Add the parent directory to sys.path to import background.parsepool
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.parsepool import ParsePool, _pack_frames, _unpack_frames
+import background.parsermanager as parsermanager
+from lib.cobs import CobsStreamDecoder
+
+
+def test_pack_frames():
+    frames = [b"", b"\x01\x02", bytes(range(40))]
+    buffer = memoryview(bytearray(256))
+    _pack_frames(buffer, frames)
+    assert _unpack_frames(buffer) == frames
+
+
+def test_parse_pool_keeps_order():
+    with open("test/main-log.bin", "rb") as f:
+        frames = list(CobsStreamDecoder().feed(f.read()))[:3000]
+    batches = [frames[i:i + 100] for i in range(0, len(frames), 100)]
+    results = []
+    done = threading.Event()
+
+    def on_result(item, parsed):
+        results.append((item, parsed))
+        if item == len(batches) - 1:
+            done.set()
+
+    # Small slots, so that some batches do not fit and go through the pipe
+    pool = ParsePool(2, on_result, slot_count=2, slot_size=1024)
+    pool.start()
+    try:
+        for i, batch in enumerate(batches):
+            pool.submit(i, batch)
+        assert done.wait(60)
+    finally:
+        pool.close()
+    assert pool.inline_count > 0
+    assert [item for item, _ in results] == list(range(len(batches)))
+
+    parser_manager = parsermanager.ParserManager()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [parser_manager.parse_data(frame) for frame in frames]
+    parsed = [frame_result for _, batch_result in results for frame_result in batch_result]
+    assert [parser_name for _, parser_name in parsed] == [parser_name for _, parser_name in expected]
+    for (parsed_data, _), (expected_data, _) in zip(parsed, expected):
+        assert parsed_data.keys() == expected_data.keys()
+
+
+def test_dead_worker_falls_back_to_inline_parsing(tmp_path, monkeypatch):
+    import time
+    from queue import Queue
+    import background.background as background
+    import shared_data
+
+    monkeypatch.setattr(shared_data, "log_raw_file_path", str(tmp_path / "raw.bin"))
+    monkeypatch.setattr(shared_data, "log_processed_file_path", str(tmp_path / "processed.log"))
+    monkeypatch.setattr(shared_data, "data_snapshot", shared_data.EMPTY_SNAPSHOT)
+    with open("test/main-log.bin", "rb") as f:
+        frames = list(CobsStreamDecoder().feed(f.read()))[:300]
+    bg = background.Background(Queue(), log_compression="none", parse_workers=1)
+    bg.open()
+    try:
+        pool = bg.parse_pool
+        # Killed, e.g. for memory
+        pool._workers[0].kill()
+        pool._workers[0].join()
+        bg.process_batch("main", [(frame, 1000) for frame in frames[:100]])
+        deadline = time.monotonic() + 10
+        while pool.error is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.error is not None
+        # The batch the dead worker had and the next one are parsed on this thread instead
+        bg.process_batch("main", [(frame, 2000) for frame in frames[100:]])
+        assert bg.parse_pool is None
+        assert bg.processed_frame_count == len(frames)
+    finally:
+        bg.close()
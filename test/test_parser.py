@@ -25,5 +25,125 @@ def test_parser():
         parsed_data = myParsermanager.parse_data(decoded_data)
         print(f"Parsed data: {parsed_data}\n")
 
+
+def test_dispatch_table_matches_scan():
+    from lib.cobs import CobsStreamDecoder
+
+    myParsermanager = parsermanager.ParserManager()
+    with open("test/main-log.bin", "rb") as f:
+        frames = list(CobsStreamDecoder().feed(f.read()))
+    for frame in frames[:5000]:
+        expected = [parser for parser in myParsermanager.parsers if parser.can_parse(frame)]
+        assert len(expected) <= 1
+        if expected:
+            assert myParsermanager._select_parser(frame) is expected[0]
+
+
+def test_dispatch_table_detects_ambiguity():
+    import pytest
+    from background.abstractparser import AbstractParser
+
+    def make_parser(name, length, id_bytes):
+        class Parser(AbstractParser):
+            def parse(self, data):
+                return {}
+            get_name = staticmethod(lambda: name)
+            get_keys = staticmethod(lambda: [])
+            get_data_length = staticmethod(lambda: length)
+            get_id_bytes = staticmethod(lambda: id_bytes)
+        return Parser()
+
+    myParsermanager = parsermanager.ParserManager()
+    a = make_parser("a", 8, [(0, b'\x01')])
+    b = make_parser("b", 8, [(0, b'\x01\x02')])
+    c = make_parser("c", 8, [(0, b'\x02'), (5, b'\x07')])
+    d = make_parser("d", 16, [])
+
+    table, prefix_lengths, fallback = myParsermanager._build_dispatch_table([a, c, d])
+    assert table == {(8, b'\x01'): a, (16, b''): d}
+    assert prefix_lengths == {8: (1,), 16: (0,)}
+    assert fallback == [c]
+
+    with pytest.raises(ValueError):
+        myParsermanager._build_dispatch_table([a, b])
+    with pytest.raises(ValueError):
+        myParsermanager._build_dispatch_table([make_parser("e", 8, []), c])
+    with pytest.raises(ValueError):
+        myParsermanager._build_dispatch_table([make_parser("f", 4, [(4, b'\x01')])])
+
+
+def test_struct_parser():
+    import pytest
+    from background.structparser import StructParser
+
+    class SampleParser(StructParser):
+        name = "sample"
+        struct_format = ">xxxxIff"
+        id_bytes = [(0, b'\x40')]
+        fields = ["timestamp", "value1", "value2"]
+
+    sample_parser = SampleParser()
+    assert sample_parser.get_data_length() == 16
+    assert sample_parser.get_keys() == ["timestamp", "value1", "value2"]
+    assert sample_parser.parse(bytes.fromhex("40000000000000073f80000040000000")) == {"timestamp": 7, "value1": 1.0, "value2": 2.0}
+    with pytest.raises(ValueError):
+        sample_parser.parse(bytes(15))
+
+    class BrokenParser(SampleParser):
+        fields = ["timestamp", "value1"]
+
+    with pytest.raises(ValueError):
+        BrokenParser()
+
+
+def test_parse_batch_matches_parse_data():
+    import math
+    import warnings
+    from lib.cobs import CobsStreamDecoder
+
+    myParsermanager = parsermanager.ParserManager()
+    with open("test/main-log.bin", "rb") as f:
+        frames = list(CobsStreamDecoder().feed(f.read()))[:20000]
+    # Add frames of every parser, including ones that are not in the log
+    for parser in myParsermanager.parsers:
+        frame = bytearray(range(1, parser.get_data_length() + 1))
+        for index, id_value in parser.get_id_bytes():
+            frame[index:index + len(id_value)] = id_value
+        frames.append(bytes(frame))
+    received_times = list(range(len(frames)))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        batches = myParsermanager.parse_batch(frames, received_times)
+        expected = {}
+        for frame, received_time in zip(frames, received_times):
+            parsed_data, parser_name = myParsermanager.parse_data(frame)
+            if parser_name is not None:
+                parsed_data["received_time"] = received_time
+                expected.setdefault(parser_name, []).append(parsed_data)
+
+    assert set(batches) == set(myParsermanager.get_parser_names())
+    for parser_name, records in expected.items():
+        batch = batches[parser_name]
+        assert len(batch) == len(records)
+        assert batch[0].keys() == records[0].keys()
+        for record, expected_record in zip(batch.records(), records):
+            for key, value in expected_record.items():
+                assert record[key] == value or (math.isnan(record[key]) and math.isnan(value))
+
+
+def test_servo_wing_angle_table():
+    import numpy as np
+    from background.parsers.servocontroller import parser as servo_parser
+
+    servo_angles = np.array([60.0, 150.0, 180.0, 200.0, 400.0, np.nan])
+    rudder, elevator = servo_parser.servo_to_wing_angles(servo_angles, servo_angles)
+    assert rudder.tolist() == [servo_parser._rudder_servo_to_wing_angle(angle) for angle in servo_angles.tolist()]
+    assert elevator.tolist() == [servo_parser._elevator_servo_to_wing_angle(angle) for angle in servo_angles.tolist()]
+    # Angles beyond the table are clamped instead of raising IndexError
+    assert rudder[0] == -20.0
+    assert rudder[4] == 19.99
+
+
 if __name__ == "__main__":
-    test_parser()
\ No newline at end of file
+    test_parser()
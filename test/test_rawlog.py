@@ -0,0 +1,90 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to import lib.rawlog
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib.rawlog as rawlog
+
+
+def make_frames(count: int) -> list[tuple[int, bytes]]:
+    # Some frames contain the index magic to check that it is not mistaken for an index record
+    return [(1000 + i * 10, bytes([i % 256]) + (rawlog.INDEX_MAGIC if i % 7 == 0 else bytes(i % 40))) for i in range(count)]
+
+
+def test_rawlog_write_and_read(tmp_path):
+    path = str(tmp_path / "mainlog.bin")
+    frames = make_frames(1000)
+    with rawlog.RawLogWriter(path, index_interval=64) as writer:
+        for received_time, frame in frames[:600]:
+            writer.write(frame, received_time)
+    # Reopening continues the same log
+    with rawlog.RawLogWriter(path, index_interval=64) as writer:
+        for received_time, frame in frames[600:]:
+            writer.write(frame, received_time)
+
+    with rawlog.RawLogReader(path) as reader:
+        assert [(received_time, bytes(frame)) for received_time, frame in reader.records()] == frames
+        blocks = reader.index()
+        assert sum(count for _, _, _, count in blocks) == len(frames)
+        assert [first_time for _, first_time, _, _ in blocks] == sorted(first_time for _, first_time, _, _ in blocks)
+
+        since = frames[777][0]
+        assert [received_time for received_time, _ in reader.records(since=since)] == [t for t, _ in frames[777:]]
+        assert list(reader.records(since=frames[-1][0] + 1)) == []
+
+
+def test_rawlog_truncated_tail(tmp_path):
+    path = str(tmp_path / "mainlog.bin")
+    frames = make_frames(100)
+    with rawlog.RawLogWriter(path, index_interval=1000) as writer:
+        for received_time, frame in frames:
+            writer.write(frame, received_time)
+        writer.flush()
+        size = os.path.getsize(path)
+    # Cut the last record (its index record and 3 bytes of the frame)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+
+    with rawlog.RawLogReader(path) as reader:
+        assert [(received_time, bytes(frame)) for received_time, frame in reader] == frames[:-1]
+        assert reader.index() == []
+
+
+def test_rawlog_resume_after_crash(tmp_path):
+    path = str(tmp_path / "mainlog.bin")
+    frames = make_frames(300)
+    writer = rawlog.RawLogWriter(path, index_interval=64)
+    for received_time, frame in frames[:100]:
+        writer.write(frame, received_time)
+    writer.flush()
+    # Crash: the frames after the last index record have no index, and the last record is cut off
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+
+    with rawlog.RawLogWriter(path, index_interval=64) as writer:
+        for received_time, frame in frames[100:]:
+            writer.write(frame, received_time)
+
+    expected = frames[:99] + frames[100:]
+    with rawlog.RawLogReader(path) as reader:
+        assert [(received_time, bytes(frame)) for received_time, frame in reader] == expected
+        blocks = reader.index()
+        assert sum(count for _, _, _, count in blocks) == len(expected)
+        assert blocks[1][1] == frames[64][0]
+        assert [t for t, _ in reader.records(since=frames[90][0])] == [t for t, _ in expected[90:]]
+
+
+def test_convert_text_log(tmp_path):
+    text_path = str(tmp_path / "mainlog.txt")
+    raw_path = str(tmp_path / "mainlog.bin")
+    frames = make_frames(50)
+    with open(text_path, "w") as f:
+        for received_time, frame in frames:
+            f.write(f"{received_time}, {frame.hex()}\n")
+        f.write("broken line\n")
+
+    assert rawlog.convert_text_log(text_path, raw_path) == len(frames)
+    with rawlog.RawLogReader(raw_path) as reader:
+        assert [(received_time, bytes(frame)) for received_time, frame in reader] == frames
@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+
+# Add the parent directory to sys.path to import serialhandler.replay
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import background.background as background
+import lib.rawlog as rawlog
+from serialhandler.replay import ReplaySource, detect_format, read_frames
+import shared_data
+
+
+def write_logs(tmp_path, frames: list[bytes], times: list[int]):
+    with rawlog.RawLogWriter(str(tmp_path / "log.bin")) as writer:
+        for frame, received_time in zip(frames, times):
+            writer.write(frame, received_time)
+    with open(tmp_path / "log.txt", "w") as f:
+        f.writelines(f"{received_time}, {frame.hex()}\n" for frame, received_time in zip(frames, times))
+
+
+def test_read_frames(tmp_path):
+    frames = [frame for _, frame in read_frames("test/main-log.bin")][:500]
+    assert detect_format("test/main-log.bin") == "cobs"
+    times = [1000 + i for i in range(len(frames))]
+    write_logs(tmp_path, frames, times)
+    for name, log_format in (("log.bin", "binary"), ("log.txt", "text")):
+        path = str(tmp_path / name)
+        assert detect_format(path) == log_format
+        assert list(read_frames(path)) == list(zip(times, frames))
+
+
+def test_replay_through_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_data, "log_raw_file_path", str(tmp_path / "raw.bin"))
+    monkeypatch.setattr(shared_data, "log_processed_file_path", str(tmp_path / "processed.log"))
+    monkeypatch.setattr(shared_data, "data_snapshot", shared_data.EMPTY_SNAPSHOT)
+    monkeypatch.setattr(shared_data, "port_snapshots", shared_data.port_snapshots)
+    frames = [frame for _, frame in read_frames("test/main-log.bin")][:200]
+    # 1 s of traffic at 10x takes about 0.1 s
+    write_logs(tmp_path, frames, [1000 + i * 5 for i in range(len(frames))])
+    source = ReplaySource(str(tmp_path / "log.bin"), speed=10, batch_size=16, keep_time=True)
+    data_queue, replay_thread = source.get_serial_thread()
+    bg = background.Background(data_queue, get_timeout=0.01, log_compression="none")
+    background_thread = bg.get_background_thread(data_queue)
+    background_thread.start()
+    replay_thread.start()
+    assert source.finished.wait(10)
+    bg.stop()
+    background_thread.join(10)
+
+    stats = source.get_stats()
+    assert stats["frames"] == len(frames) == bg.processed_frame_count
+    assert 0.09 < stats["elapsed_s"] < 2
+    assert source.get_states()["main"]["state"] == "DISCONNECTED"
+    assert bg.get_latency_stats()["process"]["count"] > 0
+    # keep_time passes the recorded times on
+    assert max(data["received_time"] for data in shared_data.data_snapshot.data.values()) == 1000 + 199 * 5
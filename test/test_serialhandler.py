@@ -0,0 +1,143 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to import serialhandler
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialhandler.serialhandler as serialhandler
+import lib.cobs as cobs
+import shared_data
+
+
+class FakeSerial:
+    """
+    Stands in for serial.Serial. Returns the given chunks one by one and
+    disconnects the port when they run out.
+    """
+    def __init__(self, chunks: list[bytes], port: serialhandler.SerialPort):
+        # As connect() does
+        port.set_state(shared_data.SerialState.CONNECTED)
+        self.port = port
+        self.chunks = list(chunks)
+        self.is_open = True
+        self.read_sizes = []
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size: int = 1) -> bytes:
+        self.read_sizes.append(size)
+        if not self.chunks:
+            self.port.set_state(shared_data.SerialState.DISCONNECTED)
+            return b''
+        return self.chunks.pop(0)
+
+
+def test_read_data_splits_chunks():
+    frames = [bytes([0x10 + i]) + bytes(7) for i in range(5)]
+    stream = b''.join(cobs.cobs_encode_bytes(frame) for frame in frames)
+    # The second frame is split across two reads
+    chunks = [stream[:14], stream[14:30], stream[30:]]
+
+    handler = serialhandler.serial_handler()
+    port = handler.get_port()
+    port.ser = FakeSerial(chunks, port)
+    port.read_data()
+
+    received = []
+    while not handler.queue.empty():
+        port_name, batch = handler.queue.get()
+        assert port_name == shared_data.DEFAULT_PORT
+        received.extend(frame for frame, _ in batch)
+    assert received == frames
+    # One read per chunk, plus the empty read that stops the loop
+    assert port.ser.read_sizes == [len(chunk) for chunk in chunks] + [1]
+
+
+def test_full_queue_drops_batches():
+    handler = serialhandler.serial_handler(queue_size=1, batch_size=2, put_timeout=0.01)
+    frames = [bytes([0x20, i]) for i in range(1, 6)]
+    port = handler.get_port()
+    port.ser = FakeSerial([b''.join(cobs.cobs_encode_bytes(frame) for frame in frames)], port)
+    port.read_data()
+
+    # The first batch fits, the other two are dropped after blocking
+    assert [frame for frame, _ in handler.queue.get()[1]] == frames[:2]
+    stats = handler.get_queue_stats()
+    assert stats["blocked_puts"] == 2
+    assert stats["dropped_frames"] == 3
+
+
+def test_full_port_does_not_block_other_ports():
+    handler = serialhandler.serial_handler(queue_size=1, batch_size=1, put_timeout=0.01)
+    main = handler.get_port()
+    radio = handler.get_port("radio", create=True)
+    main.ser = FakeSerial([b''.join(cobs.cobs_encode_bytes(bytes([0x20, i])) for i in range(1, 4))], main)
+    radio.ser = FakeSerial([cobs.cobs_encode_bytes(b"\x10radio")], radio)
+    main.read_data()
+    radio.read_data()
+
+    assert main.dropped_frame_count == 2
+    assert radio.blocked_put_count == 0 and radio.dropped_frame_count == 0
+    assert [port_name for port_name, _ in (handler.queue.get(), handler.queue.get())] == ["main", "radio"]
+    # Taking the batch of main makes room for main again
+    handler.queue.put(("main", []), timeout=0.01)
+
+
+def test_ports_are_tagged():
+    handler = serialhandler.serial_handler()
+    radio = handler.get_port("radio", create=True)
+    assert handler.get_port("radio") is radio
+    assert handler.get_port("wired") is None
+    try:
+        handler.get_port("../log", create=True)
+        assert False, "Invalid port names must be rejected"
+    except ValueError:
+        pass
+
+    main = handler.get_port()
+    # A frame split across reads is kept per port, so interleaved reads do not mix up frames
+    main_stream = cobs.cobs_encode_bytes(b"\x10main")
+    radio_stream = cobs.cobs_encode_bytes(b"\x10radio")
+    main.ser = FakeSerial([main_stream[:3], main_stream[3:]], main)
+    radio.ser = FakeSerial([radio_stream[:2], radio_stream[2:]], radio)
+    main.read_data()
+    radio.read_data()
+
+    items = []
+    while not handler.queue.empty():
+        items.append(handler.queue.get())
+    assert items == [("main", [(b"\x10main", items[0][1][0][1])]), ("radio", [(b"\x10radio", items[1][1][0][1])])]
+    assert set(handler.get_states()) == {"main", "radio"}
+    assert handler.get_states()["radio"]["state"] == "DISCONNECTED"
+
+
+def test_reconnect_with_backoff(tmp_path):
+    import time
+
+    handler = serialhandler.serial_handler(reconnect_delay=0.02, reconnect_max_delay=0.05)
+    port = handler.get_port()
+    changes = []
+    handler.set_state_listener(lambda port, state: changes.append(state))
+    handler.serial_handle()
+    assert not handler.connect(str(tmp_path / "missing"))
+    # Each failed reconnect is another transition to ERROR
+    deadline = time.monotonic() + 5
+    while port.reconnect_attempts < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert port.reconnect_attempts >= 3
+    assert port.next_reconnect_delay() == 0.05
+    assert handler.disconnect()
+    attempts = port.reconnect_attempts
+    time.sleep(0.1)
+    assert port.reconnect_attempts == attempts
+    assert set(changes) == {shared_data.SerialState.ERROR, shared_data.SerialState.DISCONNECTED}
+
+    # Invalid transitions are rejected, and expected guards against changes by other threads
+    try:
+        port.set_state(shared_data.SerialState.READING)
+        assert False, "DISCONNECTED -> READING must be rejected"
+    except ValueError:
+        pass
+    assert not port.set_state(shared_data.SerialState.ERROR, expected=(shared_data.SerialState.READING,))
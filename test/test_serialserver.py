@@ -0,0 +1,25 @@
+import sys
+import os
+import threading
+
+# Add the parent directory to sys.path to import serialserver
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialserver
+
+
+def test_parse_args():
+    args = serialserver.parse_args(["--server", "waitress", "--host", "0.0.0.0", "--threads", "8", "-p", "9000"])
+    assert (args.server, args.host, args.threads, args.port) == ("waitress", "0.0.0.0", 8, 9000)
+    args = serialserver.parse_args([])
+    assert (args.server, args.host, args.ws_port) == ("flask", "127.0.0.1", None)
+    assert (args.log_level, args.log_rate_limit, args.log_sample) == ("INFO", 10, 1)
+
+
+def test_create_app_starts_no_threads():
+    thread_count = threading.active_count()
+    app = serialserver.create_app(None, None)
+    # Creating more apps, e.g. one per server worker, must not start the serial or Background threads again
+    serialserver.create_app(None, None)
+    assert threading.active_count() == thread_count
+    assert "/data" in [rule.rule for rule in app.url_map.iter_rules()]
@@ -0,0 +1,73 @@
+import sys
+import os
+import time
+
+import pytest
+
+# Add the parent directory to sys.path to import tools.simulator
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.parsermanager import ParserManager
+from lib.cobs import CobsStreamDecoder
+import serialhandler.serialhandler as serialhandler
+from tools.simulator import FrameGenerator, PtySimulator, UNKNOWN
+
+
+def test_frame_generator():
+    parser_manager = ParserManager()
+    generator = FrameGenerator(parser_manager, seed=1)
+    frames = list(CobsStreamDecoder().feed(generator.generate(1000)))
+    assert len(frames) == 1000
+    counts = {}
+    for frame in frames:
+        _, name = parser_manager.parse_data(frame)
+        counts[name] = counts.get(name, 0) + 1
+    assert {name: count for name, count in generator.counts.items() if count} == counts
+    assert set(counts) == set(parser_manager.parser_names)
+    # Same seed, same stream
+    assert FrameGenerator(parser_manager, seed=1).generate(100) == FrameGenerator(parser_manager, seed=1).generate(100)
+
+    generator = FrameGenerator(parser_manager, {"pitot": 1, "gps": 3}, seed=2, corrupt_rate=0.1,
+                               missing_delimiter_rate=0.1, unknown_rate=0.1)
+    stream = generator.generate(1000)
+    assert set(name for name, count in generator.counts.items() if count) == {"pitot", "gps", UNKNOWN}
+    assert generator.corrupted_count > 0
+    assert generator.missing_delimiter_count > 0
+    assert stream.count(0) == 1000 - generator.missing_delimiter_count
+    with pytest.raises(ValueError):
+        FrameGenerator(parser_manager, {"nonexistent": 1})
+
+    # Corrupted frames are dropped by the decoder, and the rest parse as counted
+    generator = FrameGenerator(parser_manager, seed=4, corrupt_rate=0.2)
+    decoder = CobsStreamDecoder()
+    frames = list(decoder.feed(generator.generate(1000)))
+    assert generator.corrupted_count > 0
+    assert decoder.error_count == generator.corrupted_count
+    assert len(frames) == sum(generator.counts.values()) == 1000 - generator.corrupted_count
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="needs a pseudo terminal")
+def test_pty_simulator():
+    simulator = PtySimulator(FrameGenerator(ParserManager(), seed=3, corrupt_rate=0.05), rate=2000)
+    handler = serialhandler.serial_handler()
+    try:
+        assert handler.connect(simulator.device, 115200)
+        handler.get_serial_thread()[1].start()
+        stats = simulator.run(duration=0.3)
+        received = 0
+        decode_errors = 0
+        deadline = time.monotonic() + 2
+        while (received < stats["frames"] - stats["corrupted_frames"] or decode_errors < stats["corrupted_frames"]) \
+                and time.monotonic() < deadline:
+            while not handler.queue.empty():
+                received += len(handler.queue.get()[1])
+            decode_errors = handler.get_port().get_counters()["decode_errors"]
+            time.sleep(0.01)
+        handler.disconnect()
+    finally:
+        simulator.close()
+    assert stats["frames"] > 0
+    assert stats["dropped_bytes"] == 0
+    assert decode_errors > 0
+    assert decode_errors == stats["corrupted_frames"]
+    assert received == stats["frames"] - decode_errors
@@ -0,0 +1,94 @@
+import sys
+import os
+import base64
+import json
+import socket
+import struct
+
+# Add the parent directory to sys.path to import httpserver.websocketserver
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.telemetryfeed import RECORD_HEADER, UNKNOWN_PARSER, TelemetryFeed
+from httpserver.websocketserver import WebSocketServer, parse_subscription
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+
+def recv_message(sock: socket.socket) -> tuple[int, bytes]:
+    first, second = recv_exact(sock, 2)
+    length = second & 0x7f
+    if length == 126:
+        length = struct.unpack("!H", recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", recv_exact(sock, 8))[0]
+    return first & 0x0f, recv_exact(sock, length)
+
+
+def connect(port: int, query: str) -> socket.socket:
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((f"GET /ws?{query} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = b""
+    while b"\r\n\r\n" not in response:
+        response += sock.recv(1)
+    assert response.startswith(b"HTTP/1.1 101")
+    return sock
+
+
+def test_parse_subscription():
+    assert parse_subscription("mode=raw&parsers=a,b&every=2,a:5") == {
+        "mode": "raw", "parser_names": {"a", "b"}, "every": {"a": 5}, "default_every": 2}
+    assert parse_subscription("") == {"mode": "packed", "parser_names": None, "every": {}, "default_every": 1}
+
+
+def test_websocket_feed():
+    feed = TelemetryFeed(["a", "b"])
+    server = WebSocketServer(feed, "127.0.0.1", 0)
+    port = server.server_address[1]
+    thread = server.get_server_thread()
+    thread.start()
+    try:
+        raw_client = connect(port, "mode=raw")
+        packed_client = connect(port, "mode=packed&parsers=a&every=a:2")
+        for sock, mode in ((raw_client, "raw"), (packed_client, "packed")):
+            opcode, payload = recv_message(sock)
+            assert opcode == 0x1
+            assert json.loads(payload) == {"type": "hello", "mode": mode, "parsers": ["a", "b"]}
+        # The hello message is queued on subscribe, so both clients are subscribed now
+        assert feed.get_subscriber_count() == 2
+
+        for i in range(4):
+            feed.publish("a", bytes([0x10, i]), 1000 + i, {"value": i, "flag": True, "list": [1], "received_time": 1000 + i})
+        feed.publish("b", b"\x20", 2000, {"value": 1.5, "received_time": 2000})
+        feed.publish(None, b"\x30\x31", 3000)
+
+        received = [recv_message(raw_client) for _ in range(6)]
+        assert [RECORD_HEADER.unpack_from(payload) for _, payload in received] == \
+            [(0, 1000), (0, 1001), (0, 1002), (0, 1003), (1, 2000), (UNKNOWN_PARSER, 3000)]
+        assert received[-1][1][RECORD_HEADER.size:] == b"\x30\x31"
+
+        # The layout is sent before the first packed record, and only every 2nd record of "a" is sent
+        opcode, payload = recv_message(packed_client)
+        assert (opcode, json.loads(payload)) == (0x1, {"type": "layout", "parser": "a", "index": 0, "keys": ["value"]})
+        for i in (0, 2):
+            opcode, payload = recv_message(packed_client)
+            assert opcode == 0x2
+            assert struct.unpack("<BQd", payload) == (0, 1000 + i, float(i))
+
+        # Close handshake
+        raw_client.sendall(bytes([0x88, 0x82]) + b"\x00\x00\x00\x00" + struct.pack("!H", 1000))
+        opcode, payload = recv_message(raw_client)
+        assert (opcode, payload) == (0x8, struct.pack("!H", 1000))
+        raw_client.close()
+        packed_client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,23 @@
+"""
+# convert_log.py
+Converts a text raw log (mainlog.txt, "{received_time}, {frame hex}" per line)
+into the binary raw log format of lib/rawlog.py.
+
+    $ python3 tools/convert_log.py mainlog.txt mainlog.bin
+"""
+import argparse
+import os
+import sys
+
+# Add the parent directory to sys.path to import lib.rawlog
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib.rawlog as rawlog
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Convert a text raw log into a binary raw log")
+    argparser.add_argument("text_log", help="Path of the text log to read")
+    argparser.add_argument("raw_log", help="Path of the binary log to write (appended if it exists)")
+    args = argparser.parse_args()
+    count = rawlog.convert_text_log(args.text_log, args.raw_log)
+    print(f"Converted {count} frames into {args.raw_log}")
@@ -0,0 +1,82 @@
+"""
+# replay.py
+Plays a recorded log through the Background pipeline (logging, parsing, history, snapshots)
+and reports the end-to-end throughput and the latency of each stage as JSON.
+
+    $ python3 tools/replay.py mainlog.bin --speed 10
+    $ python3 tools/replay.py test/main-log.bin --speed 0 --repeat 20 --parse-workers 2
+
+The logs written during the replay go to a temporary directory unless --log-dir is given.
+To serve the replayed data over HTTP, use `serialserver.py --replay` instead.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Add the parent directory to sys.path to import serialhandler.replay
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import background.background as background
+from lib.log import LEVELS, setup_logging
+from serialhandler.replay import FORMATS, ReplaySource
+import shared_data
+
+
+def run(path: str, speed: float = 1.0, repeat: int = 1, batch_size: int = 256, queue_size: int = 64,
+        parse_workers: int = 0, log_dir: str = None, log_format: str = None) -> dict:
+    """
+    Replays the log once through a new Background and returns the results.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_dir = log_dir or temp_dir
+        shared_data.log_raw_file_path = os.path.join(log_dir, "replaylog.bin")
+        shared_data.log_processed_file_path = os.path.join(log_dir, "replay-processedlog.txt")
+        source = ReplaySource(path, speed, queue_size=queue_size, batch_size=batch_size, repeat=repeat, log_format=log_format)
+        data_queue, replay_thread = source.get_serial_thread()
+        background_instance = background.Background(data_queue, get_timeout=0.05, log_compression="none",
+                                                    parse_workers=parse_workers)
+        background_thread = background_instance.get_background_thread(data_queue)
+        background_thread.start()
+        replay_thread.start()
+        source.finished.wait()
+        while background_instance.processed_frame_count < source.injected_frame_count:
+            time.sleep(0.01)
+        processed_time = time.perf_counter()
+        background_instance.stop()
+        background_thread.join()
+        elapsed = processed_time - source.start_time
+        return {
+            "replay": source.get_stats(),
+            "processed_frames": background_instance.processed_frame_count,
+            "processed_frames_per_s": background_instance.processed_frame_count / elapsed if elapsed else 0.0,
+            "latency": background_instance.get_latency_stats(),
+            "log": background_instance.get_log_stats(),
+        }
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Replay a recorded log through the pipeline")
+    argparser.add_argument("log", help="Binary raw log, text raw log or COBS stream to replay")
+    argparser.add_argument("--speed", type=float, default=1.0,
+                           help="Multiple of the recorded rate, 0 for as fast as possible (default: 1.0)")
+    argparser.add_argument("--repeat", type=int, default=1, help="Number of times the log is played (default: 1)")
+    argparser.add_argument("--format", choices=FORMATS, default=None, help="Format of the log (default: detected)")
+    argparser.add_argument("--batch-size", type=int, default=256, help="Maximum number of frames in one batch (default: 256)")
+    argparser.add_argument("--queue-size", type=int, default=64, help="Number of batches the queue holds (default: 64)")
+    argparser.add_argument("--parse-workers", type=int, default=0, help="Number of parse processes (default: 0)")
+    argparser.add_argument("--log-dir", default=None, help="Directory for the logs written during the replay (default: temporary)")
+    argparser.add_argument("--log-level", choices=LEVELS, default="WARNING",
+                           help="Level of the messages printed to stderr; DEBUG slows the replay down (default: WARNING)")
+    argparser.add_argument("-o", "--output", default=None, help="Also write the results to this JSON file")
+    args = argparser.parse_args()
+    setup_logging(args.log_level)
+    results = run(args.log, args.speed, args.repeat, args.batch_size, args.queue_size,
+                  args.parse_workers, args.log_dir, args.format)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
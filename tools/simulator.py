@@ -0,0 +1,251 @@
+"""
+# simulator.py
+Virtual serial device for load testing without hardware (Linux and macOS).
+
+Opens a pseudo terminal pair and writes COBS framed packets for every parser in
+background/parsers/ to it. The server connects to the printed device path like to a real port.
+
+    $ python3 tools/simulator.py --rate 5000 --duration 60 --connect http://127.0.0.1:7878
+    $ python3 tools/simulator.py --rate 0 --corrupt-rate 0.01 --missing-delimiter-rate 0.001
+
+--rate 0 writes as fast as the reader takes the bytes, which finds the saturation point of the server.
+Otherwise bytes the reader does not take in time are dropped, as an overrun UART would, and counted.
+With the same --seed the same frames are sent in the same order.
+"""
+import argparse
+import errno
+import json
+import os
+import random
+import sys
+import time
+import tty
+import urllib.request
+
+# Add the parent directory to sys.path to import background.parsermanager
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from background.parsermanager import ParserManager
+import lib.cobs as cobs
+
+UNKNOWN = "unknown"
+
+
+def make_frame(parser, rng: random.Random) -> bytes:
+    """
+    Returns a frame of random bytes with the length and id bytes of the parser.
+    """
+    frame = bytearray(rng.randbytes(parser.get_data_length()))
+    for index, id_value in parser.get_id_bytes():
+        frame[index:index + len(id_value)] = id_value
+    return bytes(frame)
+
+
+def break_cobs(encoded: bytes) -> bytes:
+    """
+    Returns an encoded frame (with its 0x00 delimiter) whose last COBS code points past the end of the frame,
+    so that the decoder drops it as a decode error. A frame with only the last byte changed would
+    usually still decode, as another frame of the same parser.
+    """
+    frame = bytearray(encoded[:-1])
+    position = 0
+    while position + frame[position] < len(frame):
+        position += frame[position]
+    if frame[position] < 0xff:
+        frame[position] += 1
+    else:
+        # The block is already as long as a code can say, so make the frame shorter instead
+        del frame[-1]
+    return bytes(frame) + b"\x00"
+
+
+class FrameGenerator:
+    """
+    Produces the encoded byte stream. Frames of each parser are drawn with the given weights
+    from variants pre-built per parser, so that high rates are not limited by building frames.
+
+    corrupt_rate:           probability of a frame with a broken COBS code (see break_cobs()), counted as corrupted_count
+                            instead of in counts
+    missing_delimiter_rate: probability that the 0x00 after a frame is left out, merging it with the next one
+    unknown_rate:           probability of a frame of unknown_size random bytes that no parser accepts
+    """
+    def __init__(self, parser_manager: ParserManager, weights: dict[str, float] = None, seed: int = 0,
+                 corrupt_rate: float = 0.0, missing_delimiter_rate: float = 0.0,
+                 unknown_rate: float = 0.0, unknown_size: int = 5, variants: int = 64):
+        self.rng = random.Random(seed)
+        self.corrupt_rate = corrupt_rate
+        self.missing_delimiter_rate = missing_delimiter_rate
+        self.unknown_rate = unknown_rate
+        self.unknown_size = unknown_size
+        parsers = {parser.get_name(): parser for parser in parser_manager.parsers}
+        weights = weights or {name: 1.0 for name in parsers}
+        unknown_names = set(weights) - set(parsers)
+        if unknown_names:
+            raise ValueError(f"Unknown parsers: {', '.join(sorted(unknown_names))}")
+        self.names = [name for name in weights if weights[name] > 0]
+        self.weights = [weights[name] for name in self.names]
+        self.frames = {name: [make_frame(parsers[name], self.rng) for _ in range(variants)] for name in self.names}
+        self.encoded = {name: [cobs.cobs_encode_bytes(frame) for frame in frames] for name, frames in self.frames.items()}
+        self.counts = {name: 0 for name in self.names + [UNKNOWN]}
+        self.corrupted_count = 0
+        self.missing_delimiter_count = 0
+
+    def generate(self, count: int) -> bytes:
+        """
+        Returns count frames, encoded and joined.
+        """
+        rng = self.rng
+        names = rng.choices(self.names, self.weights, k=count)
+        chunks = []
+        for name in names:
+            if self.unknown_rate and rng.random() < self.unknown_rate:
+                name = UNKNOWN
+                encoded = cobs.cobs_encode_bytes(rng.randbytes(self.unknown_size))
+            elif self.corrupt_rate and rng.random() < self.corrupt_rate:
+                encoded = break_cobs(rng.choice(self.encoded[name]))
+                name = None
+                self.corrupted_count += 1
+            else:
+                encoded = rng.choice(self.encoded[name])
+            if self.missing_delimiter_rate and rng.random() < self.missing_delimiter_rate:
+                encoded = encoded[:-1]
+                self.missing_delimiter_count += 1
+            if name is not None:
+                self.counts[name] += 1
+            chunks.append(encoded)
+        return b"".join(chunks)
+
+
+class PtySimulator:
+    """
+    Writes the stream of a FrameGenerator to the master side of a pseudo terminal.
+    rate is frames per second, or 0 for as fast as the reader takes them.
+    """
+    def __init__(self, generator: FrameGenerator, rate: float = 1000, chunk_size: int = 4096, tick: float = 0.01):
+        self.generator = generator
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.tick = tick
+        self.master, self.slave = os.openpty()
+        # No echo or line editing on the device side, as on a real serial port
+        tty.setraw(self.slave)
+        if rate > 0:
+            os.set_blocking(self.master, False)
+        self.device = os.ttyname(self.slave)
+        self.sent_frame_count = 0
+        self.sent_byte_count = 0
+        self.dropped_byte_count = 0
+
+    def _write(self, data: bytes):
+        for offset in range(0, len(data), self.chunk_size):
+            chunk = data[offset:offset + self.chunk_size]
+            try:
+                written = os.write(self.master, chunk)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                if e.errno != errno.EIO:
+                    raise
+                # Nobody has the device open
+                written = 0
+            self.sent_byte_count += written
+            self.dropped_byte_count += len(chunk) - written
+
+    def run(self, duration: float = None, on_interval=None, interval: float = 1.0):
+        """
+        Sends frames until duration seconds have passed (forever if None).
+        on_interval(stats) is called every interval seconds.
+        """
+        start = time.perf_counter()
+        next_report = start + interval
+        while True:
+            now = time.perf_counter()
+            if duration is not None and now - start >= duration:
+                break
+            if self.rate > 0:
+                due = int((now - start) * self.rate) - self.sent_frame_count
+                if due <= 0:
+                    time.sleep(self.tick)
+                    continue
+            else:
+                due = max(self.chunk_size // 16, 1)
+            self._write(self.generator.generate(due))
+            self.sent_frame_count += due
+            if on_interval is not None and now >= next_report:
+                on_interval(self.get_stats(now - start))
+                next_report += interval
+        return self.get_stats(time.perf_counter() - start)
+
+    def get_stats(self, elapsed: float) -> dict:
+        return {
+            "device": self.device,
+            "elapsed_s": elapsed,
+            "frames": self.sent_frame_count,
+            "frames_per_s": self.sent_frame_count / elapsed if elapsed else 0.0,
+            "bytes": self.sent_byte_count,
+            "dropped_bytes": self.dropped_byte_count,
+            "corrupted_frames": self.generator.corrupted_count,
+            "missing_delimiters": self.generator.missing_delimiter_count,
+            "frames_by_parser": dict(self.generator.counts),
+        }
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def parse_weights(value: str) -> dict[str, float]:
+    """
+    Parses "parser:weight,parser:weight" into {parser: weight}.
+    """
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition(":")
+        weights[name.strip()] = float(weight) if weight else 1.0
+    return weights
+
+
+def connect_server(url: str, device: str, baudrate: int):
+    request = urllib.request.Request(f"{url.rstrip('/')}/serial/connect", method="POST",
+                                     data=json.dumps({"portname": device, "baudrate": baudrate}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        print(response.read().decode(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Virtual serial device that sends frames of every parser")
+    argparser.add_argument("--rate", type=float, default=1000, help="Frames per second, 0 for as fast as possible (default: 1000)")
+    argparser.add_argument("--parsers", type=parse_weights, default=None,
+                           help="Comma separated parser names with optional weights, e.g. gps:1,pitot:10 (default: all, equally)")
+    argparser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: until interrupted)")
+    argparser.add_argument("--seed", type=int, default=0, help="Seed of the random frames (default: 0)")
+    argparser.add_argument("--chunk-size", type=int, default=4096, help="Maximum bytes per write (default: 4096)")
+    argparser.add_argument("--corrupt-rate", type=float, default=0.0,
+                           help="Probability of a frame with a broken COBS code, which the server drops as a decode error (default: 0)")
+    argparser.add_argument("--missing-delimiter-rate", type=float, default=0.0,
+                           help="Probability that the delimiter after a frame is left out (default: 0)")
+    argparser.add_argument("--unknown-rate", type=float, default=0.0,
+                           help="Probability of a frame that no parser accepts (default: 0)")
+    argparser.add_argument("--unknown-size", type=int, default=5, help="Length of the unknown frames (default: 5)")
+    argparser.add_argument("--connect", default=None, metavar="URL",
+                           help="Base URL of a running server to connect to the device, e.g. http://127.0.0.1:7878")
+    argparser.add_argument("--baudrate", type=int, default=115200, help="Baud rate sent with --connect (default: 115200)")
+    args = argparser.parse_args()
+
+    generator = FrameGenerator(ParserManager(), args.parsers, args.seed, args.corrupt_rate,
+                               args.missing_delimiter_rate, args.unknown_rate, args.unknown_size)
+    simulator = PtySimulator(generator, args.rate, args.chunk_size)
+    print(f"Device: {simulator.device}", file=sys.stderr)
+    if args.connect:
+        connect_server(args.connect, simulator.device, args.baudrate)
+    try:
+        stats = simulator.run(args.duration, on_interval=lambda stats: print(
+            f"{stats['frames']} frames, {stats['frames_per_s']:.0f} frames/s, {stats['dropped_bytes']} bytes dropped",
+            file=sys.stderr))
+    except KeyboardInterrupt:
+        stats = None
+    finally:
+        simulator.close()
+    if stats is not None:
+        print(json.dumps(stats, indent=2))